@@ -25,5 +25,7 @@
 collect_ignore = [
     'setup.py',
     'kodi_game_scripting/__main__.py',
-    'process_game_addons.py'
+    'process_game_addons.py',
+    'merge_summary.py',
+    'repack_objects.py',
 ]
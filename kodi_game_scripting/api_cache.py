@@ -0,0 +1,110 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Responses of the GitHub API, kept on disk """
+
+import collections
+import hashlib
+import os
+import re
+import threading
+import time
+
+from . import utils
+
+# Seconds a response is used without asking GitHub whether it changed
+DEFAULT_TTL = 300
+
+FRESH = 'fresh'
+NOT_MODIFIED = 'not modified'
+FETCHED = 'fetched'
+
+
+class ApiCache:
+    """ Responses to GET requests of the GitHub REST API, by URL
+
+        A response younger than the TTL is used as it is. An older one is
+        revalidated with its ETag: GitHub answers 304 Not Modified if it
+        didn't change, which doesn't count against the rate limit.
+
+        The requests go through the requester of a PyGithub client, so that
+        they share its connections and authentication. """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL):
+        self._directory = directory
+        self._ttl = ttl
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, key[:2], '{}.json'.format(key))
+
+    def get(self, requester, url):
+        """ GET url, returns the JSON data of the response and the URL of
+            its next page, or None if it's the last one """
+        path = self._path(url)
+        entry = utils.read_json(path)
+        if entry and time.time() - entry['time'] < self._ttl:
+            self._count(FRESH)
+            return entry['data'], entry['next']
+
+        headers = {'If-None-Match': entry['etag']} \
+            if entry and entry['etag'] else {}
+        response_headers, data = requester.requestJsonAndCheck(
+            'GET', url, headers=headers)
+        if entry and data is None:
+            self._count(NOT_MODIFIED)
+            entry['time'] = time.time()
+        else:
+            self._count(FETCHED)
+            entry = {'time': time.time(), 'data': data,
+                     'etag': response_headers.get('etag'),
+                     'next': _get_next(response_headers.get('link'))}
+        utils.write_json(path, entry)
+        return entry['data'], entry['next']
+
+    def get_all(self, requester, url):
+        """ The items of all pages of a list """
+        items = []
+        while url:
+            data, url = self.get(requester, url)
+            items.extend(data)
+        return items
+
+    def forget(self, url):
+        """ Drop the responses to the pages of the list at url, after it
+            was changed """
+        while url:
+            path = self._path(url)
+            entry = utils.read_json(path)
+            if entry is None:
+                return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            url = entry['next']
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+
+def _get_next(link):
+    """ URL of the next page from a Link header, None if there is none """
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link or '')
+    return match.group(1) if match else None
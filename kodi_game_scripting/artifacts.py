@@ -0,0 +1,80 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Built libraries, kept by the inputs of their build """
+
+import os
+import shutil
+import tempfile
+
+from . import utils
+
+LIBRARY = 'library'
+PROBE = 'probe.json'
+SOURCE = 'source.json'
+
+
+class ArtifactCache:
+    """ Libraries that were built before, what probing them found, and
+        what was read from the source they were built from
+
+        An entry is a directory named by a fingerprint of everything that
+        goes into a build -- see KodiGameAddons._get_artifact_key() -- so
+        the cache can live outside the working directory and be shared by
+        any number of them. Entries are never changed once written. """
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def _path(self, key):
+        return os.path.join(self._directory, key[:2], key)
+
+    def restore(self, key, library_path):
+        """ Copy the library of an entry to library_path
+
+        Returns the probe data and the source data stored with it, or None
+        if there's no entry. """
+        path = self._path(key)
+        probe_data = utils.read_json(os.path.join(path, PROBE))
+        source_data = utils.read_json(os.path.join(path, SOURCE))
+        if probe_data is None or source_data is None:
+            return None
+        utils.ensure_directory_exists(os.path.dirname(library_path))
+        shutil.copy2(os.path.join(path, LIBRARY), library_path)
+        return probe_data, source_data
+
+    def store(self, key, library_path, probe_data, source_data):
+        """ Add an entry for a library, unless there is one already
+
+        An entry of an older version, without source data, is replaced. """
+        path = self._path(key)
+        if os.path.isfile(os.path.join(path, SOURCE)):
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        utils.ensure_directory_exists(os.path.dirname(path))
+        # Write the entry next to where it goes, so that it appears whole
+        temp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        try:
+            shutil.copy2(library_path, os.path.join(temp_path, LIBRARY))
+            utils.write_json(os.path.join(temp_path, PROBE), probe_data)
+            utils.write_json(os.path.join(temp_path, SOURCE), source_data)
+            os.rename(temp_path, path)
+        except OSError:
+            # Another run added the entry meanwhile
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
@@ -0,0 +1,87 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" How long the builds of the addons took in the past """
+
+import heapq
+import os
+import threading
+
+from . import utils
+
+# Seconds a build is expected to take before any build was recorded
+DEFAULT_DURATION = 60.0
+
+
+class BuildHistory:
+    """ The build duration and memory of every addon, as of its past builds
+
+        The memory is the peak resident set size of the largest process of
+        a build -- roughly what each of its jobs needs.
+
+        Both are smoothed over the builds, half of the weight going to the
+        latest one, so that a single slow build on a busy machine doesn't
+        throw the prediction off. """
+
+    FILENAME = 'build-history.json'
+
+    def __init__(self, working_directory):
+        self._path = os.path.join(working_directory, self.FILENAME)
+        self._entries = utils.read_json(self._path, {})
+        self._lock = threading.Lock()
+
+    def _predict(self, addon_name, key, default):
+        """ Expected value of key for an addon
+
+        Addons that were never built take the average of those that were,
+        like in sharding.partition(). """
+        with self._lock:
+            if key in self._entries.get(addon_name, {}):
+                return self._entries[addon_name][key]
+            known = [entry[key] for entry in self._entries.values()
+                     if key in entry]
+            return sum(known) / len(known) if known else default
+
+    def predict(self, addon_name):
+        """ Seconds the build of an addon is expected to take """
+        return self._predict(addon_name, 'duration', DEFAULT_DURATION)
+
+    def predict_memory(self, addon_name):
+        """ Bytes each job of the build of an addon is expected to need,
+            0 if nothing is known """
+        return self._predict(addon_name, 'memory', 0)
+
+    def record(self, addon_name, duration, memory=None):
+        """ Add the duration and peak memory of a successful build """
+        with self._lock:
+            entry = self._entries.setdefault(addon_name, {})
+            for key, value in (('duration', duration), ('memory', memory)):
+                if value is not None:
+                    entry[key] = (entry.get(key, value) + value) / 2
+
+    def save(self):
+        """ Write the history """
+        with self._lock:
+            utils.write_json(self._path, self._entries)
+
+
+def makespan(durations, workers):
+    """ Wall time of running tasks of the given durations on a number of
+        workers, the longest first, each on the worker free first """
+    loads = [0.0] * max(1, workers)
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(loads, loads[0] + duration)
+    return max(loads)
@@ -0,0 +1,93 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Compile the cores through a compiler cache """
+
+import json
+import os
+import subprocess
+
+CCACHE = 'ccache'
+SCCACHE = 'sccache'
+
+# Environment variables of each tool: (cache directory, maximum size)
+_SETTINGS = {
+    CCACHE: ('CCACHE_DIR', 'CCACHE_MAXSIZE'),
+    SCCACHE: ('SCCACHE_DIR', 'SCCACHE_CACHE_SIZE'),
+}
+
+
+class CompilerCache:
+    """ ccache or sccache, run by the builds of the cores
+
+        The builds pick it up from CMAKE_<LANG>_COMPILER_LAUNCHER in their
+        environment, which the CMakeLists.txt of every addon hands on to the
+        core's make as CC and CXX. """
+
+    def __init__(self, tool, directory=None, size=None):
+        self.tool = tool
+        self._directory = directory
+        self._size = size
+
+    def environment(self):
+        """ Variables to add to the environment of a build """
+        directory_variable, size_variable = _SETTINGS[self.tool]
+        environment = {
+            'CMAKE_C_COMPILER_LAUNCHER': self.tool,
+            'CMAKE_CXX_COMPILER_LAUNCHER': self.tool,
+        }
+        if self._directory:
+            environment[directory_variable] = os.path.abspath(self._directory)
+        if self._size:
+            environment[size_variable] = self._size
+        return environment
+
+    def _run(self, *args):
+        """ Run the tool, returns its output or None if it failed """
+        try:
+            return subprocess.run(
+                [self.tool] + list(args), check=True, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                env=dict(os.environ, **self.environment())).stdout.decode(
+                    'utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError) as err:
+            print("Failed to run {}: {}".format(self.tool, err))
+            return None
+
+    def zero_stats(self):
+        """ Reset the statistics, so that they cover this run only """
+        self._run('--zero-stats')
+
+    def get_stats(self):
+        """ Hits and misses since zero_stats(), as a dict with 'tool',
+            'hits' and 'misses', or None if they can't be read """
+        if self.tool == CCACHE:
+            output = self._run('--print-stats')
+            if output is None:
+                return None
+            stats = dict(line.split('\t', 1) for line in output.splitlines()
+                         if '\t' in line)
+            hits = sum(int(stats.get(key, 0)) for key in (
+                'direct_cache_hit', 'preprocessed_cache_hit'))
+            misses = int(stats.get('cache_miss', 0))
+        else:
+            output = self._run('--show-stats', '--stats-format=json')
+            if output is None:
+                return None
+            stats = json.loads(output)['stats']
+            hits = sum(stats['cache_hits']['counts'].values())
+            misses = sum(stats['cache_misses']['counts'].values())
+        return {'tool': self.tool, 'hits': hits, 'misses': misses}
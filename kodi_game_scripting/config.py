@@ -25,6 +25,8 @@ GITHUB_ORGANIZATION = 'kodi-game'
 GITHUB_ADDON_PREFIX = 'game.libretro.'
 
 # core: {(Libretro repo, Makefile, Directory)}
+# 'build_jobs' in the options caps the compiler jobs of a core's build, for
+# cores that need a lot of memory per job
 ADDONS = {
     '2048':                      ('libretro-2048',              'Makefile.libretro', '.',                 'jni', {}),
     '3dengine':                  ('libretro-3dengine',          'Makefile',          '.',                 'jni', {}),
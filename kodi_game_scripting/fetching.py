@@ -0,0 +1,71 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Fetch a number of repositories at once """
+
+import threading
+import time
+
+from .scheduler import TaskGraph
+
+# Repositories fetched at once by default. Fetching mostly waits for the
+# network, so this is independent of the number of CPUs.
+DEFAULT_JOBS = 8
+
+
+def fetch_all(fetches, jobs=DEFAULT_JOBS):
+    """ Run a number of fetches, up to jobs of them at once
+
+    fetches: {name: function doing the fetch}
+
+    A fetch that fails doesn't stop the others. The time each fetch took
+    is printed once all are done, the slowest first, along with the
+    failures. Returns {name: exception} of the fetches that failed. """
+    durations = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def timed(name, func):
+        def run():
+            start = time.monotonic()
+            try:
+                func()
+            except Exception as err:
+                with lock:
+                    errors[name] = err
+                raise
+            finally:
+                with lock:
+                    durations[name] = time.monotonic() - start
+        return run
+
+    graph = TaskGraph()
+    for name, func in fetches.items():
+        graph.add(name, timed(name, func))
+    start = time.monotonic()
+    graph.run(jobs)
+    wall_time = time.monotonic() - start
+
+    for name, duration in sorted(durations.items(),
+                                 key=lambda item: (-item[1], item[0])):
+        print("  {:<40} {:6.1f}s{}".format(
+            name, duration, ' failed' if name in errors else ''))
+    print("Fetched {} repositories in {:.1f}s ({:.1f}s of wall time), "
+          "{} failed{}".format(
+              len(durations), sum(durations.values()), wall_time,
+              len(errors),
+              ': {}'.format(', '.join(sorted(errors))) if errors else ''))
+    return errors
@@ -0,0 +1,91 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Fingerprints of everything an addon's generated files depend on """
+
+import hashlib
+import json
+import os
+
+from . import utils
+
+
+def get_fingerprint(*parts):
+    """ Hash a number of JSON serializable values """
+    return hashlib.sha1(json.dumps(
+        parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def hash_files(paths):
+    """ Hash the contents of a number of files
+
+    Files are told apart by their position, so a missing file hashes
+    differently from an empty one. """
+    digest = hashlib.sha1()
+    for path in paths:
+        if not os.path.isfile(path):
+            digest.update(b'-')
+            continue
+        digest.update(b'+')
+        with open(path, 'rb') as file_ctx:
+            chunk = file_ctx.read(1 << 20)
+            while chunk:
+                digest.update(chunk)
+                chunk = file_ctx.read(1 << 20)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def hash_directory(path, exclude=('.git', '__pycache__')):
+    """ Hash the names and contents of all files below path
+
+    Directories named in exclude are left out, wherever they are. """
+    files = sorted(
+        filename for filename in (
+            utils.list_all_files(path) if os.path.isdir(path) else [])
+        if not set(filename.split(os.sep)[:-1]) & set(exclude))
+    return get_fingerprint(files, hash_files(
+        [os.path.join(path, filename) for filename in files]))
+
+
+class FingerprintCache:
+    """ Fingerprints of the addons processed by the last successful run
+
+        An addon whose fingerprint is the same as last time would produce the
+        same files again, so there's no need to process it. Along with the
+        fingerprint, the addon's metadata is kept for the summary. """
+
+    DIRECTORY = 'fingerprints'
+
+    def __init__(self, working_directory):
+        self._directory = os.path.join(working_directory, self.DIRECTORY)
+
+    def _path(self, addon_name):
+        return os.path.join(self._directory, '{}.json'.format(addon_name))
+
+    def get(self, addon_name, fingerprint):
+        """ The metadata stored with a matching fingerprint, or None """
+        entry = utils.read_json(self._path(addon_name))
+        if entry and entry['fingerprint'] == fingerprint:
+            return entry['info']
+        return None
+
+    def save(self, addon_name, fingerprint, info):
+        """ Store the fingerprint of a successfully processed addon """
+        utils.write_json(self._path(addon_name), {
+            'fingerprint': fingerprint,
+            'info': utils.to_json_data(info),
+        })
@@ -18,31 +18,188 @@
 
 import collections
 import functools
+import json
 import os
 import re
-import time
+import threading
 
 import git
 import github
 
 from . import credentials
+from . import tracing
 from . import utils
+from .retry import RetryPolicy
 
 
 EMPTY_SHA = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
 
 GitHubRepo = collections.namedtuple('GitHubRepo', 'name clone_url ssh_url')
 
+# Remote ref that GitRepo.stage_push() uploads to ahead of a push
+STAGING_REF = 'refs/kodi-game-scripting/staging'
 
-class GitHubOrg:
-    """ Access GitHub Organization API """
-    def __init__(self, org, auth=False):
+# The APIs the repositories of an organization and the latest tags can be
+# read through
+REST = 'rest'
+GRAPHQL = 'graphql'
+
+
+# A tag that is a version: an optional 'v', the numbers, and the stage of
+# a pre-release with its number
+_VERSION_TAG = re.compile(
+    r'^v?(\d+(?:\.\d+)*)(?:[-._]?(alpha|a|beta|b|pre|rc)\.?(\d*))?$',
+    re.IGNORECASE)
+# How pre-releases rank against each other, releases come after all of them
+_PRE_RELEASES = {'alpha': 0, 'a': 0, 'beta': 1, 'b': 1, 'pre': 2, 'rc': 3}
+
+
+def pick_latest_tag(tags):
+    """ The latest of the given tag names, None if there are none
+
+    That's the one with the highest version, whichever API the tags were
+    read through: neither the order of the REST API nor the dates GraphQL
+    can order by are the same for both. A version is compared number by
+    number (v1.10 is later than v1.9, 1.2.0 later than v1.0), and a
+    pre-release comes before its release (v1.0-rc1 before v1.0). Tags that
+    aren't versions come before all versions, and are compared with their
+    numbers as numbers among each other. """
+    def version(tag):
+        match = _VERSION_TAG.match(tag)
+        if not match:
+            return (0, [int(part) if index % 2 else part for index, part
+                        in enumerate(re.split(r'(\d+)', tag))], tag)
+        numbers = [int(number) for number in match.group(1).split('.')]
+        while len(numbers) > 1 and not numbers[-1]:
+            numbers.pop()
+        stage = (len(_PRE_RELEASES), 0)
+        if match.group(2):
+            stage = (_PRE_RELEASES[match.group(2).lower()],
+                     int(match.group(3) or 0))
+        return (1, numbers, stage, tag)
+    return max(tags, key=version, default=None)
+
+
+class GitHubSession:
+    """ The client of the GitHub API that everything in a process shares
+
+        Authenticating and checking the rate limit happen once, and the
+        connections are pooled, so that talking to GitHub costs what the
+        queries cost. Objects are loaded lazily: an organization or a
+        repository is only fetched once something of it is read.
+
+        The requests sent to GitHub are counted, see report(). The queries
+        made through GitHubOrg are retried by the shared RetryPolicy when
+        they fail transiently. That replaces the retries of PyGithub, so
+        that there is one policy for all of them.
+
+        With a cache (see set_cache()), the lists GitHubOrg reads come from
+        the cache instead. With the GraphQL API (see set_api()), they are
+        read through GitHubGraphQL, and the latest tags of all repositories
+        announced by expect_tags() are read together. """
+
+    POOL_SIZE = 16
+    PER_PAGE = 100
+
+    _current = None
+    _cache = None
+    _api = REST
+    _expected_tags = frozenset()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, auth=False):
+        """ The session of this process, created on first use
+
+        A session without authentication is replaced by one with it once
+        that is asked for. """
+        with cls._lock:
+            if cls._current is None or (auth and not cls._current.auth):
+                cls._current = cls(auth)
+            return cls._current
+
+    @classmethod
+    def current(cls):
+        """ The session of this process, None if there is none yet """
+        return cls._current
+
+    @classmethod
+    def reset(cls):
+        """ Forget the session and the cache, the next get() creates a new
+            session """
+        with cls._lock:
+            cls._current = None
+            cls._cache = None
+            cls._api = REST
+            cls._expected_tags = frozenset()
+
+    @classmethod
+    def set_cache(cls, cache):
+        """ Keep the responses of the sessions in an ApiCache """
+        with cls._lock:
+            cls._cache = cache
+
+    @classmethod
+    def set_api(cls, api):
+        """ Read the repositories and tags through REST or GRAPHQL """
+        with cls._lock:
+            cls._api = api
+
+    @classmethod
+    def expect_tags(cls, repos):
+        """ Announce the (org, name) of the repositories whose latest tags
+            will be asked for, so that they can be read together """
+        with cls._lock:
+            cls._expected_tags = frozenset(repos)
+
+    @property
+    def api(self):
+        """ The API the repositories and tags are read through """
+        return self._api
+
+    @property
+    def cache(self):
+        """ The ApiCache of the sessions, None if there is none """
+        return self._cache
+
+    def get_json_list(self, url):
+        """ The items of all pages of the list at url, through the cache
+        """
+        return self._cache.get_all(self._github.requester, url)
+
+    def forget_json_list(self, url):
+        """ Drop the cached pages of the list at url, if there is a cache
+        """
+        if self._cache:
+            self._cache.forget(url)
+
+    def get_org_repos(self, org):
+        """ All repositories of an organization, through GraphQL """
+        return self._graphql.get_repos(org)
+
+    def get_latest_tag(self, org, repo):
+        """ The latest tag of a repository, through GraphQL
+
+        The first call reads the tags of all expected repositories that
+        weren't read yet, and calls from other threads wait for it. """
+        with self._tags_lock:
+            if (org, repo) not in self._tags:
+                self._tags.update(self._graphql.get_latest_tags(sorted(
+                    {(org, repo)} | (self._expected_tags - set(self._tags)))))
+            tag = self._tags[(org, repo)]
+        if tag is None:
+            raise ValueError("No tag found in {}/{}".format(org, repo))
+        return tag
+
+    def __init__(self, auth=False):
         """ Initialize GitHub API instance """
+        options = {'pool_size': self.POOL_SIZE, 'per_page': self.PER_PAGE,
+                   'lazy': True, 'retry': None}
         try:
             apitoken = os.environ.get('GITHUB_ACCESS_TOKEN', None)
             if apitoken:
                 print("Authenticating with GitHub API token")
-                self._github = github.Github(apitoken)
+                self._github = github.Github(apitoken, **options)
             else:
                 if auth:
                     print("Authenticating with username/password")
@@ -52,40 +209,277 @@ class GitHubOrg:
                     print("Connecting to GitHub without authentication "
                           "(no username/password set)")
                     username, password = None, None
-                self._github = github.Github(username, password)
+                self._github = github.Github(username, password, **options)
             # PyGithub 2.x returns a RateLimitOverview, which keeps the
             # per-resource limits under .resources; before that get_rate_limit()
             # returned the RateLimit itself, carrying .core directly.
-            rate_limit = self._github.get_rate_limit()
+            rate_limit = RetryPolicy.shared().call(
+                "Reading the GitHub API rate limit",
+                self._github.get_rate_limit)
             rate = getattr(rate_limit, 'resources', rate_limit).core
             print("GitHub API Rate: limit: {}, remaining: {}, reset: {}"
                   .format(rate.limit, rate.remaining, rate.reset.isoformat()))
             if auth and not apitoken:
                 cred.save(username, password)
-            self._org = self._github.get_organization(org)
         except github.BadCredentialsException as err:
             if auth and not apitoken:
                 cred.clean()
             raise ValueError("Authentication to GitHub failed") from err
+        self.auth = auth or bool(apitoken)
+        self.requests = collections.Counter()
+        self._remaining = rate.remaining
+        self._organizations = {}
+        self._organizations_lock = threading.Lock()
+        self._requests_lock = threading.Lock()
+        self._count_requests(self._github.requester)
+        self._graphql = GitHubGraphQL(self._github.requester)
+        self._tags = {}
+        self._tags_lock = threading.Lock()
+
+    def get_organization(self, org):
+        """ The (lazily loaded) organization of the given name """
+        with self._organizations_lock:
+            if org not in self._organizations:
+                self._organizations[org] = self._github.get_organization(org)
+            return self._organizations[org]
+
+    def _count_requests(self, requester):
+        """ Count every request requester sends from now on, by its verb,
+            or as 'graphql'
+
+        All requests of PyGithub, and those of the ApiCache and of
+        GitHubGraphQL, go through requestJsonAndCheck(). An answer the
+        cache had fresh sends none, a revalidated one sends one. """
+        request = requester.requestJsonAndCheck
+
+        def counted(verb, url, *args, **kwargs):
+            self._count('graphql' if url == requester.graphql_url else verb)
+            return request(verb, url, *args, **kwargs)
+        requester.requestJsonAndCheck = counted
+
+    def _count(self, kind):
+        """ Count a request """
+        with self._requests_lock:
+            self.requests[kind] += 1
+
+    def report(self):
+        """ Print the requests sent and the rate limit they used up
+
+        The rate limit is that of the last response, so this costs no
+        request of its own. """
+        remaining, limit = self._github.rate_limiting
+        print("GitHub API: {} requests ({}), {} of the rate limit used, {} "
+              "of {} remaining".format(
+                  sum(self.requests.values()),
+                  ', '.join('{} {}'.format(count, kind) for kind, count
+                            in sorted(self.requests.items())) or 'none',
+                  max(0, self._remaining - remaining), remaining, limit))
+        if self._cache:
+            print("GitHub API cache: {}".format(', '.join(
+                '{} {}'.format(count, outcome) for outcome, count
+                in sorted(self._cache.counts.items())) or 'unused'))
+
+
+class GitHubGraphQL:
+    """ Reads through the GitHub GraphQL API, in few round trips
+
+        A page of the repositories of an organization holds 100 of them,
+        like with REST, but the tags of many repositories are read in one
+        query, each repository under an alias of its own, and the latest
+        of them is picked by pick_latest_tag(), like with REST. """
+
+    PAGE_SIZE = 100
+    BATCH_SIZE = 50
+
+    REPOS_QUERY = '''
+        query($org: String!, $first: Int!, $after: String) {
+          organization(login: $org) {
+            repositories(first: $first, after: $after) {
+              nodes { name url sshUrl }
+              pageInfo { hasNextPage endCursor }
+            }
+          }
+        }'''
+
+    TAG_QUERY = '''
+          {}: repository(owner: {}, name: {}) {{
+            refs(refPrefix: "refs/tags/", first: {}) {{
+              nodes {{ name }}
+              pageInfo {{ hasNextPage endCursor }}
+            }}
+          }}'''
+
+    MORE_TAGS_QUERY = '''
+        query($owner: String!, $name: String!, $first: Int!,
+              $after: String) {
+          repository(owner: $owner, name: $name) {
+            refs(refPrefix: "refs/tags/", first: $first, after: $after) {
+              nodes { name }
+              pageInfo { hasNextPage endCursor }
+            }
+          }
+        }'''
+
+    def __init__(self, requester):
+        self._requester = requester
+
+    def _query(self, query, variables=None):
+        """ POST a query, returns its data
+
+        Unlike errors about the query, errors about some of the objects
+        it asks for (such as a missing repository) leave their part of the
+        data empty. """
+        _, data = self._requester.requestJsonAndCheck(
+            'POST', self._requester.graphql_url,
+            input={'query': query, 'variables': variables or {}})
+        if data.get('data') is None:
+            raise ValueError("GitHub GraphQL query failed: {}".format(
+                '; '.join(error.get('message', '')
+                          for error in data.get('errors', []))))
+        return data['data']
+
+    def get_repos(self, org):
+        """ All repositories of an organization """
+        repos = []
+        after = None
+        while True:
+            page = self._query(self.REPOS_QUERY, {
+                'org': org, 'first': self.PAGE_SIZE, 'after': after})
+            if page['organization'] is None:
+                raise ValueError("No GitHub organization {}".format(org))
+            page = page['organization']['repositories']
+            repos.extend(GitHubRepo(repo['name'], repo['url'] + '.git',
+                                    repo['sshUrl'])
+                         for repo in page['nodes'])
+            if not page['pageInfo']['hasNextPage']:
+                return repos
+            after = page['pageInfo']['endCursor']
+
+    def get_latest_tags(self, repos):
+        """ The latest tags of a number of repositories
+
+        repos: [(org, name)]
+
+        Returns {(org, name): name of the tag}, which is None for a
+        repository that has no tags or doesn't exist. The first page of the
+        tags of each repository is read in the batch, the (rare) further
+        pages one by one. """
+        tags = {}
+        for start in range(0, len(repos), self.BATCH_SIZE):
+            batch = repos[start:start + self.BATCH_SIZE]
+            data = self._query('query {{{}\n}}'.format(''.join(
+                self.TAG_QUERY.format('r{}'.format(index), json.dumps(org),
+                                      json.dumps(name), self.PAGE_SIZE)
+                for index, (org, name) in enumerate(batch))))
+            for index, repo in enumerate(batch):
+                result = data.get('r{}'.format(index))
+                names = self._get_tag_names(repo, result['refs']) \
+                    if result else []
+                tags[repo] = pick_latest_tag(names)
+        return tags
+
+    def _get_tag_names(self, repo, refs):
+        """ The names of all tags of a repository, starting from the first
+            page of its refs """
+        names = [node['name'] for node in refs['nodes']]
+        while refs['pageInfo']['hasNextPage']:
+            refs = self._query(self.MORE_TAGS_QUERY, {
+                'owner': repo[0], 'name': repo[1], 'first': self.PAGE_SIZE,
+                'after': refs['pageInfo']['endCursor']})['repository']['refs']
+            names.extend(node['name'] for node in refs['nodes'])
+        return names
+
+
+def _query(func):
+    """ Retry a GitHubOrg method when it fails transiently """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return RetryPolicy.shared().call(
+            "GitHub query {}({})".format(
+                func.__name__, ', '.join(str(arg) for arg in args)),
+            func, self, *args, **kwargs)
+    return wrapper
+
+
+class GitHubOrg:
+    """ Access GitHub Organization API """
+    def __init__(self, org, auth=False):
+        """ Access an organization through the session of this process """
+        self._name = org
+        self._session = GitHubSession.get(auth)
+
+    @property
+    def _repos_url(self):
+        """ URL of the list of the repositories, as the cache keeps it """
+        return '/orgs/{}/repos?per_page={}'.format(
+            self._name, GitHubSession.PER_PAGE)
+
+    @property
+    def _org(self):
+        """ The organization, only loaded once the REST API needs it """
+        return self._session.get_organization(self._name)
 
     @functools.lru_cache()
+    @tracing.traced(tracing.GITHUB)
+    @_query
     def get_repos(self, regex):
         """ Query all GitHub repos of the given organization that matches
             the given regex. Since API calls are limited, cache results. """
+        if self._session.api == GRAPHQL:
+            repos = self._session.get_org_repos(self._name)
+        elif self._session.cache:
+            repos = [GitHubRepo(repo['name'], repo['clone_url'],
+                                repo['ssh_url'])
+                     for repo in self._session.get_json_list(self._repos_url)]
+        else:
+            repos = self._org.get_repos()
         repos = {
             repo.name: GitHubRepo(repo.name, repo.clone_url, repo.ssh_url)
-            for repo in self._org.get_repos() if re.search(regex, repo.name)
+            for repo in repos if re.search(regex, repo.name)
         }
         return repos
 
+    @tracing.traced(tracing.GITHUB)
+    @_query
     def get_repo(self, repo):
         """ Get the specified GitHub repo """
         return self._org.get_repo(repo)
 
+    @tracing.traced(tracing.GITHUB)
+    @_query
+    def get_latest_tag(self, repo):
+        """ Name of the latest tag of the specified GitHub repo, see
+            pick_latest_tag() """
+        if self._session.api == GRAPHQL:
+            return self._session.get_latest_tag(self._name, repo)
+        if self._session.cache:
+            tags = [tag['name'] for tag in self._session.get_json_list(
+                '/repos/{}/{}/tags?per_page={}'.format(
+                    self._name, repo, GitHubSession.PER_PAGE))]
+        else:
+            tags = [tag.name for tag in self._org.get_repo(repo).get_tags()]
+        tag = pick_latest_tag(tags)
+        if tag is None:
+            raise ValueError("No tag found in {}/{}".format(self._name, repo))
+        return tag
+
+    @tracing.traced(tracing.GITHUB)
+    @_query
     def create_repo(self, name):
-        """ Create a new repo on GitHub """
-        repo = self._org.create_repo(name, auto_init=True)
-        self.get_repos.cache_clear()  # pylint: disable=no-member
+        """ Create a new repo on GitHub
+
+        The repositories listed before, by get_repos() and in the cache,
+        are forgotten. A repository that exists already, but wasn't
+        listed, is taken as it is. """
+        try:
+            repo = self._org.create_repo(name, auto_init=True)
+        except github.GithubException as err:
+            if err.status != 422 or 'already exists' not in str(err.data):
+                raise
+            repo = self._org.get_repo(name)
+        finally:
+            self.get_repos.cache_clear()  # pylint: disable=no-member
+            self._session.forget_json_list(self._repos_url)
         return GitHubRepo(repo.name, repo.clone_url, repo.ssh_url)
 
 
@@ -102,7 +496,42 @@ class GitRepo:
                 git.NoSuchPathError):
             return False
 
-    def __init__(self, repo, path):
+    @staticmethod
+    @tracing.traced(tracing.GIT)
+    def list_remote(url):
+        """ Get the refs of a remote repository as {ref: hexsha}
+
+        Returns None if the remote can't be reached. """
+        try:
+            output = RetryPolicy.shared().call(
+                "Listing remote {}".format(url), git.cmd.Git().ls_remote, url)
+        except git.exc.GitCommandError as err:
+            print("Failed to list remote {}: {}".format(url, err))
+            return None
+        refs = {}
+        for line in output.splitlines():
+            hexsha, ref = line.split('\t', 1)
+            refs[ref] = hexsha
+        return refs
+
+    @staticmethod
+    @tracing.traced(tracing.GIT)
+    def mirror(url, path):
+        """ Create or update a bare mirror of a remote repository """
+        if GitRepo.is_git_repo(path):
+            print("Updating mirror of {}".format(url))
+            RetryPolicy.shared().call(
+                "Updating mirror of {}".format(url),
+                git.Repo(path).git.fetch, 'origin', '--prune')
+        else:
+            print("Creating mirror of {}".format(url))
+            RetryPolicy.shared().call(
+                "Creating mirror of {}".format(url),
+                git.Repo.clone_from, url, path, mirror=True)
+
+    def __init__(self, repo, path, alternates=None):
+        """ alternates: objects directory of a repository to borrow
+            objects from, see borrow_objects() """
         self.path = os.path.join(path, repo.name)
         self._githubrepo = repo
         self._gitrepo = None
@@ -114,6 +543,8 @@ class GitRepo:
         else:
             print("Existing repo {}".format(self._githubrepo.name))
             self._gitrepo = git.Repo(self.path)
+        if alternates:
+            self.borrow_objects(alternates)
         if self._githubrepo.clone_url:
             try:
                 origin = self._gitrepo.remotes.origin
@@ -134,22 +565,69 @@ class GitRepo:
                 push_url = self._githubrepo.ssh_url
             origin.set_url(push_url, push=True)
 
-    def fetch_and_reset(self, reset=True):
-        """ Fetch repo and reset it """
+    @staticmethod
+    def get_alternates(path):
+        """ The objects directories a repository borrows objects from """
+        try:
+            git_dir = git.Repo(path).git_dir
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+            return []
+        try:
+            with open(os.path.join(git_dir, 'objects', 'info', 'alternates'),
+                      'r', encoding='utf-8') as alternates_ctx:
+                return [line.strip() for line in alternates_ctx
+                        if line.strip() and not line.startswith('#')]
+        except FileNotFoundError:
+            return []
+
+    def borrow_objects(self, objects_directory):
+        """ Look up objects in the objects directory of another repository
+            as well (git alternates)
+
+        Objects found there aren't fetched or stored again. That repository
+        must keep them for as long as this one needs them. """
+        objects_directory = os.path.abspath(objects_directory)
+        if objects_directory in GitRepo.get_alternates(self.path):
+            return
+        info_directory = os.path.join(self._gitrepo.git_dir, 'objects', 'info')
+        utils.ensure_directory_exists(info_directory)
+        with open(os.path.join(info_directory, 'alternates'), 'a',
+                  encoding='utf-8') as alternates_ctx:
+            alternates_ctx.write('{}\n'.format(objects_directory))
+
+    @tracing.traced(tracing.GIT)
+    def fetch(self):
+        """ Fetch the default branch and the tags of origin, if there is one
+
+        That's all the network traffic of fetch_and_reset(), so that it can
+        be done ahead of it. """
+        if git.Remote('', 'origin') not in self._gitrepo.remotes:
+            return
+        origin = self._gitrepo.remotes.origin
+        print("Fetching {}".format(self._githubrepo.name))
+        description = "Fetching {}".format(self._githubrepo.name)
+        retried = RetryPolicy.shared().call
+        try:
+            retried(description, origin.fetch, 'master')
+        except git.exc.GitCommandError:
+            retried(description, origin.fetch, 'main')
+        if self._gitrepo.git.version_info >= (2, 17, 0):
+            retried(description, origin.fetch, tags=True, prune=True,
+                    prune_tags=True)
+        else:
+            tags = self._gitrepo.git.tag(list=True)
+            if tags:
+                self._gitrepo.git.tag('--delete', tags.splitlines())
+            retried(description, origin.fetch, tags=True, prune=True)
+
+    @tracing.traced(tracing.GIT)
+    def fetch_and_reset(self, reset=True, fetch=True):
+        """ Fetch repo and reset it
+
+        fetch: False if fetch() was called already """
         if git.Remote('', 'origin') in self._gitrepo.remotes:
-            origin = self._gitrepo.remotes.origin
-            print("Fetching {}".format(self._githubrepo.name))
-            try:
-                origin.fetch('master')
-            except git.exc.GitCommandError:
-                origin.fetch('main')
-            if self._gitrepo.git.version_info >= (2, 17, 0):
-                origin.fetch(tags=True, prune=True, prune_tags=True)
-            else:
-                tags = self._gitrepo.git.tag(list=True)
-                if tags:
-                    self._gitrepo.git.tag('--delete', tags.splitlines())
-                origin.fetch(tags=True, prune=True)
+            if fetch:
+                self.fetch()
             if reset:
                 print("Resetting {}".format(self._githubrepo.name))
                 try:
@@ -175,6 +653,7 @@ class GitRepo:
             return self._gitrepo.head.object.hexsha
         return ''
 
+    @tracing.traced(tracing.GIT)
     def commit(self, message, directory=None, force=False, squash=False):
         """ Create commit in repo """
         if directory:
@@ -192,11 +671,13 @@ class GitRepo:
         if self._gitrepo.is_dirty():
             self._gitrepo.index.commit(message)
 
+    @tracing.traced(tracing.GIT)
     def tag(self, tag, message=None):
         """ Create tag in repo """
         if self._gitrepo.head.is_valid():
             self._gitrepo.create_tag(tag, message, force=True)
 
+    @tracing.traced(tracing.GIT)
     def diff(self):
         """ Diff commits in repo """
         if self._gitrepo.head.is_valid():
@@ -210,20 +691,55 @@ class GitRepo:
             return self._gitrepo.git.diff(EMPTY_SHA, self._gitrepo.head.commit)
         return ''
 
+    @tracing.traced(tracing.GIT)
     def describe(self):
         """ Describe current version """
-        if self._gitrepo.head.is_valid():
-            return self._gitrepo.git.describe('--tags', '--always')
+        return GitRepo._describe(self._gitrepo)
+
+    @staticmethod
+    def describe_path(path):
+        """ Describe the current version of the repository at path, without
+            creating it or changing anything in it, '' if there is none """
+        if not GitRepo.is_git_repo(path):
+            return ''
+        return GitRepo._describe(git.Repo(path))
+
+    @staticmethod
+    def _describe(gitrepo):
+        """ Describe the current version of gitrepo """
+        if gitrepo.head.is_valid():
+            return gitrepo.git.describe('--tags', '--always')
         return ''
 
-    def push(self, branch, tags=False, sleep=0):
-        """ Push commit to remote """
+    @tracing.traced(tracing.GIT)
+    def stage_push(self):
+        """ Upload the commits push() would push, without updating a branch
+
+        HEAD is pushed to STAGING_REF, so that the objects are on the remote
+        and push(staged=True) only has to update the refs. """
+        if self._gitrepo.is_dirty():
+            raise ValueError("Skipping, repository is dirty")
+        RetryPolicy.shared().call(
+            "Uploading {}".format(self._githubrepo.name),
+            self._gitrepo.remotes.origin.push,
+            '+HEAD:{}'.format(STAGING_REF), paced=True)
+
+    @tracing.traced(tracing.GIT)
+    def push(self, branch, tags=False, staged=False):
+        """ Push commit to remote
+
+        staged: stage_push() was called before, its ref is removed
+
+        Pushes are paced and retried by the shared RetryPolicy. """
         if self._gitrepo.is_dirty():
             raise ValueError("Skipping, repository is dirty")
-        self._gitrepo.remotes.origin.push(
-            'HEAD:{}'.format(branch),
-            force=branch != 'master')
-        time.sleep(sleep)
+        description = "Pushing {}".format(self._githubrepo.name)
+        retried = RetryPolicy.shared().call
+        refspec = 'HEAD:{}'.format(branch)
+        if staged:
+            refspec = [refspec, ':{}'.format(STAGING_REF)]
+        retried(description, self._gitrepo.remotes.origin.push, refspec,
+                force=branch != 'master', paced=True)
         if tags:
-            self._gitrepo.git.push('--tags')
-            time.sleep(sleep)
+            retried(description, self._gitrepo.git.push, '--tags',
+                    paced=True)
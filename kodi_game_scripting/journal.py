@@ -0,0 +1,90 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Checkpoint journal for resuming runs """
+
+import os
+import shutil
+import threading
+
+from . import utils
+
+
+class Journal:
+    """ Records the stages each addon completed in a run
+
+        Every completed stage is written down together with what it left
+        behind: the addon's metadata at that point (probe results, hexsha,
+        version, diff) and the state of its files. A run that died can then
+        be resumed, skipping every stage whose results are still there.
+
+        Each addon has a file of its own in the journal directory, so that
+        workers never wait for each other to write. """
+
+    DIRECTORY = 'journal'
+    RUN_FILE = 'run.json'
+
+    def __init__(self, working_directory, config):
+        """ config describes the run; a journal written by a run with a
+            different config is never resumed """
+        self._directory = os.path.join(working_directory, self.DIRECTORY)
+        self._config = config
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def start(self, resume=False):
+        """ Continue the previous run's journal or start a new one
+
+        Returns whether there is a journal to resume from. """
+        run_path = os.path.join(self._directory, self.RUN_FILE)
+        if resume and utils.read_json(run_path) == self._config:
+            for filename in os.listdir(self._directory):
+                if filename != self.RUN_FILE and filename.endswith('.json'):
+                    self._entries[filename[:-len('.json')]] = \
+                        utils.read_json(os.path.join(
+                            self._directory, filename), [])
+            return True
+
+        if resume:
+            print("No journal of a matching run to resume from")
+        shutil.rmtree(self._directory, ignore_errors=True)
+        utils.write_json(run_path, self._config)
+        return False
+
+    def completed(self, addon_name):
+        """ The stages completed for an addon, in order
+
+        Returns a list of dicts with 'stage', 'info' and 'state'. """
+        with self._lock:
+            return list(self._entries.get(addon_name, []))
+
+    def record(self, addon_name, stage, info, state):
+        """ Record a completed stage
+
+        Stages recorded after an earlier occurrence of the same stage are
+        dropped, as they are based on what the stage did before. """
+        entry = {'stage': stage, 'info': utils.to_json_data(info),
+                 'state': state}
+        with self._lock:
+            entries = self._entries.setdefault(addon_name, [])
+            for index, existing in enumerate(entries):
+                if existing['stage'] == stage:
+                    del entries[index:]
+                    break
+            entries.append(entry)
+            utils.write_json(
+                os.path.join(self._directory, '{}.json'.format(addon_name)),
+                entries)
@@ -25,6 +25,9 @@ import subprocess
 import sys
 import tempfile
 
+from . import profiling
+from . import tracing
+
 
 # Environment commands we answer or record. See libretro.h.
 RETRO_ENVIRONMENT_SET_VARIABLES = 16
@@ -176,11 +179,20 @@ class LibretroWrapper:
                        self.need_fullpath, self.block_extract,
                        self.supports_no_game, self.supports_disc_control)
 
-    def __init__(self, library_path):
-        probe_result, reason = self.probe(library_path)
-        if probe_result is None:
-            raise OSError(f"Failed to probe {library_path}: {reason}")
-
+    def __init__(self, library_path, probe_data=None):
+        """ probe_data: the probe_data of an earlier wrapper of the same
+            library, which then isn't probed again """
+        if probe_data is None:
+            probe_result, reason = self.probe(library_path)
+            if probe_result is None:
+                raise OSError(f"Failed to probe {library_path}: {reason}")
+            probe_data = {
+                'result': probe_result,
+                'opengl_linkage': self.has_opengl_linkage(library_path),
+            }
+        self.probe_data = probe_data
+
+        probe_result = probe_data['result']
         self.system_info = self.SystemInfo(probe_result['system_info'])
         self.options = [
             self.Option(
@@ -194,11 +206,10 @@ class LibretroWrapper:
             self.Category(category['key'], category['description'],
                           category['info'])
             for category in probe_result['categories']]
-
-        # opengl linkage
-        self.opengl_linkage = self.has_opengl_linkage(library_path)
+        self.opengl_linkage = probe_data['opengl_linkage']
 
     @classmethod
+    @tracing.traced(tracing.PROBE)
     def probe(cls, library_path):
         """ Load the core in a helper process and report what it registers.
 
@@ -218,14 +229,16 @@ class LibretroWrapper:
             with tempfile.NamedTemporaryFile(delete=False) as result_file:
                 result_path = result_file.name
 
-            with tempfile.TemporaryDirectory() as scratch_directory:
+            environment = cls._probe_environment()
+            with tempfile.TemporaryDirectory() as scratch_directory, \
+                    profiling.child_profile(environment):
                 helper = subprocess.run(
                     [sys.executable, '-m',
                      'kodi_game_scripting.libretro_ctypes',
                      '--probe', os.path.abspath(library_path), result_path],
                     check=False, timeout=PROBE_TIMEOUT_SECONDS,
                     stderr=subprocess.PIPE,
-                    cwd=scratch_directory, env=cls._probe_environment())
+                    cwd=scratch_directory, env=environment)
 
             result = cls._read_probe_result(result_path)
             if result is not None:
@@ -280,6 +293,7 @@ class LibretroWrapper:
             return None
 
     @classmethod
+    @tracing.traced(tracing.PROBE)
     def has_opengl_linkage(cls, library_path):
         """ Check if the library links opengl """
         ldd_output = subprocess.run(
@@ -556,7 +570,8 @@ class LibretroProbe:
 
 if __name__ == '__main__':  # pragma: no cover
     if len(sys.argv) == 4 and sys.argv[1] == '--probe':
-        LibretroProbe(sys.argv[2], sys.argv[3]).run()
+        with profiling.profile_to(os.environ.get(profiling.PROFILE_ENV)):
+            LibretroProbe(sys.argv[2], sys.argv[3]).run()
     else:
         LIB = LibretroWrapper(sys.argv[1])
         print(LIB.system_info)
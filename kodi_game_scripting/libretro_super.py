@@ -36,10 +36,14 @@ class LibretroSuper:
             self._working_directory)
         gitrepo.fetch_and_reset()
 
+    def get_info_file_path(self, library_soname):
+        """ Path of the info file in the libretro-super repository """
+        return os.path.join(self._working_directory, 'libretro-super', 'dist',
+                            'info', '{}.info'.format(library_soname))
+
     def parse_info_file(self, library_soname):
         """ Load info file from libretro-super repository """
-        path = os.path.join(self._working_directory, 'libretro-super', 'dist',
-                            'info', '{}.info'.format(library_soname))
+        path = self.get_info_file_path(library_soname)
         result = {
             'license': 'Unlicensed',
         }
@@ -0,0 +1,48 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Generate the summary from the results of a number of runs """
+
+import argparse
+
+from . import records
+from .template_processor import TemplateProcessor
+
+
+def main():
+    """ Generate the summary from the results of a number of runs """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output-dir', dest='output_directory', type=str,
+                        default='.',
+                        help="Directory to write summary.html and wiki.txt "
+                             "to")
+    parser.add_argument('sources', nargs='+', metavar='SOURCE',
+                        help="Working directory of a run, or the result "
+                             "file of a shard")
+
+    args = parser.parse_args()
+    merge_summary(args.sources, args.output_directory)
+
+
+def merge_summary(sources, output_directory):
+    """ Render the summary from the latest record of every addon """
+    merged = records.merge(*[records.read_records(source)
+                             for source in sources])
+    addons = records.summary_addons(merged)
+    print("Generating summary of {} addons".format(len(addons)))
+    TemplateProcessor.process('summary', output_directory,
+                              {'addons': addons})
+    return addons
@@ -0,0 +1,124 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Move the objects of the addon repositories into a shared store """
+
+import argparse
+import os
+
+import git
+
+from .git_access import GitRepo
+
+
+class SharedObjectStore:
+    """ A bare repository the addon repositories borrow their objects from
+
+        The addon repositories are generated from the same templates, so
+        most of their objects are the same. Each of them looks up the
+        objects it doesn't have in the store (git alternates), and fetching
+        skips what's there already.
+
+        The store holds what repack() moved there, after which the
+        repositories drop their own copies. Nothing is ever pruned from it,
+        as a repository might still need an object after dropping its copy.
+        """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    @property
+    def objects(self):
+        """ The objects directory the repositories borrow from """
+        return os.path.join(self.path, 'objects')
+
+    def create(self):
+        """ Create the store, unless it exists """
+        if GitRepo.is_git_repo(self.path):
+            return
+        print("Creating object store {}".format(self.path))
+        repo = git.Repo.init(self.path, bare=True)
+        with repo.config_writer() as config:
+            # Only repack() may ever clean up the store
+            config.set_value('gc', 'auto', '0')
+            config.set_value('gc', 'pruneExpire', 'never')
+
+    def get_borrowers(self, directories):
+        """ The repositories right in directories that borrow from the store
+        """
+        return [path for directory in directories
+                for path in sorted(
+                    os.path.join(directory, name)
+                    for name in os.listdir(directory))
+                if self.objects in GitRepo.get_alternates(path)]
+
+    def repack(self, repositories):
+        """ Move the objects of repositories that borrow from the store there
+
+        The store fetches every ref of each repository, under
+        refs/borrowers/<name>/, and is packed into a single pack, keeping
+        unreachable objects. The repositories then repack without the
+        objects they find in the store. Returns the bytes taken by the
+        objects of the store and the repositories before and after. """
+        before = sum(_get_size(path) for path in [self.path] + repositories)
+        store = git.Repo(self.path)
+        for path in repositories:
+            name = os.path.basename(path)
+            print("Collecting objects of {}".format(name))
+            store.git.fetch('--prune', '--no-tags', path,
+                            '+refs/*:refs/borrowers/{}/*'.format(name))
+        print("Repacking object store")
+        store.git.repack('-a', '-d', '--keep-unreachable')
+        for path in repositories:
+            print("Dropping shared objects of {}".format(
+                os.path.basename(path)))
+            git.Repo(path).git.repack('-a', '-d', '--local')
+        after = sum(_get_size(path) for path in [self.path] + repositories)
+        return before, after
+
+
+def _get_size(repository):
+    """ Bytes taken by the objects of a repository """
+    objects = os.path.join(git.Repo(repository).git_dir, 'objects')
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(objects) for name in names)
+
+
+def main():
+    """ Move the objects of the addon repositories into a shared store """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('store', metavar='STORE',
+                        help="Object store given to process_game_addons.py "
+                             "with --object-store")
+    parser.add_argument('directories', nargs='+', metavar='DIRECTORY',
+                        help="Working directory whose addon repositories "
+                             "borrow from the store")
+
+    args = parser.parse_args()
+    repack_objects(args.store, args.directories)
+
+
+def repack_objects(path, directories):
+    """ Repack the store and the repositories borrowing from it """
+    store = SharedObjectStore(path)
+    store.create()
+    repositories = store.get_borrowers(directories)
+    print("Repacking {} repositories borrowing from {}".format(
+        len(repositories), store.path))
+    before, after = store.repack(repositories)
+    print("Objects took {:.1f} MB, now {:.1f} MB".format(
+        before / 1024 / 1024, after / 1024 / 1024))
+    return repositories
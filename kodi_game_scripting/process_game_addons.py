@@ -16,28 +16,93 @@
 
 """ Process Kodi Game addons and unify project files """
 
+# pylint: disable=too-many-lines
+
 import argparse
 import collections
 import datetime
+import functools
 import os
 import multiprocessing
+import platform
 import re
 import shutil
 import subprocess
 import sys
-
+import threading
+import time
+
+from . import api_cache
+from . import fetching
+from . import git_access
+from . import profiling
+from . import records
+from . import retry
+from . import sharding
+from . import tracing
 from . import utils
 from .addon_strings import StringTable, read_strings
+from .api_cache import ApiCache
+from .artifacts import ArtifactCache
 from .config import ADDONS, GITHUB_ADDON_PREFIX, GITHUB_ORGANIZATION
-from .git_access import GitHubOrg, GitHubRepo, GitRepo
+from .build_history import BuildHistory, makespan
+from .compiler_cache import CCACHE, SCCACHE, CompilerCache
+from .fingerprint import (FingerprintCache, get_fingerprint, hash_directory,
+                          hash_files)
+from .git_access import GitHubOrg, GitHubRepo, GitHubSession, GitRepo
+from .journal import Journal
+from .retry import RetryPolicy
+from .object_store import SharedObjectStore
 from .libretro_ctypes import LibretroWrapper
-from .template_processor import TemplateProcessor
+from .template_processor import (ADDED, CHANGED, REMOVED, TEMPLATE_DIR,
+                                 TemplateProcessor)
 from .libretro_super import LibretroSuper
+from .results import ResultsLog
+from .scheduler import DONE, FAILED, SKIPPED, JobBudget, TaskGraph
+from .upstream import SharedSources
 from .versions import AddonVersion
 
 COMMIT_MSG = "Updated by kodi-game-scripting\n\n" \
              "https://github.com/kodi-game/kodi-game-scripting/"
 
+# Stages every addon goes through
+FETCH = 'fetch'
+MAKEFILES = 'makefiles'
+BUILD = 'build'
+METADATA = 'metadata'
+COMMIT = 'commit'
+VERSION = 'version'
+PUSH = 'push'
+
+# Pushes of --push-jobs that update the branches, after uploading them
+PUBLISH = 'publish'
+
+# Seconds between the branch updates of consecutive addons. GitHub sorts
+# the repositories of an organization by the second they were pushed to, so
+# updates in the same second would break the order of _push().
+PUSH_GAP = 1.0
+
+# Tasks of --skip-unchanged that come on top of the stages
+CHECK = 'check'
+RECORD = 'record'
+
+# The only task of --plan
+PLAN = 'plan'
+
+# Fetched along with the addons
+LIBRETRO_SUPER = 'libretro-super'
+
+# Arguments that change what a run does; a journal is only resumed by a run
+# with the same ones
+JOURNAL_ARGS = ['filter', 'git', 'git_noclean', 'compile', 'buildtype',
+                'kodi_directory', 'push_branch']
+
+# Kept in the build directory of an addon by --incremental-build
+BUILD_STATE = 'build-state.json'
+
+# Arguments that change the files generated for an addon
+FINGERPRINT_ARGS = ['git', 'compile', 'buildtype', 'push_branch']
+
 
 def main():
     """ Process Kodi Game addons and unify project files """
@@ -67,21 +132,127 @@ def main():
                         help="Push addon descriptions")
     parser.add_argument('--clean-description', action='store_true',
                         help="Clean existing addon descriptions")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of addons to process in parallel")
+    parser.add_argument('--object-store', type=str, metavar='DIR',
+                        help="Let the addon repositories borrow objects "
+                             "from the bare repository DIR, see "
+                             "repack_objects.py")
+    parser.add_argument('--api-cache', type=str, metavar='DIR',
+                        help="Keep the responses of the GitHub API in DIR "
+                             "and revalidate them with their ETags")
+    parser.add_argument('--api-cache-ttl', type=int, metavar='SECONDS',
+                        default=api_cache.DEFAULT_TTL,
+                        help="Age up to which cached GitHub API responses "
+                             "are used without revalidating them "
+                             "(default: %(default)s)")
+    parser.add_argument('--github-api', choices=[git_access.REST,
+                                                 git_access.GRAPHQL],
+                        default=git_access.REST,
+                        help="API to list the repositories and read the "
+                             "latest tags through (default: %(default)s)")
+    parser.add_argument('--push-jobs', type=int, metavar='N', default=1,
+                        help="Number of repositories to push at once; "
+                             "their branches are still updated in order "
+                             "(default: %(default)s)")
+    parser.add_argument('--retries', type=int, metavar='N',
+                        default=retry.DEFAULT_ATTEMPTS - 1,
+                        help="Number of times a fetch, push or GitHub API "
+                             "query that failed because of the network is "
+                             "tried again (default: %(default)s)")
+    parser.add_argument('--fetch-jobs', type=int, metavar='N',
+                        default=fetching.DEFAULT_JOBS,
+                        help="Number of repositories to fetch at once "
+                             "(default: %(default)s)")
+    parser.add_argument('--build-jobs', type=int, metavar='N',
+                        help="Number of compiler jobs shared by all builds "
+                             "(default: number of CPUs)")
+    parser.add_argument('--incremental-build', action='store_true',
+                        help="Keep the build trees and only rebuild cores "
+                             "whose upstream or depends files changed")
+    parser.add_argument('--artifact-cache', type=str, metavar='DIR',
+                        help="Reuse the libraries built with the same inputs "
+                             "before, keeping them in DIR")
+    parser.add_argument('--source-cache', type=str, metavar='DIR',
+                        help="Keep mirrors of the upstream repositories of "
+                             "all cores in DIR and build from them")
+    parser.add_argument('--compiler-cache', choices=[CCACHE, SCCACHE],
+                        help="Compile the cores through ccache or sccache")
+    parser.add_argument('--compiler-cache-dir', type=str, metavar='DIR',
+                        help="Directory of the compiler cache (default: the "
+                             "tool's own)")
+    parser.add_argument('--compiler-cache-size', type=str, metavar='SIZE',
+                        help="Maximum size of the compiler cache, e.g. 20G")
+    parser.add_argument('--build-memory', type=int, metavar='MB',
+                        help="Memory the builds may take together, as "
+                             "predicted from past builds (default: physical "
+                             "memory)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip stages a previous run already completed")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Skip addons whose inputs didn't change since "
+                             "they were last processed")
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                        help="Write stage timings and a Chrome trace to FILE")
+    parser.add_argument('--profile-stage', type=str, metavar='STAGE',
+                        choices=[FETCH, CHECK, MAKEFILES, BUILD, METADATA,
+                                 COMMIT, VERSION, PUSH],
+                        help="Run STAGE of every addon under cProfile")
+    parser.add_argument('--plan', action='store_true',
+                        help="Show what would change, without changing "
+                             "anything")
+    parser.add_argument('--shard', type=sharding.parse_shard, metavar='I/N',
+                        help="Only process the I-th of N disjoint shards of "
+                             "the addons")
+    parser.add_argument('--results-jsonl', type=str, metavar='FILE',
+                        help="Append the result of every stage of every "
+                             "addon to FILE as it completes")
+    parser.add_argument('--shard-weights', type=str, metavar='FILE',
+                        help="Balance shards by the addon costs in FILE, a "
+                             "JSON dict or a trace written by --trace")
 
     args = parser.parse_args()
     args.working_directory = os.path.abspath(args.working_directory)
 
-    LibretroSuper(args.working_directory).fetch_and_reset()
+    if args.trace:
+        tracing.TRACER.enable()
+    try:
+        status = process_addons(args)
+    finally:
+        if args.trace:
+            print("Writing trace to {}".format(args.trace))
+            tracing.TRACER.write(args.trace)
+    if not status:
+        sys.exit(1)
+
+
+def process_addons(args):
+    """ Process Kodi Game addons, returns whether all of them succeeded """
+    if args.plan:
+        with tracing.span('prepare', tracing.STAGE):
+            gameaddons = KodiGameAddons(args)
+        return gameaddons.process()
+
     addondescriptions = KodiAddonDescriptions(args.working_directory)
     if args.clean_description:
         addondescriptions.clean()
-    gameaddons = KodiGameAddons(args)
+    with tracing.span('prepare', tracing.STAGE):
+        gameaddons = KodiGameAddons(args)
     status = gameaddons.process()
-    gameaddons.summary()
+    if args.shard:
+        path = sharding.get_result_path(args.working_directory, *args.shard)
+        print("Writing shard result to {}".format(path))
+        utils.write_json(path, {
+            'shard': list(args.shard),
+            'succeeded': status,
+            'addons': gameaddons.get_results(),
+        })
+    with tracing.span('summary', tracing.STAGE):
+        gameaddons.summary()
     if args.push_description:
-        addondescriptions.push(args.push_branch)
-    if not status:
-        sys.exit(1)
+        with tracing.span('push-description', tracing.STAGE):
+            addondescriptions.push(args.push_branch)
+    return status
 
 
 class KodiAddonDescriptions:
@@ -115,9 +286,35 @@ class KodiGameAddons:
         """ Initialize instance """
         # The following values are read from args:
         # filter, git, working_directory, push_branch, push_limit, git_noclean,
-        # compile, kodi_directory
+        # compile, kodi_directory, jobs, resume, skip_unchanged, profile_stage,
+        # plan, shard, shard_weights, results_jsonl, build_jobs, build_memory,
+        # incremental_build, artifact_cache, compiler_cache,
+        # compiler_cache_dir, compiler_cache_size, source_cache, fetch_jobs,
+        # object_store, api_cache, api_cache_ttl, github_api, retries,
+        # push_jobs
 
         self._args = args
+        self._fingerprints = None
+        self._run_fingerprint = None
+        self._unchanged = set()
+        self._profiler = None
+        self._status = {}
+        self._results = None
+        self._sources = None
+        self._history = None
+        self._predicted = {}
+        self._builds = {}
+        self._artifacts = None
+        self._artifact_keys = {}
+        self._compiler_cache = None
+        self._compiler_cache_stats = None
+        self._fetch_errors = {}
+        self._pushes = {}
+        self._pushes_lock = threading.Lock()
+        self._budget = JobBudget(
+            args.build_jobs or multiprocessing.cpu_count(),
+            args.build_memory * 1024 * 1024 if args.build_memory
+            else utils.get_physical_memory())
         self._prepare_environment()
 
     def _prepare_environment(self):
@@ -128,144 +325,834 @@ class KodiGameAddons:
         if not addons:
             raise ValueError("Filter doesn't match any items in config.py")
 
+        if self._args.shard:
+            addons = self._select_shard(addons)
+
+        RetryPolicy.configure(self._args.retries + 1)
+        if self._args.api_cache:
+            GitHubSession.set_cache(ApiCache(self._args.api_cache,
+                                             self._args.api_cache_ttl))
+        GitHubSession.set_api(self._args.github_api)
+
         # Check GitHub repos
         repos = {}
-        if self._args.git:
+        if self._args.git and not self._args.plan:
             print("Querying GitHub repos matching '{}'".format(self._args.filter))
             self._github = GitHubOrg(GITHUB_ORGANIZATION, auth=True)
             repos = self._github.get_repos(f"{GITHUB_ADDON_PREFIX}{self._args.filter}")
 
+        # Let the addon repositories borrow objects from the shared store
+        alternates = None
+        if self._args.object_store and not self._args.plan:
+            store = SharedObjectStore(self._args.object_store)
+            store.create()
+            alternates = store.objects
+
         # Create Addon objects
         self._addons = []
         for game_name in sorted(addons):
             addon_name = '{}{}'.format(GITHUB_ADDON_PREFIX, game_name)
             repo = repos.get(addon_name, None)
             if not repo:
-                if self._args.git and self._args.push_branch:
+                if self._args.git and self._args.push_branch and \
+                        not self._args.plan:
                     print("Creating GitHub repository {}".format(addon_name))
                     repo = self._github.create_repo(addon_name)
                 else:
                     repo = GitHubRepo(addon_name, '', '')
             self._addons.append(KodiGameAddon(
                 addon_name, game_name, repo, self._args.working_directory,
-                self._args.push_branch))
+                self._args.push_branch, alternates))
+        GitHubSession.expect_tags(
+            addon.upstream for addon in self._addons
+            if addon.info['libretro_repo']['git_tag'])
 
         print("Processing the following addons: {}".format(
             ', '.join([addon.game_name for addon in self._addons])))
 
-        # Clone/Fetch repos
-        if self._args.git:
-            for addon in self._addons:
-                addon.fetch_and_reset(reset=not self._args.git_noclean)
+    def _select_shard(self, addons):
+        """ Keep the addons of this run's shard """
+        index, count = self._args.shard
+        weights = sharding.load_weights(self._args.shard_weights) \
+            if self._args.shard_weights else None
+        shard = sharding.partition(
+            ['{}{}'.format(GITHUB_ADDON_PREFIX, game_name)
+             for game_name in addons], count, weights)[index - 1]
+        print("Shard {}/{} has {} of {} addons".format(
+            index, count, len(shard), len(addons)))
+        return {k: v for k, v in addons.items()
+                if '{}{}'.format(GITHUB_ADDON_PREFIX, k) in shard}
 
     def process(self):
-        """ Process list of addons from config """
-
-        # First iteration: Makefiles
-        print("First iteration: Generate Makefiles")
+        """ Process list of addons from config
+
+        Every addon moves through its own chain of stages (fetch, makefiles,
+        build, metadata, commit, version) without waiting for the other
+        addons, so fast cores are done while slow ones are still compiling.
+        The addons that made it through them are pushed once all are done,
+        see _push().
+
+        A failing stage ends the run, except for a failing build: that only
+        stops its own addon, and the run keeps going for the others. Addons
+        whose builds took longest in the past start first, and the shorter
+        ones fill the gaps, see BuildHistory.
+
+        Completed stages are written to a journal; with --resume, stages a
+        previous run already completed are skipped.
+
+        With --skip-unchanged, an addon whose fingerprint matches the one
+        recorded at the end of its last run goes through its stages without
+        doing anything, see _add_check_task().
+
+        With --plan, nothing is changed at all, see _plan(). """
+        if self._args.plan:
+            return self._plan()
+
+        journal = Journal(self._args.working_directory, {
+            arg: getattr(self._args, arg) for arg in JOURNAL_ARGS})
+        resume = journal.start(resume=self._args.resume)
+
+        push = self._args.git and self._args.push_branch
+        graph = TaskGraph()
+        pushed = set()
+        fetches = []
+        self._prepare_run()
         for addon in self._addons:
-            print(" Processing addon: {}".format(addon.name))
-            addon.load_git_tag()
-            addon.load_addon_xml()
-            addon.load_strings()
-            addon.process_addon_files()
-            print(" Processing addon description: {}".format(addon.name))
+            stages = self._stages(addon)
+            resumed = self._resume(addon, journal, [
+                stage for stage, _ in stages] + ([PUSH] if push else [])) \
+                if resume else 0
+            if resumed > len(stages):
+                pushed.add(addon.name)
+            if self._args.git and not resumed:
+                fetches.append(addon)
+            self._add_stage_tasks(graph, journal, addon, stages, resumed)
+        if self._args.skip_unchanged and not push:
+            self._add_record_tasks(graph, self._addons, {
+                addon.name: self._stages(addon)[-1][0]
+                for addon in self._addons})
+
+        with tracing.span('fetch', tracing.STAGE):
+            self._fetch_errors = self._fetch(fetches)
+        if self._args.results_jsonl:
+            with ResultsLog(self._args.results_jsonl) as self._results:
+                status = self._run(graph, journal, pushed)
+            self._results = None
+        else:
+            status = self._run(graph, journal, pushed)
+        self._finish_run()
+        return status
+
+    def _run(self, graph, journal, pushed):
+        """ Run the stages of the addons, then push them if asked to """
+        status = graph.run(self._args.jobs, fail_fast=True)
+        self._status = dict(graph.status)
+        if not (self._args.git and self._args.push_branch):
+            return status
+
+        addons = [addon for addon in self._addons
+                  if self._status.get((addon.name, VERSION)) == DONE]
+        if any(task_status == FAILED and stage != BUILD
+               for (_, stage), task_status in graph.status.items()):
+            # A failure other than a build ends the run before anything is
+            # pushed
+            for addon in addons:
+                self._status[(addon.name, PUSH)] = SKIPPED
+            return False
+        with tracing.span('push', tracing.STAGE):
+            return self._push(addons, journal, pushed) and status
+
+    def _push(self, addons, journal, pushed):
+        """ Push the repositories of addons, except those already pushed
+
+        The branches are updated in reversed order, so that the repository
+        list on GitHub stays sorted alphabetically. With --push-jobs 1,
+        every addon is pushed in that order. Otherwise, up to --push-jobs
+        repositories are first uploaded at once (see
+        GitRepo.stage_push()), and each branch is updated in order as soon
+        as its repository and all that come before it are uploaded, which
+        is quick as the remote has the commits already.
+
+        Consecutive branch updates are at least PUSH_GAP apart, however
+        quick the pushes are; retries and uploads are paced by the
+        RetryPolicy alone.
+
+        How long each push took is printed once they are all done. Returns
+        whether all pushes succeeded. """
+        graph = TaskGraph()
+        last = self._add_push_tasks(graph, journal, pushed, addons)
+        if self._args.skip_unchanged:
+            self._add_record_tasks(graph, addons, {
+                addon.name: last for addon in addons})
+        start = time.monotonic()
+        status = graph.run(self._args.push_jobs, fail_fast=True)
+        wall_time = time.monotonic() - start
+        self._status.update(graph.status)
+
+        for name, duration in sorted(self._pushes.items(),
+                                     key=lambda item: (-item[1], item[0])):
+            print("  {:<40} {:6.1f}s".format(name, duration))
+        print("Pushed {} repositories in {:.1f}s ({:.1f}s of wall time)"
+              .format(len(self._pushes), sum(self._pushes.values()),
+                      wall_time))
+        return status
+
+    def _add_record_tasks(self, graph, addons, stages):
+        """ Add the tasks of --skip-unchanged recording the fingerprints of
+            addons, each after the stage given by stages[addon name] """
+        for addon in addons:
+            graph.add((addon.name, RECORD),
+                      self._traced(addon, RECORD, functools.partial(
+                          self._record_fingerprint, addon)),
+                      requires=((addon.name, stages[addon.name]),))
+
+    def _finish_run(self):
+        """ Keep and report what the options of a run gathered """
+        self._save_records()
+        if self._history:
+            self._history.save()
+            if self._builds:
+                self._report_builds()
+        if self._compiler_cache:
+            self._compiler_cache_stats = self._compiler_cache.get_stats()
+            if self._compiler_cache_stats:
+                print("{tool}: {hits} hits, {misses} misses".format(
+                    **self._compiler_cache_stats))
+        if self._profiler:
+            self._profiler.write_aggregate()
+        if GitHubSession.current():
+            GitHubSession.current().report()
+
+    def _fetch(self, addons):
+        """ Fetch libretro-super and the repositories of addons, up to
+            --fetch-jobs at once
+
+        The fetch stage of an addon then only resets its checkout, or fails
+        if its fetch did, see _reset_addon(). Returns {addon name: error}
+        of the fetches that failed. """
+        fetches = {LIBRETRO_SUPER: LibretroSuper(
+            self._args.working_directory).fetch_and_reset}
+        fetches.update((addon.name, addon.fetch) for addon in addons)
+        errors = fetching.fetch_all(fetches, self._args.fetch_jobs)
+        if LIBRETRO_SUPER in errors:
+            raise errors[LIBRETRO_SUPER]
+        return errors
+
+    def _reset_addon(self, addon):
+        """ Reset the checkout of a single addon to what was fetched """
+        if addon.name in self._fetch_errors:
+            raise self._fetch_errors[addon.name]
+        addon.fetch_and_reset(reset=not self._args.git_noclean, fetch=False)
+
+    def _prepare_run(self):
+        """ Set up what the options of a run need """
+        self._unchanged = set()
+        if self._args.skip_unchanged:
+            self._fingerprints = FingerprintCache(
+                self._args.working_directory)
+            self._run_fingerprint = self._get_run_fingerprint()
+        if self._args.profile_stage:
+            self._profiler = profiling.StageProfiler(
+                self._args.working_directory, self._args.profile_stage)
+        if self._args.compile:
+            self._sources = SharedSources(
+                self._args.source_cache or os.path.join(
+                    self._args.working_directory, SharedSources.DIRECTORY),
+                [addon.upstream for addon in self._addons],
+                mirror_all=bool(self._args.source_cache))
+            self._history = BuildHistory(self._args.working_directory)
+            self._predicted = {addon.name: self._history.predict(addon.name)
+                               for addon in self._addons}
+            self._builds = {}
+            if self._args.artifact_cache:
+                self._artifacts = ArtifactCache(self._args.artifact_cache)
+                self._artifact_keys = {}
+            if self._args.compiler_cache:
+                self._compiler_cache = CompilerCache(
+                    self._args.compiler_cache, self._args.compiler_cache_dir,
+                    self._args.compiler_cache_size)
+                self._compiler_cache.zero_stats()
+
+    def _add_stage_tasks(self, graph, journal, addon, stages, resumed):
+        """ Chain the stages of an addon, skipping the first resumed ones
+
+        The stages leading up to a build are prioritized by how long the
+        build is expected to take, so that the longest builds start first. """
+        priority = self._predicted.get(addon.name, 0)
+        names = [stage for stage, _ in stages]
+        last_prioritized = names.index(BUILD) if BUILD in names else -1
+        requires = ()
+        for index, (stage, func) in enumerate(stages):
+            if self._args.skip_unchanged and stage != FETCH and \
+                    (addon.name, CHECK) not in graph:
+                requires = self._add_check_task(graph, addon, requires)
+            requires = (graph.add(
+                (addon.name, stage),
+                self._traced(addon, stage, self._checkpointed(
+                    journal, addon, stage,
+                    self._unless_unchanged(
+                        addon, self._profiled(addon, stage, func)),
+                    skip=index < resumed)),
+                requires=requires,
+                priority=priority if index <= last_prioritized else 0,
+                isolated=stage == BUILD),)
+
+    def _report_builds(self):
+        """ Print how long the builds took and were predicted to take """
+        workers = min(self._args.jobs, self._budget.total)
+        predicted = [self._predicted[name] for name in self._builds]
+        print("Builds of {} addons took {:.0f}s, {:.0f}s of wall time "
+              "(predicted {:.0f}s, {:.0f}s of wall time)".format(
+                  len(self._builds),
+                  sum(end - start for start, end in self._builds.values()),
+                  max(end for _, end in self._builds.values()) -
+                  min(start for start, _ in self._builds.values()),
+                  sum(predicted), makespan(predicted, workers)))
+
+    def _save_records(self):
+        """ Keep the metadata of every addon that was processed successfully,
+            see summary() """
+        store = records.RecordStore(self._args.working_directory)
+        for name, result in self.get_results().items():
+            if result['status'] == DONE:
+                store.save(name, result['info'])
+
+    def _plan(self):
+        """ Show what processing the addons would change
+
+        The files of every addon are rendered in memory from what's on disk
+        -- nothing is fetched, built, committed or pushed -- and compared to
+        the files there. """
+        graph = TaskGraph()
+        changes = {}
+        for addon in self._addons:
+            graph.add((addon.name, PLAN), self._traced(
+                addon, PLAN, functools.partial(self._plan_addon, addon,
+                                               changes)))
+        status = graph.run(self._args.jobs)
+
+        counts = collections.Counter(
+            change.action for addon_changes in changes.values()
+            for change in addon_changes)
+        print("Plan: {} of {} addons change, {} files added, {} changed, "
+              "{} removed".format(
+                  len([name for name, addon_changes in changes.items()
+                       if addon_changes]),
+                  len(self._addons), counts[ADDED], counts[CHANGED],
+                  counts[REMOVED]))
+        return status
+
+    def _plan_addon(self, addon, changes):
+        """ Render the files of an addon in memory and print the changes """
+        addon.plan = {}
+        # The progress of rendering is only of interest if it fails
+        with utils.captured_output() as output:
+            try:
+                self._generate_makefiles(addon)
+                self._generate_metadata(addon)
+                error = None
+            except Exception as err:  # pylint: disable=broad-except
+                error = err
+        if error:
+            sys.stdout.write(output.getvalue())
+            raise error
+
+        changes[addon.name] = addon.planned_changes()
+        if not changes[addon.name]:
+            print("{}: unchanged".format(addon.name))
+            return
+        print("{}:".format(addon.name))
+        for change in changes[addon.name]:
+            print("  {} {}".format(change.action[0].upper(), change.path))
+        for change in changes[addon.name]:
+            sys.stdout.write(change.diff)
+
+    @staticmethod
+    def _resume(addon, journal, stages):
+        """ Restore what the journal recorded for an addon
+
+        Returns the number of stages that don't need to run again. Those are
+        the stages completed by the previous run, as long as what they left
+        behind is still there: the checkout must be at the commit the last
+        of them left it at, and a library it built must be unchanged. """
+        completed = journal.completed(addon.name)
+        count = 0
+        for stage, entry in zip(stages, completed):
+            if entry['stage'] != stage:
+                break
+            if 'library' in entry['state'] and \
+                    entry['state']['library'] != \
+                    addon.get_state(stage)['library']:
+                break
+            count += 1
+        if not count or \
+                completed[count - 1]['state']['head'] != \
+                addon.get_state(stages[count - 1])['head']:
+            return 0
+
+        print("Resuming {} after stage {}".format(addon.name,
+                                                  stages[count - 1]))
+        addon.info = completed[count - 1]['info']
+        return count
+
+    def _traced(self, addon, stage, func):
+        """ Wrap a stage so that its time shows up in the trace, and its
+            result in --results-jsonl """
+        def run():
+            with tracing.span(stage, tracing.STAGE, addon=addon.name):
+                try:
+                    func()
+                except Exception as err:
+                    if self._results:
+                        self._results.write(addon.name, stage, addon.info,
+                                            err)
+                    raise
+            if self._results:
+                self._results.write(addon.name, stage, addon.info)
+        return run
+
+    @staticmethod
+    def _checkpointed(journal, addon, stage, func, skip=False):
+        """ Wrap a stage so that its completion is written to the journal """
+        def run():
+            if skip:
+                return
+            func()
+            journal.record(addon.name, stage, addon.info,
+                           addon.get_state(stage))
+        return run
+
+    def _get_run_fingerprint(self):
+        """ Fingerprint of what's the same for all addons in this run
+
+        That's the templates, this very code and the arguments. """
+        return get_fingerprint(
+            hash_directory(TEMPLATE_DIR),
+            hash_directory(os.path.dirname(os.path.realpath(__file__))),
+            {arg: getattr(self._args, arg) for arg in FINGERPRINT_ARGS})
+
+    def _add_check_task(self, graph, addon, requires):
+        """ Add a task comparing an addon's fingerprint to the last one
+
+        It runs after the fetch, so that the checkout can be compared. An
+        unchanged addon gets its metadata from last time for the summary,
+        and its description files are written again, as they might have been
+        cleaned. """
+        def check():
+            info = self._fingerprints.get(
+                addon.name, addon.get_fingerprint(self._run_fingerprint))
+            if info is None:
+                return
+            print(" Skipping unchanged addon: {}".format(addon.name))
+            addon.info = info
             addon.process_description_files(self._args.kodi_directory)
+            self._unchanged.add(addon.name)
+        return (graph.add((addon.name, CHECK),
+                          self._traced(addon, CHECK,
+                                       self._profiled(addon, CHECK, check)),
+                          requires=requires),)
+
+    def _profiled(self, addon, stage, func):
+        """ Wrap a stage so that it runs under the profiler, if asked to """
+        if not self._profiler or stage != self._profiler.stage:
+            return func
+        return functools.partial(self._profiler.run, addon.name, func)
+
+    def _unless_unchanged(self, addon, func):
+        """ Wrap a stage so that it does nothing for an unchanged addon """
+        def run():
+            if addon.name not in self._unchanged:
+                func()
+        return run
+
+    def _record_fingerprint(self, addon):
+        """ Record the fingerprint of an addon that was processed
+
+        It's taken at the end, so that it includes the files the run
+        generated and committed. """
+        if addon.name in self._unchanged:
+            return
+        fingerprint = addon.get_fingerprint(self._run_fingerprint)
+        if fingerprint:
+            self._fingerprints.save(addon.name, fingerprint, addon.info)
 
-        # Compile addons to read info from built library
-        # Instead of compiling individual addons we compile all at once to save
-        # time (tinyxml and others would be compiled multiple times).
+    def _stages(self, addon):
+        """ The stages a single addon goes through, in order """
+        stages = []
+        if self._args.git:
+            stages.append((FETCH, functools.partial(
+                self._reset_addon, addon)))
+        stages.append((MAKEFILES, functools.partial(
+            self._generate_makefiles, addon)))
         if self._args.compile:
-            if not self._compile_addons():
-                return False
-
-        # Second iteration: Metadata files
-        print("Second iteration: Generate Metadata files")
-        for addon in self._addons:
-            print(" Processing addon: {}".format(addon.name))
-            addon.load_info_file()
-            addon.load_assets()
-            addon.load_library_file()
+            stages.append((BUILD, functools.partial(
+                self._compile_addon, addon)))
+        stages.append((METADATA, functools.partial(
+            self._generate_metadata, addon)))
+        if self._args.git:
+            stages.append((COMMIT, functools.partial(
+                addon.commit, squash=self._args.git_noclean)))
+            stages.append((VERSION, functools.partial(
+                self._update_version, addon)))
+        return stages
+
+    def _add_push_tasks(self, graph, journal, pushed, addons):
+        """ Add the pushes of addons, see _push()
+
+        Returns the task that completes the push of each addon. """
+        staged = self._args.push_jobs > 1
+        count = []
+        # When the last branch update ended
+        updated = [None]
+
+        def wait_turn():
+            if updated[0] is not None:
+                delay = updated[0] + PUSH_GAP - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        def update(addon, func):
+            wait_turn()
+            try:
+                timed(addon, func)
+            finally:
+                updated[0] = time.monotonic()
+
+        def timed(addon, func):
+            start = time.monotonic()
+            func()
+            with self._pushes_lock:
+                self._pushes[addon.name] = self._pushes.get(
+                    addon.name, 0) + time.monotonic() - start
+
+        def push(addon):
+            with self._pushes_lock:
+                if not addon.info['git']['diff'] or (
+                        self._args.push_limit and
+                        len(count) >= self._args.push_limit):
+                    return
+                count.append(addon)
+            if staged:
+                timed(addon, addon.stage_push)
+            else:
+                update(addon, addon.push)
+
+        def publish(addon):
+            if addon in count:
+                update(addon, functools.partial(addon.push, staged=True))
+
+        after = ()
+        for addon in reversed(addons):
+            skip = addon.name in pushed
+            func = self._unless_unchanged(addon, self._profiled(
+                addon, PUSH, functools.partial(push, addon)))
+            if not staged:
+                after = (graph.add(
+                    (addon.name, PUSH), self._traced(
+                        addon, PUSH, self._checkpointed(
+                            journal, addon, PUSH, func, skip=skip)),
+                    after=after),)
+                continue
+            graph.add((addon.name, PUSH), self._traced(
+                addon, PUSH, (lambda: None) if skip else func))
+            after = (graph.add(
+                (addon.name, PUBLISH), self._traced(
+                    addon, PUBLISH, self._checkpointed(
+                        journal, addon, PUSH, self._unless_unchanged(
+                            addon, functools.partial(publish, addon)),
+                        skip=skip)),
+                requires=((addon.name, PUSH),), after=after),)
+        return PUBLISH if staged else PUSH
+
+    def _generate_makefiles(self, addon):
+        """ Generate the files needed to build a single addon """
+        print(" Processing addon: {}".format(addon.name))
+        addon.load_git_tag()
+        addon.load_addon_xml()
+        addon.load_strings()
+        addon.process_addon_files()
+        print(" Processing addon description: {}".format(addon.name))
+        addon.process_description_files(self._args.kodi_directory)
+
+    def _generate_metadata(self, addon):
+        """ Generate the metadata of a single addon from what was built
+
+        A library that was built with --artifact-cache is added to the cache
+        here, along with what probing it found and what was read from the
+        checkout of the core. A library that came from the cache has no
+        checkout, what was read from it is restored with the library. """
+        print(" Processing addon: {}".format(addon.name))
+        addon.load_info_file()
+        addon.load_assets()
+        library = addon.load_library_file()
+        cached = addon.library_probe is not None
+        if not cached:
             addon.load_git_revision()
-            addon.load_game_version()
+        addon.load_game_version()
+        if not cached:
             addon.load_exclude_platforms()
+        key = self._artifact_keys.pop(addon.name, None)
+        if key and library:
+            self._artifacts.store(key, os.path.join(
+                self._args.working_directory, addon.info['library']['file']),
+                library.probe_data, addon.get_source_data())
+        addon.process_addon_files()
+
+    @staticmethod
+    def _update_version(addon):
+        """ Update package version if dependencies changed """
+        if addon.needs_version_bump():
+            print(" Updating version: {}".format(addon.name))
+            addon.bump_version()
             addon.process_addon_files()
+            addon.commit(squash=True)
+            addon.tag()
 
-        # Create commit
-        if self._args.git:
-            for addon in self._addons:
-                addon.commit(squash=self._args.git_noclean)
-
-            # Third iteration: Update package version if there are changes
-            print("Third iteration: Update version")
-            for addon in self._addons:
-                if addon.needs_version_bump():
-                    print(" Processing addon: {}".format(addon.name))
-                    addon.bump_version()
-                    addon.process_addon_files()
-                    addon.commit(squash=True)
-                    addon.tag()
-
-            # Push in reversed order so that the repository list on GitHub
-            # stays sorted alphabetically
-            if self._args.push_branch:
-                count = 0
-                for addon in reversed(self._addons):
-                    if (self._args.push_limit and
-                            count >= self._args.push_limit):
-                        break
-                    if addon.info['git']['diff']:
-                        addon.push()
-                        count += 1
-        return True
+    def get_results(self):
+        """ The outcome of every addon: its status and its metadata
+
+        The status is 'failed' if a stage failed, 'skipped' if a stage
+        didn't get to run and 'done' otherwise. """
+        results = {}
+        for addon in self._addons:
+            statuses = [status for (name, _), status in self._status.items()
+                        if name == addon.name]
+            if FAILED in statuses:
+                status = FAILED
+            elif SKIPPED in statuses or not statuses:
+                status = SKIPPED
+            else:
+                status = DONE
+            results[addon.name] = {
+                'status': status,
+                'info': utils.to_json_data(addon.info),
+                'updated': time.time(),
+            }
+        return results
 
     def summary(self):
-        """ Print summary """
+        """ Print summary
+
+        Addons this run didn't process are taken from their records, so that
+        a filtered or sharded run still gets a complete summary. """
         print("Generating summary")
-        template_vars = {'addons': []}
+        addon_records = records.RecordStore(
+            self._args.working_directory).load()
         for addon in self._addons:
-            template_vars['addons'].append(addon.info)
-        TemplateProcessor.process('summary', self._args.working_directory,
-                                  template_vars)
-
-    def _compile_addons(self):
-        print("Compiling addons")
-        build_dir = os.path.join(self._args.working_directory, 'build')
+            addon_records[addon.name] = {'info': addon.info}
+        TemplateProcessor.process(
+            'summary', self._args.working_directory,
+            {'addons': records.summary_addons(addon_records),
+             'compiler_cache': self._compiler_cache_stats})
+
+    def _compile_addon(self, addon):
+        """ Compile a single addon to read info from the built library
+
+        Every addon has a build directory of its own, so that it can be
+        built as soon as its makefiles are generated.
+
+        An addon that shares its upstream repository with others is built
+        from a staged copy that fetches the core from the local mirror.
+
+        The builds running at the same time share the jobs of --build-jobs,
+        and the memory of --build-memory as far as their past builds tell.
+        An addon can ask for fewer jobs with 'build_jobs' in its config.
+        The outcome is kept in info['build'], failed or not.
+
+        With --incremental-build, the build tree is kept, and a build whose
+        inputs didn't change since it last succeeded isn't run at all, see
+        _get_build_fingerprints().
+
+        With --artifact-cache, a library that was built from the same inputs
+        before is taken from the cache instead of building it, see
+        _get_artifact_key(). A library that isn't there yet is added once it
+        has been probed, see _generate_metadata(). """
+        print("Compiling addon {}".format(addon.name))
+        addon.info['build'] = {'status': FAILED, 'jobs': 0, 'duration': 0.0,
+                               'memory': None, 'error': None,
+                               'up_to_date': False, 'cached': False}
+        command = self._get_configure_command(addon)
+        environment = self._compiler_cache.environment() \
+            if self._compiler_cache else {}
+        upstream = addon.get_upstream_revision() \
+            if self._args.incremental_build or self._artifacts else None
+        fingerprints = self._get_build_fingerprints(
+            addon, command, upstream, environment) \
+            if self._args.incremental_build else None
+        key = self._get_artifact_key(addon, upstream) \
+            if self._artifacts and upstream is not None else None
+
+        if fingerprints and self._is_up_to_date(addon, fingerprints):
+            print("Build of {} is up to date".format(addon.name))
+            addon.info['build'].update(status=DONE, up_to_date=True)
+        elif key and self._restore_artifact(addon, key):
+            print("Using cached build of {}".format(addon.name))
+            addon.info['build'].update(status=DONE, cached=True)
+            return
+        else:
+            self._build_addon(addon, command, fingerprints, environment)
+        if key:
+            self._artifact_keys[addon.name] = key
+
+    def _build_addon(self, addon, command, fingerprints, environment):
+        """ Build a single addon with its share of the job budget """
+        jobs = self._budget.share(min(self._args.jobs, len(self._addons)))
+        jobs = min(jobs, addon.info['config'].get('build_jobs', jobs))
+        with self._budget.acquire(
+                jobs, self._history.predict_memory(addon.name)) as jobs:
+            start = time.monotonic()
+            try:
+                addon.info['build']['jobs'] = jobs
+                addon.info['build']['memory'] = self._run_build(
+                    addon, command, jobs, fingerprints, environment)
+            except Exception as err:
+                addon.info['build']['error'] = str(err)
+                raise
+            else:
+                addon.info['build']['status'] = DONE
+            finally:
+                end = time.monotonic()
+                addon.info['build']['duration'] = end - start
+                self._builds[addon.name] = (start, end)
+        self._history.record(addon.name, addon.info['build']['duration'],
+                             addon.info['build']['memory'])
+
+    def _get_configure_command(self, addon):
+        """ The cmake command configuring the build of a single addon """
+        source_prefix = self._args.working_directory
+        url = self._sources.get_url(addon.upstream) if self._sources else None
+        if url:
+            source_prefix = addon.stage(
+                os.path.join(self._args.working_directory, 'staging'), url)
         install_dir = os.path.join(self._args.working_directory, 'install')
         cmake_dir = os.path.join(self._args.kodi_directory, 'cmake', 'addons')
-        utils.ensure_directory_exists(build_dir, clean=True)
-        addons = '|'.join(['{}$'.format(addon.name) for addon in self._addons])
+        return [os.environ.get('CMAKE', 'cmake'),
+                '-DADDONS_TO_BUILD={}$'.format(addon.name),
+                '-DADDON_SRC_PREFIX={}'.format(source_prefix),
+                '-DCMAKE_BUILD_TYPE={}'.format(self._args.buildtype),
+                '-DPACKAGE_ZIP=1',
+                '-DCMAKE_INSTALL_PREFIX={}'.format(install_dir),
+                cmake_dir]
+
+    def _get_artifact_key(self, addon, upstream):
+        """ Fingerprint of everything that goes into the library of an addon
+
+        That's the upstream revision, the addon's config (with its
+        cmake_options), the build type, the generated depends files and the
+        platform built on. """
+        return get_fingerprint(
+            addon.name, ADDONS[addon.game_name], self._args.buildtype,
+            hash_directory(os.path.join(self._args.working_directory,
+                                        addon.name, 'depends')),
+            upstream, sys.platform, platform.machine())
+
+    def _restore_artifact(self, addon, key):
+        """ Take the library of an addon from the artifact cache, returns
+            whether it was there """
+        artifact = self._artifacts.restore(key, os.path.join(
+            self._args.working_directory, addon.info['library']['file']))
+        if artifact is None:
+            return False
+        addon.library_probe, source_data = artifact
+        addon.info['libretro_repo'].update(source_data)
+        return True
+
+    @staticmethod
+    def _get_build_fingerprints(addon, command, upstream, environment=None):
+        """ Fingerprints of what the configuration and the build of an
+            addon depend on
+
+        The configuration depends on the cmake command, the environment it
+        is run with on top of the inherited one and the generated depends
+        files the core is fetched with, the build on top of that on the
+        upstream revision. The build fingerprint is None if the upstream
+        repository can't be reached. """
+        source_prefix = next(arg.split('=', 1)[1] for arg in command
+                             if arg.startswith('-DADDON_SRC_PREFIX='))
+        configure = get_fingerprint(command, environment or {}, hash_directory(
+            os.path.join(source_prefix, addon.name, 'depends')))
+        build = get_fingerprint(configure, upstream) \
+            if upstream is not None else None
+        return {'configure': configure, 'build': build}
+
+    def _is_up_to_date(self, addon, fingerprints):
+        """ Whether the last build of an addon had the same inputs and its
+            library is still there """
+        state = utils.read_json(
+            os.path.join(addon.build_directory, BUILD_STATE), {})
+        return fingerprints['build'] is not None and \
+            state.get('build') == fingerprints['build'] and \
+            os.path.isfile(os.path.join(self._args.working_directory,
+                                        addon.info['library']['file']))
+
+    @staticmethod
+    def _run_build(addon, command, jobs, fingerprints=None, environment=None):
+        """ Configure and build a single addon with up to jobs jobs
+
+        With fingerprints, the build tree is kept, and only configured again
+        if the configure fingerprint changed; they are written once the
+        build succeeded. environment is added to the environment of both.
+
+        Returns the peak memory of the largest process of the build, see
+        utils.run_measured(). """
+        state_path = os.path.join(addon.build_directory, BUILD_STATE)
+        state = {}
+        if fingerprints:
+            utils.ensure_directory_exists(addon.build_directory)
+            state = utils.read_json(state_path, {})
+            # Until the build succeeds, it must be run again
+            if os.path.isfile(state_path):
+                os.unlink(state_path)
+        else:
+            utils.ensure_directory_exists(addon.build_directory, clean=True)
         try:
-            subprocess.run([os.environ.get('CMAKE', 'cmake'),
-                            '-DADDONS_TO_BUILD={}'.format(addons),
-                            '-DADDON_SRC_PREFIX={}'
-                            .format(self._args.working_directory),
-                            '-DCMAKE_BUILD_TYPE={}'
-                            .format(self._args.buildtype),
-                            '-DPACKAGE_ZIP=1',
-                            '-DCMAKE_INSTALL_PREFIX={}'.format(install_dir),
-                            cmake_dir], cwd=build_dir, check=True)
-            subprocess.run([os.environ.get('CMAKE', 'cmake'), '--build', '.',
-                            '--', '-j{}'.format(multiprocessing.cpu_count())],
-                           cwd=build_dir, check=True)
+            if not fingerprints or \
+                    state.get('configure') != fingerprints['configure']:
+                with tracing.span('configure', tracing.BUILD):
+                    utils.run_measured(command, cwd=addon.build_directory,
+                                       env=dict(os.environ,
+                                                **(environment or {})))
+            # The core's own make picks up BUILDTHREADS
+            with tracing.span('compile', tracing.BUILD):
+                memory = utils.run_measured(
+                    [os.environ.get('CMAKE', 'cmake'), '--build', '.', '--',
+                     '-j{}'.format(jobs)],
+                    cwd=addon.build_directory,
+                    env=dict(os.environ, BUILDTHREADS=str(jobs),
+                             **(environment or {})))
         except subprocess.CalledProcessError:
             print("Compilation failed!")
-            return False
-        return True
+            raise
+        if fingerprints:
+            utils.write_json(state_path, fingerprints)
+        return memory
 
 
-class KodiGameAddon():
+class KodiGameAddon():  # pylint: disable=too-many-public-methods
     """ Process a single Kodi Game addon """
     # pylint 3.3 split the positional half of too-many-arguments out into
     # too-many-positional-arguments, so the existing disable stopped covering it
     def __init__(self, addon_name,  # pylint: disable=too-many-arguments,too-many-positional-arguments
-                 game_name, githubrepo, working_directory, push_branch):
+                 game_name, githubrepo, working_directory, push_branch,
+                 alternates=None):
+        """ alternates: objects directory the repository borrows objects
+            from, see SharedObjectStore """
         self.name = addon_name
         self.game_name = game_name
 
-        self._repo = GitRepo(githubrepo, working_directory)
+        # The repository is opened (or created) once it's needed, which a
+        # plan never does
+        self._repo_args = (githubrepo, working_directory, alternates)
+        self._gitrepo = None
         self._working_directory = working_directory
         self._path = os.path.join(working_directory, addon_name)
+        self.build_directory = os.path.join(working_directory, 'build',
+                                            addon_name)
+        # With a dict, files are rendered into it instead of being written,
+        # see planned_changes()
+        self.plan = None
+        # What probing the library found, if it came from the artifact cache
+        self.library_probe = None
 
         addon_config = ADDONS[game_name]
         self.info = {
@@ -322,15 +1209,120 @@ class KodiGameAddon():
             'git': {},
         }
 
+    @property
+    def upstream(self):
+        """ The libretro repository the core is built from, as (org, name) """
+        return (self.info['libretro_repo']['org'],
+                self.info['libretro_repo']['name'])
+
+    def stage(self, staging_directory, url):
+        """ Copy the addon to staging_directory, fetching the core from url
+
+        The copy is what gets built, so that the addon itself -- which is
+        committed -- never refers to a local path. Returns
+        staging_directory. """
+        destination = os.path.join(staging_directory, self.name)
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(self._path, destination,
+                        ignore=shutil.ignore_patterns('.git'))
+
+        # Either "name url revision..." or "name url-of-archive"
+        depends_path = os.path.join(destination, 'depends', 'common',
+                                    self.game_name,
+                                    '{}.txt'.format(self.game_name))
+        with open(depends_path, 'r', encoding='utf-8') as depends_ctx:
+            parts = depends_ctx.read().split()
+        match = re.search(r'/archive/([0-9a-f]+)\.tar\.gz$', parts[1])
+        if match:
+            parts.append(match.group(1))
+        parts[1] = url
+        with open(depends_path, 'w', encoding='utf-8') as depends_ctx:
+            depends_ctx.write('{}\n'.format(' '.join(parts)))
+        return staging_directory
+
+    @property
+    def _repo(self):
+        """ The repository of the addon, opened (or created) on first use """
+        if self._gitrepo is None:
+            self._gitrepo = GitRepo(*self._repo_args)
+        return self._gitrepo
+
+    def get_state(self, stage):
+        """ State of what a stage leaves behind, to tell if it's still there
+
+        That's the commit the checkout is at, and for the build the
+        library. """
+        state = {'head': self._repo.get_hexsha()}
+        if stage == BUILD:
+            state['library'] = utils.file_state(os.path.join(
+                self._working_directory, self.info['library']['file']))
+        return state
+
+    def get_upstream_revision(self):
+        """ What the upstream branch the core is built from points at, or
+            all tags for cores built from their latest tag
+
+        Returns None if the upstream repository can't be reached. """
+        repo = self.info['libretro_repo']
+        refs = GitRepo.list_remote('https://github.com/{}/{}'.format(
+            repo['org'], repo['name']))
+        if refs is None:
+            return None
+        if repo['git_tag']:
+            return {ref: hexsha for ref, hexsha in refs.items()
+                    if ref.startswith('refs/tags/')}
+        return refs.get('refs/heads/{}'.format(repo['branch']), '')
+
+    def get_fingerprint(self, run_fingerprint):
+        """ Fingerprint of everything the addon's generated files depend on
+
+        Next to run_fingerprint, that's the addon's config, the upstream
+        revision it's built from, the libretro-super info file, the built
+        library and the files in the checkout.
+
+        Returns None if the upstream repository can't be reached, as there's
+        then no telling whether it changed. """
+        upstream = self.get_upstream_revision()
+        if upstream is None:
+            return None
+        return get_fingerprint(
+            run_fingerprint, ADDONS[self.game_name], upstream,
+            hash_files([
+                LibretroSuper(self._working_directory).get_info_file_path(
+                    self.info['library']['soname']),
+                os.path.join(self._working_directory,
+                             self.info['library']['file'])]),
+            hash_directory(self._path))
+
     def process_description_files(self, kodi_directory):
         """ Generate addon description files """
-        kodi_addon_dir = os.path.join(
-            kodi_directory, KodiAddonDescriptions.DESCRIPTION_PATH, self.name)
-        TemplateProcessor.process('description', kodi_addon_dir, self.info)
+        self._process_files('description', kodi_directory, os.path.join(
+            KodiAddonDescriptions.DESCRIPTION_PATH, self.name))
 
     def process_addon_files(self):
         """ Generate addon files """
-        TemplateProcessor.process('addon', self._path, self.info)
+        self._process_files('addon', self._working_directory, self.name)
+
+    def _process_files(self, template_dir, root, directory):
+        """ Generate files into root/directory, or into the plan """
+        destination = os.path.join(root, directory)
+        if self.plan is None:
+            TemplateProcessor.process(template_dir, destination, self.info)
+        else:
+            TemplateProcessor.plan(
+                template_dir, destination, self.info,
+                self.plan.setdefault((root, directory), {}))
+
+    def planned_changes(self):
+        """ Changes the files rendered into the plan make to the disk
+
+        Returns a list of template_processor.Change, with paths relative to
+        the working directory or Kodi's source directory. """
+        changes = []
+        for (root, directory), tree in sorted(self.plan.items()):
+            changes.extend(TemplateProcessor.compare(
+                os.path.join(root, directory), tree, prefix=directory))
+        return changes
 
     def load_addon_xml(self):
         """ Load metadata from addon.xml.in """
@@ -373,7 +1365,7 @@ class KodiGameAddon():
         library_path = os.path.join(self._working_directory,
                                     self.info['library']['file'])
         try:
-            library = LibretroWrapper(library_path)
+            library = LibretroWrapper(library_path, self.library_probe)
             self.info['library']['loaded'] = True
             self.info['system_info'] = library.system_info
             self._apply_libretro_info_defaults(library.system_info)
@@ -439,15 +1431,14 @@ class KodiGameAddon():
     def load_git_tag(self):
         """ Get the latest git tag from the libretro repository """
         if self.info['libretro_repo']['git_tag']:
-            repo = GitHubOrg(
-                self.info['libretro_repo']['org'], auth=True).get_repo(
+            self.info['libretro_repo']['branch'] = GitHubOrg(
+                self.info['libretro_repo']['org'], auth=True).get_latest_tag(
                     self.info['libretro_repo']['name'])
-            self.info['libretro_repo']['branch'] = repo.get_tags()[0].name
 
     def load_git_revision(self):
         """ Get the revision of the libretro core from the Git checkout """
-        path = os.path.join(self._working_directory,
-                            'build', 'build', self.game_name, 'src')
+        path = os.path.join(self.build_directory,
+                            'build', self.game_name, 'src')
         if GitRepo.is_git_repo(os.path.join(path, self.game_name)):
             gitrepo = GitRepo(GitHubRepo(self.game_name, '', ''), path)
             self.info['libretro_repo']['hexsha'] = gitrepo.get_hexsha()
@@ -456,12 +1447,19 @@ class KodiGameAddon():
         """ Load game version from compiled library and git """
         self.info['game']['version'] = AddonVersion.get(
             self.info['system_info']['version'])
-        git_tag = self._repo.describe()
+        git_tag = self._repo.describe() if self.plan is None else \
+            GitRepo.describe_path(self._path)
         match = re.search(r'^(?:[0-9]+\.){3}([0-9]+)', git_tag)
         pkg_version = match.group(1) if match else '0'
         self.info['game']['version'] = '{}.{}'.format(
             self.info['game']['version'], pkg_version)
 
+    def get_source_data(self):
+        """ What was read from the checkout of the core, see
+            load_git_revision() and load_exclude_platforms() """
+        return {key: self.info['libretro_repo'][key]
+                for key in ('hexsha', 'exclude_platforms')}
+
     def load_exclude_platforms(self):
         """ Load excluded platforms """
         bad = (r"APP_STL\s*:=\s*"
@@ -469,7 +1467,7 @@ class KodiGameAddon():
                r"|"
                r"NDK_TOOLCHAIN_VERSION\s*:=\s*4\.9")
         if self.info['makefile']['jni']:
-            filename = os.path.join(self._working_directory, 'build', 'build',
+            filename = os.path.join(self.build_directory, 'build',
                                     self.game_name, 'src', self.game_name,
                                     self.info['makefile']['jni'],
                                     'Application.mk')
@@ -505,10 +1503,15 @@ class KodiGameAddon():
             for path in changed_paths
         )
 
-    def fetch_and_reset(self, *, reset):
+    def fetch(self):
+        """ Fetching Git repository """
+        print("  Fetching Git repository {}".format(self.name))
+        self._repo.fetch()
+
+    def fetch_and_reset(self, *, reset, fetch=True):
         """ Fetching & resetting Git repository """
         print("  Fetching & resetting Git repository {}".format(self.name))
-        self._repo.fetch_and_reset(reset=reset)
+        self._repo.fetch_and_reset(reset=reset, fetch=fetch)
 
     def commit(self, *, squash):
         """ Commiting changes to Git repository """
@@ -523,11 +1526,17 @@ class KodiGameAddon():
         for branch in ['Omega']:
             self._repo.tag('{}-{}'.format(self.info['game']['version'], branch))
 
-    def push(self):
+    def stage_push(self):
+        """ Uploading changes to GitHub repository ahead of pushing them """
+        print("  Uploading changes to GitHub repository {}".format(
+            self.name))
+        self._repo.stage_push()
+
+    def push(self, staged=False):
         """ Pushing changes to GitHub repository """
         print("  Pushing changes to GitHub repository {}".format(self.name))
         branch = self.info['game']['branch']
-        self._repo.push(branch, tags=(branch == 'master'), sleep=1)
+        self._repo.push(branch, tags=(branch == 'master'), staged=staged)
 
     def _get_addon_summary(self) -> str:
         """ Helper method to generate an add-on summary from its name and version """
@@ -0,0 +1,123 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Profile a stage of the addons with cProfile """
+
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import tempfile
+import threading
+
+from . import utils
+
+# Tells a helper process where to write its profile
+PROFILE_ENV = 'KODI_GAME_SCRIPTING_PROFILE'
+
+_LOCAL = threading.local()
+
+
+class StageProfiler:
+    """ Runs one stage of every addon under cProfile
+
+        The profile of each addon is written to
+        <working directory>/profiles/<stage>/<addon>.pstats as soon as its
+        stage is done, and write_aggregate() adds them all up in
+        <working directory>/profiles/<stage>.pstats.
+
+        Python allows only one profiler at a time (3.12 and later enforce
+        that), so profiled stages run one at a time, even with --jobs. """
+
+    DIRECTORY = 'profiles'
+
+    def __init__(self, working_directory, stage):
+        self.stage = stage
+        self._directory = os.path.join(working_directory, self.DIRECTORY)
+        self._paths = []
+        self._lock = threading.Lock()
+        utils.ensure_directory_exists(
+            os.path.join(self._directory, stage), clean=True)
+
+    def run(self, addon_name, func):
+        """ Run the stage of an addon under the profiler """
+        with self._lock:
+            profile = cProfile.Profile()
+            _LOCAL.children = []
+            try:
+                profile.runcall(func)
+            finally:
+                children, _LOCAL.children = _LOCAL.children, None
+                stats = pstats.Stats(profile)
+                for child in children:
+                    if os.path.getsize(child):
+                        stats.add(child)
+                    os.unlink(child)
+                path = os.path.join(self._directory, self.stage,
+                                    '{}.pstats'.format(addon_name))
+                stats.dump_stats(path)
+                self._paths.append(path)
+
+    def write_aggregate(self, limit=20):
+        """ Add up the profiles of all addons and print the top functions
+
+        Returns the path of the aggregated profile, or None if no stage was
+        profiled. """
+        if not self._paths:
+            return None
+        path = os.path.join(self._directory,
+                            '{}.pstats'.format(self.stage))
+        stats = pstats.Stats(*self._paths, stream=sys.stdout)
+        stats.dump_stats(path)
+        print("Profile of stage {} written to {}".format(self.stage, path))
+        stats.sort_stats('cumulative').print_stats(limit)
+        return path
+
+
+@contextlib.contextmanager
+def child_profile(environment):
+    """ Profile a helper process, if this thread is being profiled
+
+    Adds the variable telling the helper where to write its profile to
+    environment, and adds the profile to this thread's once the helper is
+    done. Helpers call profile_to() to honor it. """
+    children = getattr(_LOCAL, 'children', None)
+    if children is None:
+        yield
+        return
+
+    handle, path = tempfile.mkstemp(suffix='.pstats')
+    os.close(handle)
+    environment[PROFILE_ENV] = path
+    children.append(path)
+    yield
+
+
+@contextlib.contextmanager
+def profile_to(path):
+    """ Profile the body of the with statement into path, unless it's None """
+    if not path:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
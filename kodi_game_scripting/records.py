@@ -0,0 +1,93 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Metadata records of processed addons, for the summary """
+
+import os
+import time
+
+from . import utils
+from .config import ADDONS
+from .scheduler import DONE
+
+
+class RecordStore:
+    """ The metadata of every addon, as of the last time it was processed
+
+        A run only processes some of the addons when it's filtered or
+        sharded. Keeping a record of each addon lets the summary cover all
+        of them anyway.
+
+        A record is a dict with 'updated', the time it was written, and
+        'info', the addon's metadata. """
+
+    DIRECTORY = 'records'
+
+    def __init__(self, working_directory):
+        self._directory = os.path.join(working_directory, self.DIRECTORY)
+
+    def save(self, addon_name, info):
+        """ Write the record of an addon """
+        utils.write_json(
+            os.path.join(self._directory, '{}.json'.format(addon_name)),
+            {'updated': time.time(), 'info': utils.to_json_data(info)})
+
+    def load(self):
+        """ Read all records, returns a dict of addon names to records """
+        records = {}
+        if os.path.isdir(self._directory):
+            for filename in sorted(os.listdir(self._directory)):
+                if filename.endswith('.json'):
+                    record = utils.read_json(
+                        os.path.join(self._directory, filename))
+                    if record:
+                        records[filename[:-len('.json')]] = record
+        return records
+
+
+def read_records(path):
+    """ Read the records of a working directory or a shard result file
+
+    Addons a shard didn't process successfully have no record. """
+    if os.path.isdir(path):
+        return RecordStore(path).load()
+
+    result = utils.read_json(path)
+    if result is None:
+        raise ValueError("Can't read records from {}".format(path))
+    return {name: {'updated': entry['updated'], 'info': entry['info']}
+            for name, entry in result['addons'].items()
+            if entry['status'] == DONE}
+
+
+def merge(*sources):
+    """ Merge dicts of records, keeping the latest record of each addon """
+    merged = {}
+    for records in sources:
+        for name, record in records.items():
+            if name not in merged or \
+                    record['updated'] > merged[name]['updated']:
+                merged[name] = record
+    return merged
+
+
+def summary_addons(records):
+    """ The metadata to render the summary from, in the usual order
+
+    Addons that were removed from config.py are left out. """
+    infos = [record['info'] for record in records.values()
+             if record['info']['game']['name'] in ADDONS]
+    return sorted(infos, key=lambda info: info['game']['name'])
@@ -0,0 +1,67 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Stream the results of each addon as they become known """
+
+import datetime
+import json
+import threading
+
+
+class ResultsLog:
+    """ Appends a JSON line per addon and completed stage to a file
+
+        Each line is flushed right away, so that others can follow the file
+        while the run is still going. A line only holds what's cheap to get
+        from the addon's metadata at that point. """
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+        self._lock = threading.Lock()
+
+    def close(self):
+        """ Close the file """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, addon_name, stage, info, error=None):
+        """ Append the result of a stage, which failed if error is given
+
+        A library that fails to load doesn't fail the stage, but its error
+        is reported all the same. """
+        library = info.get('library', {})
+        status = 'failed' if error else 'done'
+        error = error or library.get('error')
+        line = json.dumps({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'addon': addon_name,
+            'stage': stage,
+            'status': status,
+            'version': info.get('game', {}).get('version'),
+            'library_loaded': library.get('loaded', False),
+            'options': len(info.get('settings', [])),
+            'error': str(error) if error else None,
+            'diff': bool(info.get('git', {}).get('diff')),
+        }, sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
@@ -0,0 +1,183 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Retry what fails because of the network, and pace pushes """
+
+import email.utils
+import random
+import re
+import threading
+import time
+
+import git
+import github
+import requests
+
+# Attempts of a call by default, the first one included
+DEFAULT_ATTEMPTS = 5
+# Seconds waited before the first retry, doubled for every further one
+BASE_DELAY = 1.0
+# Longest wait between two attempts, unless GitHub asks for longer
+MAX_DELAY = 60.0
+# Longest wait for a rate limit to reset
+MAX_RATE_LIMIT_WAIT = 15 * 60.0
+
+# What git prints when the network, rather than the command, failed
+_TRANSIENT_GIT_ERRORS = re.compile('|'.join([
+    r'Could not resolve host', r'Failed to connect', r'Connection refused',
+    r'Connection reset', r'Connection timed out', r'Operation timed out',
+    r'Temporary failure', r'early EOF', r'remote end hung up',
+    r'RPC failed', r'returned error: (?:429|5\d\d)', r'rate limit',
+    r'GnuTLS', r'SSL_']), re.IGNORECASE)
+
+
+def is_transient(err):
+    """ Whether trying again later might succeed where err failed """
+    if isinstance(err, github.RateLimitExceededException):
+        return True
+    if isinstance(err, github.GithubException):
+        return err.status == 429 or (err.status or 0) >= 500 or (
+            err.status == 403 and 'rate limit' in str(err.data).lower())
+    if isinstance(err, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(err, git.exc.GitCommandError):
+        return bool(_TRANSIENT_GIT_ERRORS.search(str(err)))
+    return False
+
+
+def get_requested_delay(err, now=None):
+    """ Seconds GitHub asked to wait before trying again, None if it didn't
+
+    That's the Retry-After header, or the time until the rate limit resets
+    once it is used up. """
+    headers = {key.lower(): value
+               for key, value in (getattr(err, 'headers', None) or {}).items()}
+    now = time.time() if now is None else now
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return min(float(retry_after), MAX_RATE_LIMIT_WAIT)
+        try:
+            return min(max(0.0, email.utils.parsedate_to_datetime(
+                retry_after).timestamp() - now), MAX_RATE_LIMIT_WAIT)
+        except (TypeError, ValueError):
+            pass
+    if headers.get('x-ratelimit-remaining') == '0' and \
+            headers.get('x-ratelimit-reset', '').isdigit():
+        return min(max(0.0, int(headers['x-ratelimit-reset']) - now),
+                   MAX_RATE_LIMIT_WAIT)
+    return None
+
+
+class RetryPolicy:
+    """ Calls that are tried again when they fail transiently
+
+        Between attempts, the policy waits as long as GitHub asked for, or
+        backs off exponentially, with jitter so that calls that failed
+        together don't come back together.
+
+        Paced calls (pushes, which GitHub limits on their own) are spread
+        out: they follow each other right away while they succeed, and each
+        failure widens the gap between them, which each success narrows
+        again. A wait GitHub asked for holds up all paced calls.
+
+        The policy that everything in a process shares is shared(). """
+
+    _shared = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """ The policy of this process, created on first use """
+        with cls._lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def configure(cls, attempts=DEFAULT_ATTEMPTS):
+        """ Replace the policy of this process """
+        with cls._lock:
+            cls._shared = cls(attempts)
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY):
+        self.attempts = max(1, attempts)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._interval = 0.0
+        self._next_start = 0.0
+        self._pace_lock = threading.Lock()
+
+    def get_delay(self, attempt, err):
+        """ Seconds to wait after the given attempt failed with err """
+        requested = get_requested_delay(err)
+        if requested is not None:
+            return requested + random.uniform(0, self._base_delay)
+        delay = min(self._max_delay, self._base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, description, func, *args, paced=False, **kwargs):
+        """ Call func(*args, **kwargs) until it succeeds, fails for good
+            or runs out of attempts, returns its result
+
+        description: what the call does, for the messages """
+        attempt = 1
+        while True:
+            if paced:
+                self._wait_turn()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                if attempt >= self.attempts or not is_transient(err):
+                    raise
+                delay = self.get_delay(attempt, err)
+                if paced:
+                    self._slow_down(delay)
+                print("{} failed, retrying in {:.1f}s ({}/{}): {}".format(
+                    description, delay, attempt, self.attempts - 1,
+                    str(err).strip().splitlines()[-1].strip()
+                    if str(err).strip() else type(err).__name__))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if paced:
+                self._speed_up()
+            return result
+
+    def _wait_turn(self):
+        """ Wait until the pacing lets the next paced call start """
+        with self._pace_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+    def _slow_down(self, delay):
+        """ Widen the gap between paced calls after one failed, and hold
+            them all up until delay passed """
+        with self._pace_lock:
+            self._interval = min(self._max_delay,
+                                 max(self._base_delay, self._interval * 2))
+            self._next_start = max(self._next_start,
+                                   time.monotonic() + delay)
+
+    def _speed_up(self):
+        """ Narrow the gap between paced calls after one succeeded """
+        with self._pace_lock:
+            self._interval = self._interval / 2 \
+                if self._interval >= self._base_delay / 4 else 0.0
@@ -0,0 +1,233 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Run tasks as soon as the tasks they depend on are done """
+
+import collections
+import concurrent.futures
+import contextlib
+import sys
+import threading
+import traceback
+
+from . import utils
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class TaskGraph:
+    """ A set of tasks and the tasks each of them depends on
+
+        Instead of running every task of one kind before moving on to the
+        next kind, a task starts as soon as everything it requires is done.
+        Independent chains of tasks -- one per addon -- thereby move at their
+        own pace, and the slowest chain sets the wall time rather than the sum
+        of the slowest task of every kind.
+
+        A task that fails takes the tasks that require it down with it, but
+        leaves every other chain alone. """
+
+    Task = collections.namedtuple(
+        'Task', 'name func requires after priority isolated index')
+
+    def __init__(self):
+        self._tasks = collections.OrderedDict()
+        self.status = {}
+
+    def add(self, name, func,  # pylint: disable=too-many-arguments,too-many-positional-arguments
+            requires=(), after=(), priority=0, isolated=False):
+        """ Add a task
+
+        requires: tasks that must have succeeded before this one runs
+        after: tasks that must have finished, successfully or not
+        priority: among ready tasks, higher priorities start first
+        isolated: a failure of this task doesn't end a fail_fast run
+
+        Tasks can only depend on tasks that were added before them, which
+        keeps the graph free of cycles. Ties are broken by the order tasks
+        were added in, so that a single job runs them in that order. """
+        if name in self._tasks:
+            raise ValueError("Task {} added twice".format(name))
+        for dependency in tuple(requires) + tuple(after):
+            if dependency not in self._tasks:
+                raise ValueError("Task {} depends on unknown task {}".format(
+                    name, dependency))
+        self._tasks[name] = self.Task(name, func, tuple(requires),
+                                      tuple(after), priority, isolated,
+                                      len(self._tasks))
+        return name
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def run(self, jobs=1, fail_fast=False):
+        """ Run all tasks using up to jobs worker threads
+
+        With fail_fast, no new task is started after the first failure of a
+        task that isn't isolated, and everything that didn't get to run is
+        skipped.
+
+        Returns True if every task succeeded. """
+        self.status = {}
+        pending = list(self._tasks.values())
+
+        if jobs <= 1:
+            # Run in this thread, so that output streams as it is printed
+            while pending:
+                pending = self._skip_unreachable(pending, fail_fast)
+                ready = self._ready(pending)
+                if not ready:
+                    break
+                task = ready[0]
+                pending.remove(task)
+                self._finish(task, *self._execute(task, capture=False))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+                running = {}
+                while pending or running:
+                    pending = self._skip_unreachable(pending, fail_fast)
+                    for task in self._ready(pending)[:jobs - len(running)]:
+                        pending.remove(task)
+                        running[executor.submit(self._execute, task)] = task
+                    if not running:
+                        break
+                    finished, _ = concurrent.futures.wait(
+                        running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        self._finish(running.pop(future), *future.result())
+
+        for task in pending:
+            self.status[task.name] = SKIPPED
+        return all(status == DONE for status in self.status.values())
+
+    def _ready(self, pending):
+        """ Pending tasks whose dependencies are met, best first """
+        ready = [task for task in pending
+                 if all(self.status.get(name) == DONE
+                        for name in task.requires)
+                 and all(name in self.status for name in task.after)]
+        return sorted(ready, key=lambda task: (-task.priority, task.index))
+
+    def _skip_unreachable(self, pending, fail_fast):
+        """ Skip tasks that can't run any more, returns what's left """
+        if fail_fast and any(
+                status == FAILED and not self._tasks[name].isolated
+                for name, status in self.status.items()):
+            for task in pending:
+                self.status[task.name] = SKIPPED
+            return []
+
+        remaining = []
+        for task in pending:
+            if any(self.status.get(name) in (FAILED, SKIPPED)
+                   for name in task.requires):
+                print("Skipping {}".format(self._describe(task)))
+                self.status[task.name] = SKIPPED
+            else:
+                remaining.append(task)
+        return remaining
+
+    @classmethod
+    def _execute(cls, task, capture=True):
+        """ Run a task, returns (error, output) """
+        if not capture:
+            try:
+                task.func()
+            except Exception as err:  # pylint: disable=broad-except
+                traceback.print_exc(file=sys.stdout)
+                return err, ''
+            return None, ''
+
+        with utils.captured_output() as output:
+            try:
+                task.func()
+            except Exception as err:  # pylint: disable=broad-except
+                traceback.print_exc(file=output)
+                return err, output.getvalue()
+        return None, output.getvalue()
+
+    def _finish(self, task, err, output):
+        """ Record the outcome of a task and print what it printed """
+        sys.stdout.write(output)
+        if err:
+            print("Failed {}: {}".format(self._describe(task), err))
+        self.status[task.name] = FAILED if err else DONE
+
+    @staticmethod
+    def _describe(task):
+        """ Human readable name of a task """
+        if isinstance(task.name, tuple):
+            return ' '.join(str(part) for part in task.name)
+        return str(task.name)
+
+
+class JobBudget:
+    """ A number of jobs that tasks running side by side take a share of
+
+        A task running a parallel build takes its share for as long as the
+        build runs, so that the builds of all tasks together don't start
+        more processes than there are jobs. A task asking for more jobs than
+        are left waits until other tasks give theirs back.
+
+        With a memory budget, the jobs also take the memory they are
+        expected to need, and a task waits until that is left as well. A
+        task is let in when nothing else runs, whatever it needs. """
+
+    def __init__(self, total, memory=None):
+        self.total = max(1, total)
+        self.memory = memory
+        self._available = self.total
+        self._memory_used = 0
+        self._condition = threading.Condition()
+
+    def share(self, tasks):
+        """ The jobs each of a number of tasks running at once can have """
+        return max(1, self.total // max(1, tasks))
+
+    @contextlib.contextmanager
+    def acquire(self, count, memory_per_job=0):
+        """ Take count jobs for the body of the with statement
+
+        No more than the total is ever taken, and no more jobs than the
+        memory budget fits. Yields the jobs taken. """
+        count = min(max(1, count), self.total)
+        if self.memory and memory_per_job:
+            count = min(count, max(1, int(self.memory // memory_per_job)))
+        memory = count * memory_per_job if self.memory else 0
+
+        def admissible():
+            if self._available == self.total:
+                return True
+            return self._available >= count and \
+                self._memory_used + memory <= (self.memory or 0)
+
+        with self._condition:
+            self._condition.wait_for(admissible)
+            self._available -= count
+            self._memory_used += memory
+        try:
+            yield count
+        finally:
+            with self._condition:
+                self._available += count
+                self._memory_used -= memory
+                self._condition.notify_all()
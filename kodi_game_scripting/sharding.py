@@ -0,0 +1,79 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Split the addons across a number of machines """
+
+import argparse
+import os
+
+from . import utils
+
+
+def parse_shard(value):
+    """ Parse I/N, the I-th of N shards counting from 1, into (I, N) """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Shard must look like I/N, not {}".format(value)) from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            "Shard {value} is not one of 1/{count} to {count}/{count}".format(
+                value=value, count=count))
+    return index, count
+
+
+def load_weights(path):
+    """ Load the cost of each addon from a JSON file
+
+    That's either a dict of addon names to costs, or a trace written by
+    --trace, whose stage timings are added up per addon. """
+    data = utils.read_json(path)
+    if data is None:
+        raise ValueError("Can't read shard weights from {}".format(path))
+    if 'traceEvents' in data:
+        return {addon: sum(stages.values()) for addon, stages
+                in data['summary']['addons'].items()}
+    return {addon: float(cost) for addon, cost in data.items()}
+
+
+def partition(names, count, weights=None):
+    """ Split names into count lists of about the same cost
+
+    The costliest name goes to the cheapest list first (longest processing
+    time first). Names without a weight cost the average weight; without
+    weights, every name costs the same and the lists take turns.
+
+    The result only depends on the names and weights given, never on their
+    order, so every machine computes the same partition. """
+    weights = weights or {}
+    known = [weights[name] for name in names if name in weights]
+    default = sum(known) / len(known) if known else 1.0
+
+    shards = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for name in sorted(names, key=lambda name: (-weights.get(name, default),
+                                                name)):
+        index = loads.index(min(loads))
+        shards[index].append(name)
+        loads[index] += weights.get(name, default)
+    return [sorted(shard) for shard in shards]
+
+
+def get_result_path(working_directory, index, count):
+    """ Path of the result file a shard writes """
+    return os.path.join(working_directory, 'results',
+                        'shard-{}-of-{}.json'.format(index, count))
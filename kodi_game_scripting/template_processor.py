@@ -16,12 +16,15 @@
 
 """ Process Jinja2 templates """
 
+import collections
+import difflib
+import functools
 import os
 import re
-import shutil
 
 import jinja2
 
+from . import tracing
 from . import utils
 
 TEMPLATE_DIR = os.path.join(
@@ -77,21 +80,52 @@ def escape_po(string):
     )
 
 
+class _TreeUndefined(jinja2.Undefined):
+    """ Undefined values that can be indexed further, staying undefined """
+    def __getitem__(self, key):
+        return self
+
+    def __getattr__(self, key):
+        return self
+
+
+Change = collections.namedtuple('Change', 'path action diff')
+
+# Actions of a Change
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+
 class TemplateProcessor:
-    """ Process Jinja2 templates """
+    """ Process Jinja2 templates
+
+        Templates are rendered into a tree: a dict of the paths of the files
+        below a destination directory to their content, or to None for files
+        that are to be removed. process() writes the tree to disk right away,
+        while plan() lets a number of renders build up a tree in memory,
+        which compare() then holds against what's on disk. """
 
     @classmethod
+    @tracing.traced(tracing.TEMPLATE)
     def process(cls, template_dir, destination, template_vars):
         """ Process templates """
+        cls.write(destination, cls.render(template_dir, destination,
+                                          template_vars))
 
-        class _TreeUndefined(jinja2.Undefined):
-            def __getitem__(self, key):
-                return self
+    @classmethod
+    @tracing.traced(tracing.TEMPLATE)
+    def plan(cls, template_dir, destination, template_vars, tree):
+        """ Process templates into tree instead of the destination """
+        cls.render(template_dir, destination, template_vars, tree)
 
-            def __getattr__(self, key):
-                return self
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _get_environment(template_dir):
+        """ Jinja2 environment of a template directory
 
-        template_dir = os.path.join(TEMPLATE_DIR, template_dir)
+        Environments are kept, so that templates are only compiled once. The
+        loader still picks up templates that changed. """
         template_env = jinja2.Environment(
             loader=jinja2.FileSystemLoader(template_dir),
             trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True,
@@ -101,13 +135,40 @@ class TemplateProcessor:
         template_env.filters["get_list"] = get_list
         template_env.filters["escape_xml"] = escape_xml
         template_env.filters["escape_po"] = escape_po
+        return template_env
+
+    @staticmethod
+    def _read(destination, tree, path):
+        """ Content of a file, as rendered into tree or else on disk """
+        if path in tree:
+            content = tree[path]
+            return content.decode('utf-8') if isinstance(content, bytes) \
+                else content
+        try:
+            with open(os.path.join(destination, path), 'r',
+                      encoding='utf-8') as file_ctx:
+                return file_ctx.read()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def render(cls, template_dir, destination, template_vars, tree=None):
+        """ Render templates into tree, returns the tree
+
+        Existing files are read from the tree, or from destination for
+        those that aren't in the tree. """
+        if tree is None:
+            tree = {}
+        template_dir = os.path.join(TEMPLATE_DIR, template_dir)
+        template_env = cls._get_environment(template_dir)
 
         # Loop over all templates
         for infile in utils.list_all_files(template_dir):
 
             # Files may have templatized names
             if '{{' in infile and '}}' in infile:
-                outfile = jinja2.Template(infile).render(template_vars)
+                outfile = template_env.from_string(infile).render(
+                    template_vars)
             else:
                 outfile = infile
             outfile_name, extension = os.path.splitext(outfile)
@@ -115,38 +176,84 @@ class TemplateProcessor:
             # Files that end with .j2 are templates
             if extension == '.j2':
                 print("  Generating {}".format(outfile_name))
-                outfile_path = os.path.join(destination, outfile_name)
 
                 # Make content of already existing XML files available in
                 # the template. That way templates can decide what data to keep
                 # or override.
-                if '.xml' in infile and os.path.isfile(outfile_path):
-                    xml_data = utils.get_xml_data(outfile_path)
-                    template_vars.update({'xml': xml_data})
+                if '.xml' in infile:
+                    existing = cls._read(destination, tree, outfile_name)
+                    if existing is not None:
+                        template_vars.update(
+                            {'xml': utils.parse_xml_data(existing)})
 
                 # Make the datetime of strings files the existing datetime
-                if '.po' in infile and os.path.isfile(outfile_path):
-                    with open(outfile_path, 'r', encoding='utf-8') as stringsfile_ctx:
-                        strings_content = stringsfile_ctx.read()
-
-                    datere = re.compile(r'"POT-Creation-Date: (.*)\\n"')
-                    timestamp = datere.search(strings_content).group(1)
-                    template_vars.update({'datetime': timestamp})
+                if '.po' in infile:
+                    existing = cls._read(destination, tree, outfile_name)
+                    if existing is not None:
+                        datere = re.compile(r'"POT-Creation-Date: (.*)\\n"')
+                        timestamp = datere.search(existing).group(1)
+                        template_vars.update({'datetime': timestamp})
 
                 template = template_env.get_template(infile)
                 content = template.render(template_vars, regex_replace=regex_replace)
-                if content:
-                    utils.ensure_directory_exists(
-                        os.path.dirname(os.path.join(destination, outfile)))
-                    with open(outfile_path, 'w', encoding='utf-8') as outfile_ctx:
-                        outfile_ctx.write(content)
-                elif os.path.exists(outfile_path):
-                    os.remove(outfile_path)
+                tree[outfile_name] = content or None
 
             # Other files are just copied
             else:
                 print("     Copying {}{}".format(outfile_name, extension))
-                utils.ensure_directory_exists(
-                    os.path.dirname(os.path.join(destination, outfile)))
-                shutil.copyfile(os.path.join(template_dir, infile),
-                                os.path.join(destination, outfile))
+                with open(os.path.join(template_dir, infile), 'rb') as infile_ctx:
+                    tree[outfile] = infile_ctx.read()
+        return tree
+
+    @staticmethod
+    def write(destination, tree):
+        """ Write a tree to destination """
+        for path, content in tree.items():
+            outfile_path = os.path.join(destination, path)
+            if content is None:
+                if os.path.exists(outfile_path):
+                    os.remove(outfile_path)
+                continue
+            utils.ensure_directory_exists(os.path.dirname(outfile_path))
+            if isinstance(content, bytes):
+                with open(outfile_path, 'wb') as outfile_ctx:
+                    outfile_ctx.write(content)
+            else:
+                with open(outfile_path, 'w', encoding='utf-8') as outfile_ctx:
+                    outfile_ctx.write(content)
+
+    @staticmethod
+    def compare(destination, tree, prefix=''):
+        """ Compare a tree to destination, returns a list of Change
+
+        Each change comes with a unified diff of the file. Paths are
+        relative to destination, with prefix put in front. """
+        changes = []
+        for path in sorted(tree):
+            content = tree[path]
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            try:
+                with open(os.path.join(destination, path), 'rb') as file_ctx:
+                    existing = file_ctx.read()
+            except FileNotFoundError:
+                existing = None
+
+            if content == existing:
+                continue
+            if existing is None:
+                action = ADDED
+            elif content is None:
+                action = REMOVED
+            else:
+                action = CHANGED
+            name = os.path.join(prefix, path)
+            diff = ''.join(difflib.unified_diff(
+                (existing or b'').decode('utf-8', 'replace').splitlines(True),
+                (content or b'').decode('utf-8', 'replace').splitlines(True),
+                '/dev/null' if action == ADDED else 'a/{}'.format(name),
+                '/dev/null' if action == REMOVED else 'b/{}'.format(name)))
+            if not diff.endswith('\n'):
+                diff += '\n\\ No newline at end of file\n'
+            changes.append(Change(name, action, diff))
+        return changes
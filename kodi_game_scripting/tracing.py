@@ -0,0 +1,182 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Timing spans of what a run spends its time on """
+
+import contextlib
+import functools
+import os
+import threading
+import time
+
+from . import utils
+
+# Categories of spans
+STAGE = 'stage'
+GIT = 'git'
+GITHUB = 'github'
+TEMPLATE = 'template'
+PROBE = 'probe'
+BUILD = 'build'
+
+
+class Tracer:
+    """ Collects timing spans of all threads
+
+        A span is a named, timed piece of work. Spans nest: a stage span
+        contains the git, template and probe spans of the calls made from
+        it. Each span belongs to the addon that was being worked on in its
+        thread, so that nested calls don't need to know about addons.
+
+        Until enable() is called, spans cost next to nothing. """
+
+    def __init__(self):
+        self._enabled = False
+        self._events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = time.perf_counter()
+
+    @property
+    def enabled(self):
+        """ Whether spans are recorded """
+        return self._enabled
+
+    def enable(self):
+        """ Start recording spans, dropping everything recorded before """
+        with self._lock:
+            self._events = []
+            self._start = time.perf_counter()
+            self._enabled = True
+
+    def disable(self):
+        """ Stop recording spans """
+        self._enabled = False
+
+    def current_addon(self):
+        """ The addon being worked on in this thread, or None """
+        addons = getattr(self._local, 'addons', None)
+        return addons[-1] if addons else None
+
+    @contextlib.contextmanager
+    def span(self, name, category, addon=None):
+        """ Time the body of the with statement
+
+        addon sets the addon for this span and the ones nested in it;
+        otherwise it's taken from the enclosing span. """
+        if not self._enabled:
+            yield
+            return
+
+        if not hasattr(self._local, 'addons'):
+            self._local.addons = []
+        addons = self._local.addons
+        addons.append(addon or self.current_addon())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {
+                'name': name,
+                'category': category,
+                'addon': addons.pop(),
+                'start': start - self._start,
+                'duration': end - start,
+                'thread': threading.current_thread().name,
+            }
+            with self._lock:
+                self._events.append(event)
+
+    @property
+    def events(self):
+        """ The spans recorded so far, in the order they ended """
+        with self._lock:
+            return list(self._events)
+
+    def summary(self):
+        """ Seconds spent per addon and stage, and per category
+
+        Nested spans are included in the time of their category, so that
+        the categories add up to more than the wall time. """
+        summary = {'addons': {}, 'categories': {}, 'wall_time': 0.0}
+        for event in self.events:
+            summary['wall_time'] = max(summary['wall_time'],
+                                       event['start'] + event['duration'])
+            categories = summary['categories']
+            categories[event['category']] = \
+                categories.get(event['category'], 0.0) + event['duration']
+            if event['category'] == STAGE and event['addon']:
+                stages = summary['addons'].setdefault(event['addon'], {})
+                stages[event['name']] = \
+                    stages.get(event['name'], 0.0) + event['duration']
+        return summary
+
+    def trace_events(self):
+        """ The spans in Chrome's trace event format
+
+        Each thread gets a track of its own, named after the thread. """
+        threads = {}
+        trace = []
+        for event in sorted(self.events, key=lambda event: event['start']):
+            if event['thread'] not in threads:
+                threads[event['thread']] = len(threads) + 1
+                trace.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                    'tid': threads[event['thread']],
+                    'args': {'name': event['thread']},
+                })
+            trace.append({
+                'name': event['name'],
+                'cat': event['category'],
+                'ph': 'X',
+                'ts': round(event['start'] * 1e6),
+                'dur': round(event['duration'] * 1e6),
+                'pid': os.getpid(),
+                'tid': threads[event['thread']],
+                'args': {'addon': event['addon']} if event['addon'] else {},
+            })
+        return trace
+
+    def write(self, path):
+        """ Write the summary and the trace events to a JSON file
+
+        Trace viewers (chrome://tracing, Perfetto) read the traceEvents
+        and ignore the summary next to them. """
+        utils.write_json(path, {
+            'summary': self.summary(),
+            'traceEvents': self.trace_events(),
+            'displayTimeUnit': 'ms',
+        })
+
+
+TRACER = Tracer()
+
+
+def span(name, category, addon=None):
+    """ Time a piece of work, see Tracer.span() """
+    return TRACER.span(name, category, addon)
+
+
+def traced(category):
+    """ Decorator timing every call of a function """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(func.__qualname__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Upstream sources shared by a number of addons """
+
+import collections
+import os
+import threading
+
+import git
+
+from .git_access import GitRepo
+
+GITHUB = 'https://github.com'
+
+
+class SharedSources:
+    """ Local mirrors of the libretro repositories the addons build from
+
+        Some cores come in a family of addons built from the same
+        repository with different options (vice_*, bsnes-mercury-*, ...).
+        Instead of each build cloning the repository from GitHub, it's
+        mirrored once, and the builds clone from the mirror.
+
+        With mirror_all, every repository is mirrored, shared or not. The
+        mirrors are bare and only fetch what's new when they're updated, so
+        a directory kept across runs (see --source-cache) saves cloning the
+        large cores again and again. """
+
+    DIRECTORY = 'sources'
+
+    def __init__(self, directory, repos, mirror_all=False, remote=GITHUB):
+        """ repos: the repository (org, name) of each addon
+            remote: base URL the repositories are mirrored from """
+        self._directory = directory
+        self._remote = remote.rstrip('/')
+        counts = collections.Counter(repos)
+        self._shared = {repo for repo, count in counts.items()
+                        if count > 1 or mirror_all}
+        self._mirrors = {}
+        self._lock = threading.Lock()
+        self._repo_locks = collections.defaultdict(threading.Lock)
+
+    @property
+    def shared(self):
+        """ The repositories that are mirrored """
+        return set(self._shared)
+
+    def get_path(self, repo):
+        """ Path of the mirror of a repository """
+        return os.path.join(self._directory, repo[0],
+                            '{}.git'.format(repo[1]))
+
+    def get_url(self, repo):
+        """ URL to fetch a repository from, if it's mirrored
+
+        The first call for a repository creates or updates its mirror, other
+        threads asking for it meanwhile wait for that. Returns None for
+        repositories that aren't mirrored, or that couldn't be; those are
+        fetched from GitHub as usual. """
+        if repo not in self._shared:
+            return None
+        with self._lock:
+            repo_lock = self._repo_locks[repo]
+        with repo_lock:
+            if repo not in self._mirrors:
+                path = self.get_path(repo)
+                try:
+                    GitRepo.mirror('{}/{}/{}'.format(self._remote, *repo),
+                                   path)
+                    self._mirrors[repo] = path
+                except git.exc.GitCommandError as err:
+                    print("Failed to mirror {}/{}: {}".format(*repo, err))
+                    self._mirrors[repo] = None
+            return self._mirrors[repo]
@@ -16,15 +16,70 @@
 
 """ Common utility functions """
 
+import contextlib
+import io
+import json
 import os
 import re
 import shutil
+import subprocess
+import sys
+import threading
 from typing import Any
 from typing import Dict
 import xml.etree.ElementTree
 import xmljson
 
 
+class _ThreadOutput(io.TextIOBase):
+    """ Stand-in for sys.stdout that keeps each thread's output apart
+
+    Threads that asked for their output to be captured write into a buffer
+    of their own; everyone else writes through to the real stream. """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.buffers = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.buffers, 'current', None)
+        return (buffer or self.stream).write(text)
+
+    def flush(self):
+        buffer = getattr(self.buffers, 'current', None)
+        (buffer or self.stream).flush()
+
+
+_OUTPUT_LOCK = threading.Lock()
+_OUTPUT_USERS = [0]
+
+
+@contextlib.contextmanager
+def captured_output():
+    """ Capture what the current thread prints into a StringIO
+
+    Unlike contextlib.redirect_stdout this only affects the calling thread,
+    so workers running side by side don't end up in each other's output. """
+    with _OUTPUT_LOCK:
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        proxy = sys.stdout
+        _OUTPUT_USERS[0] += 1
+
+    buffer = io.StringIO()
+    previous = getattr(proxy.buffers, 'current', None)
+    proxy.buffers.current = buffer
+    try:
+        yield buffer
+    finally:
+        proxy.buffers.current = previous
+        with _OUTPUT_LOCK:
+            _OUTPUT_USERS[0] -= 1
+            if not _OUTPUT_USERS[0] and sys.stdout is proxy:
+                sys.stdout = proxy.stream
+
+
 def ensure_directory_exists(path, clean=False):
     """ Ensure that the given path exists """
     try:
@@ -43,8 +98,11 @@ def get_xml_data(xml_path: str) -> Dict[str, Any]:
         return {}
 
     with open(xml_path, 'r', encoding='utf-8') as xmlfile_ctx:
-        xml_content = xmlfile_ctx.read()
+        return parse_xml_data(xmlfile_ctx.read())
+
 
+def parse_xml_data(xml_content: str) -> Dict[str, Any]:
+    """ Parse XML content into nested dicts """
     # Remove variables from xml.in files
     xml_content = re.sub(r'@([A-Za-z0-9_]+)@', r'AT_\1_AT',
                          xml_content)
@@ -67,6 +125,74 @@ def get_xml_data(xml_path: str) -> Dict[str, Any]:
     return xml_data
 
 
+def file_state(path):
+    """ Size and modification time of a file, or None if it isn't there """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def run_measured(args, **kwargs):
+    """ Run a command like subprocess.run(args, check=True, **kwargs)
+
+    Returns the peak resident set size of the largest process the command
+    ran, in bytes, or None where that can't be told. """
+    if not hasattr(os, 'wait4'):
+        subprocess.run(args, check=True, **kwargs)
+        return None
+    with subprocess.Popen(args, **kwargs) as process:
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+    # Linux counts kilobytes, macOS bytes
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def get_physical_memory():
+    """ Size of the physical memory in bytes, or None if unknown """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def to_json_data(obj):
+    """ Convert obj into something json.dump() can write
+
+    Objects are written as their attributes and anything else json doesn't
+    know (exceptions, mostly) as its string. """
+    if isinstance(obj, dict):
+        return {str(k): to_json_data(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [to_json_data(v) for v in obj]
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if hasattr(obj, '__dict__') and not isinstance(obj, BaseException):
+        return to_json_data(vars(obj))
+    return str(obj)
+
+
+def read_json(path, default=None):
+    """ Read a JSON file, or return default if it's missing or unreadable """
+    try:
+        with open(path, 'r', encoding='utf-8') as json_ctx:
+            return json.load(json_ctx)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """ Write a JSON file so that readers never see half of it """
+    ensure_directory_exists(os.path.dirname(path))
+    temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+    with open(temp_path, 'w', encoding='utf-8') as json_ctx:
+        json.dump(data, json_ctx, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
 def list_all_files(path):
     """ Get a list with relative paths for all files in the given path """
     all_files = []
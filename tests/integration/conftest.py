@@ -0,0 +1,59 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Fixtures shared by the integration tests """
+
+import functools
+import http.server
+import threading
+
+import github
+import pytest
+
+from kodi_game_scripting.git_access import GitHubSession
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture
+def serve():
+    """ Run a stand-in server for a request handler class, returns the
+        server """
+    servers = []
+
+    def start(handler):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def github_standin(server, mocker, monkeypatch):
+    """ Let the GitHub sessions talk to the stand-in server of the module,
+        without a token """
+    monkeypatch.delenv('GITHUB_ACCESS_TOKEN', raising=False)
+    mocker.patch('github.Github', functools.partial(
+        github.Github,
+        base_url='http://{}:{}'.format(*server.server_address),
+        seconds_between_requests=0))
+    GitHubSession.reset()
+    yield server
+    GitHubSession.reset()
@@ -22,7 +22,8 @@ import pytest
 
 from kodi_game_scripting import config
 from kodi_game_scripting import utils
-from kodi_game_scripting.git_access import GitHubOrg, GitHubRepo, GitRepo
+from kodi_game_scripting.git_access import (STAGING_REF, GitHubOrg,
+                                            GitHubRepo, GitRepo)
 
 pytestmark = [pytest.mark.integration]
 
@@ -91,6 +92,21 @@ def test_gitrepo_remote(tmpdir, gitrepo_remote):
     assert gitrepo.diff()
 
 
+def test_gitrepo_alternates(tmpdir, gitrepo_remote):
+    """ Test borrowing objects from another repository """
+    objects = os.path.join(gitrepo_remote.path, '.git', 'objects')
+    url = 'file://{}'.format(gitrepo_remote.path)
+    gitrepo = GitRepo(GitHubRepo('local-repo', url, url), str(tmpdir),
+                      objects)
+    GitRepo(GitHubRepo('local-repo', url, url), str(tmpdir), objects)
+    assert GitRepo.get_alternates(gitrepo.path) == [objects]
+    gitrepo.fetch_and_reset()
+    assert gitrepo.get_hexsha() == gitrepo_remote.get_hexsha()
+    # Everything was there already
+    assert not os.listdir(os.path.join(gitrepo.path, '.git', 'objects',
+                                       'pack'))
+
+
 def test_gitrepo_remote_rebase(tmpdir, gitrepo_remote):
     """ Test rebasing changes instead of resetting """
     url = 'file://{}'.format(gitrepo_remote.path)
@@ -153,6 +169,26 @@ def test_gitrepo_remote_push(tmpdir, gitrepo_remote):
         gitrepo.push('master')
 
 
+def test_gitrepo_remote_stagedpush(tmpdir, gitrepo_remote):
+    """ Tests uploading changes ahead of pushing them """
+    url = 'file://{}'.format(gitrepo_remote.path)
+    gitrepo = GitRepo(GitHubRepo('local-repo', url, url), str(tmpdir))
+    upstream = gitrepo_remote.get_hexsha()
+    gitrepo.fetch_and_reset()
+    create_file(os.path.join(gitrepo.path, 'testfile'))
+    gitrepo.commit('Commit testfile')
+
+    gitrepo.stage_push()
+    refs = GitRepo.list_remote(url)
+    assert refs[STAGING_REF] == gitrepo.get_hexsha()
+    assert refs['refs/heads/master'] == upstream
+
+    gitrepo.push('master', staged=True)
+    refs = GitRepo.list_remote(url)
+    assert STAGING_REF not in refs
+    assert refs['refs/heads/master'] == gitrepo.get_hexsha()
+
+
 def test_gitrepo_local(tmpdir):
     """ Test operations on a local git repository """
     gitrepo = GitRepo(GitHubRepo('local-repo', '', ''), str(tmpdir))
@@ -228,3 +264,21 @@ def test_gitrepo_local_commitsquash(tmpdir):
     gitrepo.commit('Commit modified testfile', squash=True)
     assert '/dev/null\n+++ b/{}\n'.format(
         os.path.basename(testfile)) in gitrepo.diff()
+
+
+def test_gitrepo_listremote(tmpdir, gitrepo_remote):
+    """ Test listing the refs of a remote repository """
+    refs = GitRepo.list_remote(gitrepo_remote.path)
+    assert refs['HEAD'] == gitrepo_remote.get_hexsha()
+    assert GitRepo.list_remote(os.path.join(str(tmpdir), 'missing')) is None
+
+
+def test_gitrepo_mirror(tmpdir, gitrepo_remote):
+    """ Test creating and updating a mirror of a remote repository """
+    path = os.path.join(str(tmpdir), 'mirror.git')
+    GitRepo.mirror(gitrepo_remote.path, path)
+    assert GitRepo.list_remote(path)['HEAD'] == gitrepo_remote.get_hexsha()
+    create_file(os.path.join(gitrepo_remote.path, 'other-file'))
+    gitrepo_remote.commit('Commit other-file')
+    GitRepo.mirror(gitrepo_remote.path, path)
+    assert GitRepo.list_remote(path)['HEAD'] == gitrepo_remote.get_hexsha()
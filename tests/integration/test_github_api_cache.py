@@ -0,0 +1,187 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the cache of GitHub API responses against a local server """
+
+import http.server
+import json
+import re
+
+import github
+import pytest
+
+from kodi_game_scripting.api_cache import ApiCache
+from kodi_game_scripting.git_access import GitHubOrg, GitHubSession
+
+pytestmark = [pytest.mark.integration]
+
+
+# pylint: disable=redefined-outer-name
+
+PAGES = {
+    '/orgs/org/repos?per_page=2': ([{'name': 'a'}, {'name': 'b'}],
+                                   '/orgs/org/repos?per_page=2&page=2'),
+    '/orgs/org/repos?per_page=2&page=2': ([{'name': 'c'}], None),
+}
+
+
+def repo_data(server, name):
+    """ The data of a repository of 'org' on the server """
+    url = 'http://{}:{}/{{}}org/{}'.format(*server.server_address, name)
+    return {'name': name, 'url': url.format('repos/'),
+            'clone_url': url.format('') + '.git',
+            'ssh_url': 'git@host:org/{}.git'.format(name)}
+
+
+class GitHubStandIn(http.server.BaseHTTPRequestHandler):
+    """ Serves a paginated list of repositories, with ETags, and creates
+        repositories in the list of 'org' """
+
+    pages = {}
+    requests = []
+
+    def _send(self, data, status=200, etag=None, next_page=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        if next_page:
+            self.send_header('Link', '<http://{}:{}{}>; rel="next"'.format(
+                *self.server.server_address, next_page))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Answer with a page, or 304 if the client has it already """
+        if self.path == '/rate_limit':
+            rate = {'limit': 5000, 'remaining': 5000, 'reset': 0, 'used': 0}
+            self._send({'resources': {'core': rate}, 'rate': rate})
+            return
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/orgs/org':
+            self._send({'login': 'org', 'url': 'http://{}:{}/orgs/org'.format(
+                *self.server.server_address)})
+            return
+        match = re.match(r'/repos/org/([^/]+)$', self.path)
+        if match:
+            self._send(repo_data(self.server, match.group(1)))
+            return
+        data, next_page = self.pages[self.path]
+        etag = '"{}"'.format(hash(json.dumps(data)))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self._send(data, etag=etag, next_page=next_page)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ Create a repository at the end of the last page of the list """
+        self.requests.append((self.path, 'POST'))
+        name = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))['name']
+        path = '/orgs/org/repos?per_page={}'.format(GitHubSession.PER_PAGE)
+        while self.pages[path][1]:
+            path = self.pages[path][1]
+        data, _ = self.pages[path]
+        if name in [repo['name'] for repo in data]:
+            self._send({'message': 'Repository creation failed.',
+                        'errors': [{'resource': 'Repository',
+                                    'code': 'custom', 'field': 'name',
+                                    'message': 'name already exists on '
+                                               'this account'}]}, 422)
+            return
+        self.pages[path] = (data + [repo_data(self.server, name)], None)
+        self._send(repo_data(self.server, name), 201)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """ Keep the test output clean """
+
+
+@pytest.fixture
+def server(serve):
+    """ Run the stand-in for the GitHub API """
+    GitHubStandIn.pages = dict(PAGES)
+    GitHubStandIn.requests = []
+    return serve(GitHubStandIn)
+
+
+def test_apicache_server(tmpdir, server):
+    """ Test caching and revalidating the pages of a list """
+    requester = github.Github(
+        base_url='http://{}:{}'.format(*server.server_address),
+        seconds_between_requests=0).requester
+    directory = str(tmpdir)
+
+    names = ['a', 'b', 'c']
+    cache = ApiCache(directory, ttl=3600)
+    assert [repo['name'] for repo in cache.get_all(
+        requester, '/orgs/org/repos?per_page=2')] == names
+    assert [path for path, _ in GitHubStandIn.requests] == [
+        '/orgs/org/repos?per_page=2', '/orgs/org/repos?per_page=2&page=2']
+
+    # Fresh responses are used without asking
+    cache = ApiCache(directory, ttl=3600)
+    assert [repo['name'] for repo in cache.get_all(
+        requester, '/orgs/org/repos?per_page=2')] == names
+    assert len(GitHubStandIn.requests) == 2
+
+    # Stale responses are revalidated
+    cache = ApiCache(directory, ttl=0)
+    assert [repo['name'] for repo in cache.get_all(
+        requester, '/orgs/org/repos?per_page=2')] == names
+    assert all(etag for _, etag in GitHubStandIn.requests[2:])
+    assert cache.counts == {'not modified': 2}
+
+    # and fetched again once they changed
+    GitHubStandIn.pages['/orgs/org/repos?per_page=2&page=2'] = (
+        [{'name': 'd'}], None)
+    assert [repo['name'] for repo in cache.get_all(
+        requester, '/orgs/org/repos?per_page=2')] == ['a', 'b', 'd']
+    assert cache.counts == {'not modified': 3, 'fetched': 1}
+
+
+def test_apicache_createrepo(tmpdir, github_standin):
+    """ Test that creating repositories drops the cached list, and that a
+        repository the list misses is taken as it is """
+    url = '/orgs/org/repos?per_page={}'.format(GitHubSession.PER_PAGE)
+    GitHubStandIn.pages = {url: ([], None)}
+
+    def run(names):
+        """ What a run does: list the repositories, create the missing """
+        GitHubSession.reset()
+        GitHubSession.set_cache(ApiCache(str(tmpdir), ttl=3600))
+        org = GitHubOrg('org')
+        repos = org.get_repos('^game')
+        created = [org.create_repo(name).name
+                   for name in names if name not in repos]
+        return sorted(org.get_repos('^game')), created
+
+    assert run(['game.a', 'game.b']) == (['game.a', 'game.b'],
+                                         ['game.a', 'game.b'])
+    # The next run finds them, though the list it had cached was fresh
+    assert run(['game.a', 'game.b']) == (['game.a', 'game.b'], [])
+    assert [path for path, method in GitHubStandIn.requests
+            if method == 'POST'] == ['/orgs/org/repos'] * 2
+
+    # A run that missed a repository created elsewhere meanwhile takes it
+    # as it is
+    GitHubStandIn.pages[url] = (GitHubStandIn.pages[url][0] + [
+        repo_data(github_standin, 'game.c')], None)
+    assert run(['game.a', 'game.c']) == (
+        ['game.a', 'game.b', 'game.c'], ['game.c'])
@@ -0,0 +1,168 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Count the round trips of the REST and GraphQL APIs to a local server """
+
+import http.server
+import json
+import re
+import urllib.parse
+
+import pytest
+
+from kodi_game_scripting.git_access import (GRAPHQL, REST, GitHubOrg,
+                                            GitHubSession)
+
+pytestmark = [pytest.mark.integration]
+
+
+# pylint: disable=redefined-outer-name
+
+REPOS = ['game.libretro.core{}'.format(index) for index in range(120)]
+CORES = ['core{}'.format(index) for index in range(60)]
+# The tags of each core with the date of their commits, in the order the
+# REST API lists them. The latest is neither the first nor the newest.
+TAGS = [('v2', 2), ('v10', 1), ('v9', 3)]
+
+
+class GitHubStandIn(http.server.BaseHTTPRequestHandler):
+    """ Serves the repositories of 'org' and the tags of the cores of
+        'libretro', through REST and GraphQL
+
+        GraphQL lists the tags by name, or by date if asked to. """
+
+    requests = []
+
+    def _send(self, data, link=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if link:
+            self.send_header('Link', '<http://{}:{}{}>; rel="next"'.format(
+                *self.server.server_address, link))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _repo(self, org, name):
+        url = 'http://{}:{}/{{}}{}/{}'.format(*self.server.server_address,
+                                              org, name)
+        return {'name': name, 'url': url.format('repos/'),
+                'html_url': url.format(''),
+                'clone_url': url.format('') + '.git',
+                'ssh_url': 'git@host:{}/{}.git'.format(org, name)}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Answer a REST request """
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/rate_limit':
+            rate = {'limit': 5000, 'remaining': 5000, 'reset': 0, 'used': 0}
+            self._send({'resources': {'core': rate}, 'rate': rate})
+            return
+        self.requests.append(('rest', self.path))
+        if url.path == '/orgs/org/repos':
+            per_page = int(query['per_page'][0])
+            page = int(query.get('page', ['1'])[0])
+            repos = REPOS[(page - 1) * per_page:page * per_page]
+            self._send([self._repo('org', name) for name in repos],
+                       '/orgs/org/repos?per_page={}&page={}'.format(
+                           per_page, page + 1)
+                       if page * per_page < len(REPOS) else None)
+            return
+        match = re.match(r'/orgs/([^/]+)$', url.path)
+        if match:
+            self._send({'login': match.group(1),
+                        'url': 'http://{}:{}{}'.format(
+                            *self.server.server_address, url.path)})
+            return
+        match = re.match(r'/repos/([^/]+)/([^/]+)(/tags)?$', url.path)
+        if match.group(3):
+            self._send([{'name': '{}-{}'.format(match.group(2), tag)}
+                        for tag, _ in TAGS])
+        else:
+            self._send(self._repo(match.group(1), match.group(2)))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ Answer a GraphQL query """
+        self.requests.append(('graphql', self.path))
+        body = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])))
+        variables = body['variables']
+        if 'org' in variables:
+            start = int(variables['after'] or 0)
+            end = start + variables['first']
+            self._send({'data': {'organization': {'repositories': {
+                'nodes': [{'name': name,
+                           'url': self._repo('org', name)['html_url'],
+                           'sshUrl': self._repo('org', name)['ssh_url']}
+                          for name in REPOS[start:end]],
+                'pageInfo': {'hasNextPage': end < len(REPOS),
+                             'endCursor': str(end)}}}}})
+            return
+        tags = sorted(TAGS, key=lambda tag: tag[1], reverse=True) \
+            if 'TAG_COMMIT_DATE' in body['query'] else sorted(TAGS)
+        first = int(re.search(r'first: (\d+)', body['query']).group(1))
+        self._send({'data': {
+            alias: {'refs': {
+                'nodes': [{'name': '{}-{}'.format(name, tag)}
+                          for tag, _ in tags[:first]],
+                'pageInfo': {'hasNextPage': first < len(tags),
+                             'endCursor': None}}}
+            for alias, _, name in re.findall(
+                r'(r\d+): repository\(owner: "([^"]+)", name: "([^"]+)"\)',
+                body['query'])}})
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """ Keep the test output clean """
+
+
+@pytest.fixture
+def server(serve):
+    """ Run the stand-in for the GitHub API """
+    GitHubStandIn.requests = []
+    return serve(GitHubStandIn)
+
+
+def read_all():
+    """ What a run reads: the addon repositories and the latest tags """
+    GitHubSession.expect_tags(('libretro', core) for core in CORES)
+    repos = GitHubOrg('org').get_repos(r'^game\.libretro\.')
+    libretro = GitHubOrg('libretro')
+    return repos, {core: libretro.get_latest_tag(core) for core in CORES}
+
+
+@pytest.mark.parametrize('api, round_trips', [
+    # The 2 organizations, 2 pages of repositories, and each core and its
+    # tags
+    (REST, 2 + 2 + 2 * len(CORES)),
+    # 2 pages of repositories, and 2 batches of tags
+    (GRAPHQL, 2 + 2),
+])
+def test_github_roundtrips(github_standin, api, round_trips):
+    """ Test reading the same through both APIs, and counting their round
+        trips """
+    # pylint: disable=unused-argument
+    GitHubSession.set_api(api)
+    repos, tags = read_all()
+    assert set(repos) == set(REPOS)
+    assert repos[REPOS[0]].clone_url.endswith('/org/{}.git'.format(REPOS[0]))
+    assert tags == {core: '{}-v10'.format(core) for core in CORES}
+    assert [kind for kind, _ in GitHubStandIn.requests] == \
+        [api] * round_trips
+    # The session counts what the server saw
+    assert GitHubSession.current().requests == {
+        REST: {'GET': round_trips}, GRAPHQL: {'graphql': round_trips}}[api]
@@ -119,3 +119,15 @@ def test_load_missing_library(tmpdir):
     # survive the trip back from the helper process
     assert missing in str(excinfo.value)
     assert 'No such file' in str(excinfo.value)
+
+
+def test_load_library_probedata(tmpdir, mocker):
+    """ Test that a library isn't probed again given its probe data """
+    library = compile_testlibrary(str(tmpdir))
+    lib = LibretroWrapper(library)
+    probemock = mocker.patch.object(LibretroWrapper, 'probe')
+    again = LibretroWrapper(library, lib.probe_data)
+    assert not probemock.called
+    assert again.system_info.name == lib.system_info.name
+    assert again.options == lib.options
+    assert again.opengl_linkage == lib.opengl_linkage
@@ -0,0 +1,78 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the object store shared by the addon repositories """
+
+import os
+
+import git
+import pytest
+
+from kodi_game_scripting.git_access import GitHubRepo, GitRepo
+from kodi_game_scripting.object_store import repack_objects
+
+pytestmark = [pytest.mark.integration]
+
+
+def create_repo(directory, name, content, alternates=None):
+    """ Create a repository with a commit of a common and an own file """
+    gitrepo = GitRepo(GitHubRepo(name, '', ''), directory, alternates)
+    with git.Repo(gitrepo.path).config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@example.com')
+    for filename, file_content in (('common', content), ('own', name)):
+        with open(os.path.join(gitrepo.path, filename), 'w',
+                  encoding='utf-8') as file_ctx:
+            file_ctx.write(file_content)
+    gitrepo.commit('Initial commit')
+    return gitrepo
+
+
+def count_objects(path):
+    """ Number of objects a repository holds itself """
+    stats = dict(line.split(': ') for line in
+                 git.Repo(path).git.count_objects('-v').splitlines())
+    return int(stats['count']) + int(stats['in-pack'])
+
+
+def test_repackobjects(tmpdir):
+    """ Test moving the objects of the repositories into the store """
+    store = os.path.join(str(tmpdir), 'store.git')
+    objects = os.path.join(store, 'objects')
+    directory = os.path.join(str(tmpdir), 'addons')
+    content = 'shared by all addons\n' * 100
+    repos = [create_repo(directory, name, content, objects)
+             for name in ('game.libretro.a', 'game.libretro.b')]
+    other = create_repo(directory, 'other', content)
+    hexshas = [repo.get_hexsha() for repo in repos]
+    repos = [repo.path for repo in repos]
+
+    assert repack_objects(store, [directory]) == repos
+    assert all(count_objects(repo) == 0 for repo in repos)
+    assert count_objects(other.path) > 0
+    # One blob and tree of the common file, a blob, tree and commit each
+    assert count_objects(store) == 1 + 2 * 3
+    for repo, hexsha in zip(repos, hexshas):
+        assert git.Repo(repo).head.commit.hexsha == hexsha
+        assert git.Repo(repo).git.show('HEAD:common') == content.strip()
+
+    # Repacking again keeps what's there
+    create_repo(directory, 'game.libretro.c', content, objects)
+    repack_objects(store, [directory])
+    assert count_objects(store) == 1 + 3 * 3
+    # Nothing a repository needs went missing
+    for repo in repos:
+        assert git.Repo(repo).git.fsck('--no-dangling') == ''
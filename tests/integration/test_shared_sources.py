@@ -0,0 +1,80 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the mirrors of upstream repositories against local remotes """
+
+import os
+import pathlib
+
+import git
+import pytest
+
+from kodi_game_scripting.git_access import GitRepo
+from kodi_game_scripting.upstream import SharedSources
+
+pytestmark = [pytest.mark.integration]
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture
+def remote(tmpdir):
+    """ Setup a remote serving libretro/mgba and libretro/vice """
+    path = os.path.join(str(tmpdir), 'remote')
+    for name in ('mgba', 'vice'):
+        repo = git.Repo.init(os.path.join(path, 'libretro', name))
+        with repo.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        repo.index.commit('Initial commit of {}'.format(name))
+    return path
+
+
+def commit(remote, name):
+    """ Add a commit to a repository of the remote, returns its hexsha """
+    return git.Repo(os.path.join(remote, 'libretro', name)).index.commit(
+        'Another commit').hexsha
+
+
+def test_sharedsources_mirror(tmpdir, remote):
+    """ Test that the mirrors of one run are updated by the next one """
+    repos = [('libretro', 'mgba'), ('libretro', 'vice')]
+    directory = os.path.join(str(tmpdir), 'cache')
+    url = pathlib.Path(remote).as_uri()
+
+    sources = SharedSources(directory, repos, mirror_all=True, remote=url)
+    for repo in repos:
+        path = sources.get_url(repo)
+        assert path == sources.get_path(repo)
+        assert GitRepo.list_remote(path)['HEAD'] == GitRepo.list_remote(
+            os.path.join(remote, *repo))['HEAD']
+
+    hexsha = commit(remote, 'vice')
+    sources = SharedSources(directory, repos, mirror_all=True, remote=url)
+    assert GitRepo.list_remote(
+        sources.get_url(('libretro', 'vice')))['HEAD'] == hexsha
+    # The mirror can be cloned from like the remote itself
+    clone = git.Repo.clone_from(sources.get_path(('libretro', 'vice')),
+                                os.path.join(str(tmpdir), 'clone'))
+    assert clone.head.commit.hexsha == hexsha
+
+
+def test_sharedsources_mirrorfailure(tmpdir, remote):
+    """ Test that repositories the remote doesn't have aren't mirrored """
+    sources = SharedSources(os.path.join(str(tmpdir), 'cache'),
+                            [('libretro', 'missing')], mirror_all=True,
+                            remote=pathlib.Path(remote).as_uri())
+    assert sources.get_url(('libretro', 'missing')) is None
@@ -180,6 +180,29 @@ def test_process_template_linux_arm_platforms(tmpdir):
     assert '                    platform=unix\n' not in linux_build
 
 
+def test_compiler_launcher_generation(tmpdir):
+    """Test that a compiler cache reaches the core's make on Unix platforms."""
+    addon_dir = generate_configured_addon(tmpdir, 'virtualjaguar')
+    cmake = read_file(os.path.join(
+        addon_dir, 'depends', 'common', 'virtualjaguar', 'CMakeLists.txt'))
+
+    assert ('set(LIBRETRO_COMPILERS '
+            '"CC=${CMAKE_C_COMPILER_LAUNCHER} ${CMAKE_C_COMPILER}"') in cmake
+    for start, end in (
+            ('elseif(CORE_SYSTEM_NAME STREQUAL linux)',
+             'elseif(CORE_SYSTEM_NAME STREQUAL osx)'),
+            ('elseif(CORE_SYSTEM_NAME STREQUAL freebsd)', 'else()')):
+        section = cmake_section(cmake, start, end)
+        assert 'set(BUILD_COMMAND ${LIBRETRO_COMPILERS_ENV} $(MAKE)' in section
+        assert '${LIBRETRO_COMPILERS}' not in section
+    assert '${LIBRETRO_COMPILERS}' in cmake_section(
+        cmake, 'elseif(CORE_SYSTEM_NAME STREQUAL osx)',
+        'elseif(CORE_SYSTEM_NAME STREQUAL ios')
+    assert '${LIBRETRO_COMPILERS}' not in cmake_section(
+        cmake, 'if(CORE_SYSTEM_NAME STREQUAL windows)',
+        'elseif(CORE_SYSTEM_NAME STREQUAL linux)')
+
+
 def test_uae4arm_jenkins_platforms(tmpdir):
     """Test UAE4ARM's Jenkins matrix contains only supported ARM targets."""
     addon_dir = generate_configured_addon(tmpdir, 'uae4arm')
@@ -357,3 +380,36 @@ def test_desktop_generation_unchanged(tmpdir):
     assert 'platform=osx' in osx_build
     assert 'platform=${PLATFORM}' not in osx_build
     assert 'CC_AS=${CMAKE_C_COMPILER}' not in osx_build
+
+
+def test_plan_configured_addon(tmpdir):
+    """Test planning an add-on in memory, then comparing it to disk."""
+    addon_name = 'game.libretro.uae4arm'
+    with mock.patch('kodi_game_scripting.process_game_addons.GitRepo'):
+        addon = KodiGameAddon(addon_name, 'uae4arm',
+                              GitHubRepo(addon_name, '', ''), str(tmpdir),
+                              None)
+
+    addon.plan = {}
+    addon.process_addon_files()
+    assert not os.listdir(str(tmpdir))
+    changes = addon.planned_changes()
+    assert changes
+    assert {change.action for change in changes} == {'added'}
+    assert os.path.join(addon_name, 'Jenkinsfile') in \
+        [change.path for change in changes]
+
+    generate_configured_addon(tmpdir, 'uae4arm')
+    addon.plan = {}
+    addon.process_addon_files()
+    assert not addon.planned_changes()
+
+    with open(os.path.join(str(tmpdir), addon_name, 'Jenkinsfile'), 'w',
+              encoding='utf-8') as jenkinsfile:
+        jenkinsfile.write('changed\n')
+    addon.plan = {}
+    addon.process_addon_files()
+    changes = addon.planned_changes()
+    assert [(change.path, change.action) for change in changes] == [
+        (os.path.join(addon_name, 'Jenkinsfile'), 'changed')]
+    assert '-changed\n' in changes[0].diff
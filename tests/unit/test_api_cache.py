@@ -0,0 +1,98 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the cache of GitHub API responses """
+
+from unittest import mock
+
+import pytest
+
+from kodi_game_scripting.api_cache import ApiCache
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture
+def requester():
+    """ Setup a mocked PyGithub requester """
+    requester = mock.MagicMock()
+    requester.requestJsonAndCheck.return_value = (
+        {'etag': '"v1"', 'link': '<https://api/next?page=2>; rel="next", '
+                                 '<https://api/next?page=9>; rel="last"'},
+        [{'name': 'repo'}])
+    return requester
+
+
+def test_apicache_ttl(tmp_path, requester, mocker):
+    """ Test that a response is used as it is until it's too old """
+    timemock = mocker.patch('time.time', return_value=1000.0)
+    cache = ApiCache(str(tmp_path), ttl=60)
+    assert cache.get(requester, '/list') == (
+        [{'name': 'repo'}], 'https://api/next?page=2')
+    timemock.return_value = 1059.0
+    assert ApiCache(str(tmp_path), ttl=60).get(requester, '/list') == (
+        [{'name': 'repo'}], 'https://api/next?page=2')
+    requester.requestJsonAndCheck.assert_called_once_with(
+        'GET', '/list', headers={})
+
+
+def test_apicache_revalidate(tmp_path, requester, mocker):
+    """ Test revalidating an old response with its ETag """
+    timemock = mocker.patch('time.time', return_value=1000.0)
+    cache = ApiCache(str(tmp_path), ttl=60)
+    cache.get(requester, '/list')
+
+    timemock.return_value = 1100.0
+    requester.requestJsonAndCheck.return_value = ({}, None)
+    assert cache.get(requester, '/list')[0] == [{'name': 'repo'}]
+    requester.requestJsonAndCheck.assert_called_with(
+        'GET', '/list', headers={'If-None-Match': '"v1"'})
+    # Revalidated just now
+    timemock.return_value = 1150.0
+    cache.get(requester, '/list')
+
+    timemock.return_value = 1300.0
+    requester.requestJsonAndCheck.return_value = ({'etag': '"v2"'}, [])
+    assert cache.get(requester, '/list') == ([], None)
+    assert requester.requestJsonAndCheck.call_count == 3
+    assert cache.counts == {'fetched': 2, 'not modified': 1, 'fresh': 1}
+
+
+def test_apicache_getall(tmp_path, requester):
+    """ Test reading all pages of a list """
+    requester.requestJsonAndCheck.side_effect = [
+        ({'link': '<https://api/list?page=2>; rel="next"'}, [1, 2]),
+        ({'link': '<https://api/list?page=1>; rel="prev"'}, [3])]
+    assert ApiCache(str(tmp_path)).get_all(requester, '/list') == [1, 2, 3]
+    assert requester.requestJsonAndCheck.call_args_list == [
+        mock.call('GET', '/list', headers={}),
+        mock.call('GET', 'https://api/list?page=2', headers={})]
+
+
+def test_apicache_forget(tmp_path, requester):
+    """ Test dropping all pages of a list """
+    requester.requestJsonAndCheck.side_effect = [
+        ({'link': '<https://api/list?page=2>; rel="next"'}, [1, 2]),
+        ({}, [3]), ({}, [1, 2, 3, 4])]
+    cache = ApiCache(str(tmp_path))
+    cache.get_all(requester, '/list')
+    cache.forget('/list')
+    cache.forget('/other')
+    assert cache.get_all(requester, '/list') == [1, 2, 3, 4]
+    assert requester.requestJsonAndCheck.call_args_list[2] == mock.call(
+        'GET', '/list', headers={})
@@ -0,0 +1,76 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the cache of built libraries """
+
+import os
+
+import pytest
+
+from kodi_game_scripting.artifacts import ArtifactCache
+
+pytestmark = [pytest.mark.unit]
+
+
+def test_artifactcache_storerestore(tmp_path):
+    """ Test storing a library and restoring it elsewhere """
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    library = tmp_path / 'build' / 'game.libretro.a.so'
+    library.parent.mkdir()
+    library.write_bytes(b'library')
+
+    restored = str(tmp_path / 'install' / 'game.libretro.a.so')
+    assert cache.restore('abcdef', restored) is None
+    assert not os.path.exists(restored)
+
+    cache.store('abcdef', str(library), {'result': {'options': []}},
+                {'hexsha': 'sha1'})
+    assert cache.restore('abcdef', restored) == (
+        {'result': {'options': []}}, {'hexsha': 'sha1'})
+    with open(restored, 'rb') as restored_ctx:
+        assert restored_ctx.read() == b'library'
+
+
+def test_artifactcache_storeonce(tmp_path):
+    """ Test that an entry is never changed once written """
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    library = tmp_path / 'game.libretro.a.so'
+    library.write_bytes(b'first')
+    cache.store('abcdef', str(library), {'result': 1}, {'hexsha': 'sha1'})
+    library.write_bytes(b'second')
+    cache.store('abcdef', str(library), {'result': 2}, {'hexsha': 'sha2'})
+
+    restored = str(tmp_path / 'restored.so')
+    assert cache.restore('abcdef', restored) == ({'result': 1},
+                                                 {'hexsha': 'sha1'})
+    with open(restored, 'rb') as restored_ctx:
+        assert restored_ctx.read() == b'first'
+    assert os.listdir(str(tmp_path / 'cache' / 'ab')) == ['abcdef']
+
+
+def test_artifactcache_replaceolder(tmp_path):
+    """ Test that entries without source data are missed and replaced """
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    library = tmp_path / 'game.libretro.a.so'
+    library.write_bytes(b'library')
+    cache.store('abcdef', str(library), {'result': 1}, {'hexsha': 'sha1'})
+    os.remove(str(tmp_path / 'cache' / 'ab' / 'abcdef' / 'source.json'))
+
+    restored = str(tmp_path / 'restored.so')
+    assert cache.restore('abcdef', restored) is None
+    cache.store('abcdef', str(library), {'result': 2}, {'hexsha': 'sha2'})
+    assert cache.restore('abcdef', restored) == ({'result': 2},
+                                                 {'hexsha': 'sha2'})
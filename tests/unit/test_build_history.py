@@ -0,0 +1,56 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the history of build durations """
+
+import pytest
+
+from kodi_game_scripting.build_history import (DEFAULT_DURATION,
+                                               BuildHistory, makespan)
+
+pytestmark = [pytest.mark.unit]
+
+
+def test_buildhistory_predict(tmp_path):
+    """ Test predicting build durations from recorded ones """
+    history = BuildHistory(str(tmp_path))
+    assert history.predict('game.libretro.a') == DEFAULT_DURATION
+    history.record('game.libretro.a', 100.0)
+    history.record('game.libretro.b', 10.0)
+    assert history.predict('game.libretro.a') == 100.0
+    assert history.predict('game.libretro.c') == 55.0
+    history.record('game.libretro.a', 50.0)
+    assert history.predict('game.libretro.a') == 75.0
+
+
+def test_buildhistory_save(tmp_path):
+    """ Test that the history is kept across runs """
+    history = BuildHistory(str(tmp_path))
+    history.record('game.libretro.a', 100.0)
+    history.save()
+    assert BuildHistory(str(tmp_path)).predict('game.libretro.a') == 100.0
+
+
+@pytest.mark.parametrize('durations,workers,expected', [
+    ([], 2, 0.0),
+    ([5.0, 3.0, 3.0], 1, 11.0),
+    ([5.0, 3.0, 3.0], 2, 6.0),
+    ([8.0, 1.0, 1.0, 1.0, 1.0], 2, 8.0),
+    ([4.0, 4.0], 0, 8.0),
+])
+def test_makespan(durations, workers, expected):
+    """ Test the wall time of running the longest tasks first """
+    assert makespan(durations, workers) == expected
@@ -0,0 +1,81 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the compiler cache """
+
+import json
+import os
+import subprocess
+
+import pytest
+
+from kodi_game_scripting.compiler_cache import CCACHE, SCCACHE, CompilerCache
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture
+def runmock(mocker):
+    """ Setup mocked subprocess.run """
+    return mocker.patch('subprocess.run')
+
+
+def test_compilercache_environment(tmp_path):
+    """ Test the environment a build runs the compiler cache with """
+    assert CompilerCache(CCACHE).environment() == {
+        'CMAKE_C_COMPILER_LAUNCHER': 'ccache',
+        'CMAKE_CXX_COMPILER_LAUNCHER': 'ccache',
+    }
+    assert CompilerCache(SCCACHE, str(tmp_path), '20G').environment() == {
+        'CMAKE_C_COMPILER_LAUNCHER': 'sccache',
+        'CMAKE_CXX_COMPILER_LAUNCHER': 'sccache',
+        'SCCACHE_DIR': str(tmp_path),
+        'SCCACHE_CACHE_SIZE': '20G',
+    }
+
+
+def test_compilercache_ccachestats(runmock):
+    """ Test reading the statistics of ccache """
+    runmock.return_value.stdout = b'stats_updated_timestamp\t0\n' \
+        b'direct_cache_hit\t7\npreprocessed_cache_hit\t3\ncache_miss\t5\n'
+    cache = CompilerCache(CCACHE, 'cache', '5G')
+    assert cache.get_stats() == {'tool': 'ccache', 'hits': 10, 'misses': 5}
+    args, kwargs = runmock.call_args
+    assert args[0] == ['ccache', '--print-stats']
+    assert kwargs['env']['CCACHE_DIR'] == os.path.abspath('cache')
+    assert kwargs['env']['CCACHE_MAXSIZE'] == '5G'
+
+
+def test_compilercache_sccachestats(runmock):
+    """ Test reading the statistics of sccache """
+    runmock.return_value.stdout = json.dumps({'stats': {
+        'cache_hits': {'counts': {'C/C++': 4, 'Rust': 1}},
+        'cache_misses': {'counts': {'C/C++': 2}},
+    }}).encode('utf-8')
+    assert CompilerCache(SCCACHE).get_stats() == {
+        'tool': 'sccache', 'hits': 5, 'misses': 2}
+
+
+def test_compilercache_missing(runmock):
+    """ Test that a compiler cache that can't be run has no statistics """
+    runmock.side_effect = FileNotFoundError('ccache')
+    cache = CompilerCache(CCACHE)
+    cache.zero_stats()
+    assert cache.get_stats() is None
+    runmock.side_effect = subprocess.CalledProcessError(1, 'ccache')
+    assert cache.get_stats() is None
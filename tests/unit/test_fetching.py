@@ -0,0 +1,56 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test fetching repositories at once """
+
+import re
+import threading
+
+import pytest
+
+from kodi_game_scripting.fetching import fetch_all
+
+pytestmark = [pytest.mark.unit]
+
+
+def test_fetchall_concurrent():
+    """ Test that the fetches run at the same time """
+    # Each fetch waits for all of them to have started
+    barrier = threading.Barrier(3, timeout=10)
+    fetches = {name: barrier.wait for name in ('a', 'b', 'c')}
+    assert not fetch_all(fetches, jobs=3)
+
+
+def test_fetchall_failure(capsys):
+    """ Test that a failed fetch is reported without stopping the others """
+    fetched = []
+    error = RuntimeError('unreachable')
+
+    def fail():
+        raise error
+    errors = fetch_all({'a': lambda: fetched.append('a'), 'b': fail,
+                        'c': lambda: fetched.append('c')}, jobs=1)
+    assert errors == {'b': error}
+    assert fetched == ['a', 'c']
+    output = capsys.readouterr().out
+    assert 'Fetched 3 repositories in' in output
+    assert '1 failed: b' in output
+    latencies = {line.split()[0]: line.split()[2:] for line
+                 in output.splitlines()
+                 if re.match(r'  \S+ +\d+\.\ds', line)}
+    assert sorted(latencies) == ['a', 'b', 'c']
+    assert latencies['b'] == ['failed']
+    assert not latencies['a']
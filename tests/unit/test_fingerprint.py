@@ -0,0 +1,72 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test fingerprints """
+
+import pytest
+
+from kodi_game_scripting.fingerprint import (
+    FingerprintCache, get_fingerprint, hash_directory, hash_files)
+
+pytestmark = [pytest.mark.unit]
+
+
+def test_getfingerprint():
+    """ Test that fingerprints depend on all parts """
+    assert get_fingerprint('a', {'b': 1}) == get_fingerprint('a', {'b': 1})
+    assert get_fingerprint('a', {'b': 1}) != get_fingerprint('a', {'b': 2})
+    assert get_fingerprint('a', 'b') != get_fingerprint('ab')
+
+
+def test_hashfiles(tmp_path):
+    """ Test hashing file contents """
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.write_text('content')
+    second.write_text('')
+    digest = hash_files([str(first), str(second)])
+    assert digest == hash_files([str(first), str(second)])
+    assert digest != hash_files([str(second), str(first)])
+    assert digest != hash_files([str(first), str(tmp_path / 'missing')])
+    second.write_text('changed')
+    assert digest != hash_files([str(first), str(second)])
+
+
+def test_hashdirectory(tmp_path):
+    """ Test hashing a directory, leaving out the Git repository """
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'file').write_text('content')
+    digest = hash_directory(str(tmp_path))
+
+    (tmp_path / '.git').mkdir()
+    (tmp_path / '.git' / 'HEAD').write_text('ref')
+    assert hash_directory(str(tmp_path)) == digest
+
+    (tmp_path / 'sub' / 'file').rename(tmp_path / 'sub' / 'other')
+    assert hash_directory(str(tmp_path)) != digest
+    assert hash_directory(str(tmp_path / 'missing')) == \
+        hash_directory(str(tmp_path / 'missing'))
+
+
+def test_fingerprintcache(tmp_path):
+    """ Test storing fingerprints along with the metadata """
+    cache = FingerprintCache(str(tmp_path))
+    assert cache.get('addon', 'abc') is None
+    cache.save('addon', 'abc', {'game': {'version': '1.0.0.1'}})
+
+    cache = FingerprintCache(str(tmp_path))
+    assert cache.get('addon', 'abc') == {'game': {'version': '1.0.0.1'}}
+    assert cache.get('addon', 'def') is None
+    assert cache.get('other', 'abc') is None
@@ -17,6 +17,7 @@
 """ Test Git and GitHub access """
 
 import os
+import types
 
 from unittest import mock
 
@@ -24,14 +25,21 @@ import git
 import github
 import pytest
 
-from kodi_game_scripting.git_access import GitHubOrg, GitHubRepo, GitRepo
-from kodi_game_scripting.git_access import EMPTY_SHA
+from kodi_game_scripting.git_access import (GitHubGraphQL, GitHubOrg,
+                                            GitHubRepo, GitHubSession,
+                                            GitRepo)
+from kodi_game_scripting.git_access import (EMPTY_SHA, GRAPHQL,
+                                            STAGING_REF, pick_latest_tag)
 
 pytestmark = [pytest.mark.unit]
 
 
 # pylint: disable=redefined-outer-name
 
+OPTIONS = {'pool_size': GitHubSession.POOL_SIZE,
+           'per_page': GitHubSession.PER_PAGE, 'lazy': True, 'retry': None}
+
+
 @pytest.fixture
 def githuborg_fixture(mocker):
     """ Setup mocks for GitHub tests """
@@ -39,14 +47,16 @@ def githuborg_fixture(mocker):
     cred_mock = mocker.patch('kodi_game_scripting.credentials.Credentials')
     env_mock = mocker.patch('os.environ.get')
     env_mock.return_value = None
-    return githuborg_mock, cred_mock, env_mock
+    GitHubSession.reset()
+    yield githuborg_mock, cred_mock, env_mock
+    GitHubSession.reset()
 
 
 def test_githuborg_init(githuborg_fixture):
     """ Test initializing GitHub API without authentication """
     githuborg_mock, _, _ = githuborg_fixture
     GitHubOrg('org')
-    githuborg_mock.assert_called_once_with(None, None)
+    githuborg_mock.assert_called_once_with(None, None, **OPTIONS)
 
 
 def test_githuborg_initauth(githuborg_fixture):
@@ -56,7 +66,7 @@ def test_githuborg_initauth(githuborg_fixture):
     GitHubOrg('org', auth=True)
     cred_mock.assert_called_once_with('github')
     cred_mock.return_value.load.assert_called_once_with()
-    githuborg_mock.assert_called_once_with('user', 'pass')
+    githuborg_mock.assert_called_once_with('user', 'pass', **OPTIONS)
     cred_mock.return_value.save.assert_called_once_with('user', 'pass')
 
 
@@ -65,7 +75,7 @@ def test_githuborg_initenv(githuborg_fixture):
     githuborg_mock, _, env_mock = githuborg_fixture
     env_mock.return_value = 'token'
     GitHubOrg('org', auth=False)
-    githuborg_mock.assert_called_once_with('token')
+    githuborg_mock.assert_called_once_with('token', **OPTIONS)
 
 
 def test_githuborg_initenvauth(githuborg_fixture):
@@ -73,7 +83,7 @@ def test_githuborg_initenvauth(githuborg_fixture):
     githuborg_mock, _, env_mock = githuborg_fixture
     env_mock.return_value = 'token'
     GitHubOrg('org', auth=True)
-    githuborg_mock.assert_called_once_with('token')
+    githuborg_mock.assert_called_once_with('token', **OPTIONS)
 
 
 def test_githuborg_initerror(githuborg_fixture):
@@ -96,6 +106,199 @@ def test_githuborg_initautherror(githuborg_fixture):
     cred_mock.return_value.clean.assert_called_once_with()
 
 
+def test_githubsession_shared(githuborg_fixture):
+    """ Test that all organizations share one session """
+    githuborg_mock, cred_mock, _ = githuborg_fixture
+    cred_mock.return_value.load.return_value = ('user', 'pass')
+    GitHubOrg('org')
+    GitHubOrg('org').get_repo('repo1')
+    GitHubOrg('other').get_repo('repo2')
+    githuborg_mock.assert_called_once_with(None, None, **OPTIONS)
+    assert githuborg_mock.return_value.get_organization.call_args_list == [
+        mock.call('org'), mock.call('other')]
+
+    # Authenticating replaces the session, once
+    GitHubOrg('org', auth=True)
+    GitHubOrg('org', auth=True)
+    GitHubOrg('org')
+    assert githuborg_mock.call_count == 2
+    githuborg_mock.assert_called_with('user', 'pass', **OPTIONS)
+
+
+def test_githubsession_report(githuborg_fixture, capsys):
+    """ Test reporting the requests sent and the rate limit they used """
+    githuborg_mock, _, _ = githuborg_fixture
+    githuborg_mock.return_value.get_rate_limit.return_value.resources.core \
+        .remaining = 60
+    githuborg_mock.return_value.rate_limiting = (57, 60)
+    requester = githuborg_mock.return_value.requester
+    requester.graphql_url = 'https://api.github.com/graphql'
+    request = requester.requestJsonAndCheck
+    request.return_value = ({}, {'data': {}})
+    session = GitHubSession.get()
+
+    # Whatever sends the requests, PyGithub or not, they are counted
+    requester.requestJsonAndCheck('GET', '/repos/org/repo1')
+    requester.requestJsonAndCheck('GET', '/repos/org/repo1/tags')
+    requester.requestJsonAndCheck('POST', requester.graphql_url, input={})
+    assert request.call_args_list == [
+        mock.call('GET', '/repos/org/repo1'),
+        mock.call('GET', '/repos/org/repo1/tags'),
+        mock.call('POST', requester.graphql_url, input={})]
+    session.report()
+    assert "GitHub API: 3 requests (2 GET, 1 graphql), 3 of the " \
+        "rate limit used, 57 of 60 remaining" in capsys.readouterr().out
+
+
+def test_githuborg_cache(githuborg_fixture):
+    """ Test reading the lists of an organization through the cache """
+    githuborg_mock, _, _ = githuborg_fixture
+    cache = mock.MagicMock()
+    cache.get_all.side_effect = [
+        [{'name': 'repo1', 'clone_url': 'clone_url1', 'ssh_url': 'ssh_url1'},
+         {'name': 'repo2', 'clone_url': 'clone_url2', 'ssh_url': 'ssh_url2'}],
+        [{'name': 'v2'}, {'name': 'v10'}, {'name': 'v1'}]]
+    GitHubSession.set_cache(cache)
+    githuborg = GitHubOrg('org')
+    requester = githuborg_mock.return_value.requester
+
+    assert githuborg.get_repos(r'repo1') == {
+        'repo1': GitHubRepo('repo1', 'clone_url1', 'ssh_url1')}
+    cache.get_all.assert_called_once_with(
+        requester, '/orgs/org/repos?per_page=100')
+    assert githuborg.get_latest_tag('repo1') == 'v10'
+    cache.get_all.assert_called_with(
+        requester, '/repos/org/repo1/tags?per_page=100')
+    assert not githuborg_mock.return_value.get_organization.return_value \
+        .get_repos.called
+
+
+@pytest.mark.parametrize('tags,latest', [
+    (['v1.9', 'v1.10', 'v1.2'], 'v1.10'),
+    (['mame0250', 'mame0261', 'mame0255'], 'mame0261'),
+    (['v1', 'v01'], 'v1'),
+    (['v1.0', 'v1.0-rc1'], 'v1.0'),
+    (['v1.0-beta2', 'v1.0-rc1', 'v1.0-beta10'], 'v1.0-rc1'),
+    (['1.2.0', 'v1.0'], '1.2.0'),
+    (['v1.0', '1.0.0'], 'v1.0'),
+    (['v2.0', 'nightly', 'latest-build'], 'v2.0'),
+    ([], None),
+])
+def test_picklatesttag(tags, latest):
+    """ Test picking the tag with the highest version """
+    assert pick_latest_tag(tags) == latest
+    assert pick_latest_tag(reversed(tags)) == latest
+
+
+def test_githuborg_getlatesttag(githuborg_fixture):
+    """ Test reading the latest tag through REST """
+    githuborg_mock, _, _ = githuborg_fixture
+    repo = githuborg_mock.return_value.get_organization.return_value \
+        .get_repo.return_value
+    repo.get_tags.return_value = [types.SimpleNamespace(name=name)
+                                  for name in ('v2', 'v10', 'v1')]
+    assert GitHubOrg('org').get_latest_tag('repo1') == 'v10'
+    repo.get_tags.return_value = []
+    with pytest.raises(ValueError):
+        GitHubOrg('org').get_latest_tag('repo1')
+
+
+def graphql_tags(*tags):
+    """ Response to a query of the tags, one alias per repository, with
+        the tags of each on one page """
+    return {}, {'data': {
+        'r{}'.format(index): tag if tag is None else {'refs': {
+            'nodes': [{'name': tag}] if tag else [],
+            'pageInfo': {'hasNextPage': False, 'endCursor': None}}}
+        for index, tag in enumerate(tags)}}
+
+
+def test_githubgraphql_getrepos():
+    """ Test listing the repositories of an organization page by page """
+    requester = mock.MagicMock()
+    requester.requestJsonAndCheck.side_effect = [
+        ({}, {'data': {'organization': {'repositories': {
+            'nodes': [{'name': 'repo1', 'url': 'https://host/org/repo1',
+                       'sshUrl': 'ssh_url1'}],
+            'pageInfo': {'hasNextPage': True, 'endCursor': 'cursor'}}}}}),
+        ({}, {'data': {'organization': {'repositories': {
+            'nodes': [{'name': 'repo2', 'url': 'https://host/org/repo2',
+                       'sshUrl': 'ssh_url2'}],
+            'pageInfo': {'hasNextPage': False, 'endCursor': None}}}}}),
+    ]
+    assert GitHubGraphQL(requester).get_repos('org') == [
+        GitHubRepo('repo1', 'https://host/org/repo1.git', 'ssh_url1'),
+        GitHubRepo('repo2', 'https://host/org/repo2.git', 'ssh_url2')]
+    variables = [call[1]['input']['variables']
+                 for call in requester.requestJsonAndCheck.call_args_list]
+    assert [(var['org'], var['after']) for var in variables] == [
+        ('org', None), ('org', 'cursor')]
+
+
+def test_githubgraphql_getlatesttags(mocker):
+    """ Test reading the latest tags of many repositories in batches """
+    mocker.patch.object(GitHubGraphQL, 'BATCH_SIZE', 2)
+    requester = mock.MagicMock()
+    requester.requestJsonAndCheck.side_effect = [
+        graphql_tags('v1', None), graphql_tags('')]
+    assert GitHubGraphQL(requester).get_latest_tags(
+        [('org', 'repo1'), ('org', 'missing'), ('other', 'notags')]) == {
+            ('org', 'repo1'): 'v1', ('org', 'missing'): None,
+            ('other', 'notags'): None}
+    queries = [call[1]['input']['query']
+               for call in requester.requestJsonAndCheck.call_args_list]
+    assert len(queries) == 2
+    assert 'r1: repository(owner: "org", name: "missing")' in queries[0]
+    assert 'r0: repository(owner: "other", name: "notags")' in queries[1]
+
+
+def test_githubgraphql_moretags():
+    """ Test reading further pages of tags repository by repository """
+    requester = mock.MagicMock()
+    requester.requestJsonAndCheck.side_effect = [
+        ({}, {'data': {'r0': {'refs': {
+            'nodes': [{'name': 'v9'}, {'name': 'v1'}],
+            'pageInfo': {'hasNextPage': True, 'endCursor': 'cursor'}}}}}),
+        ({}, {'data': {'repository': {'refs': {
+            'nodes': [{'name': 'v10'}],
+            'pageInfo': {'hasNextPage': False, 'endCursor': None}}}}}),
+    ]
+    assert GitHubGraphQL(requester).get_latest_tags([('org', 'repo')]) == {
+        ('org', 'repo'): 'v10'}
+    assert requester.requestJsonAndCheck.call_args[1]['input'][
+        'variables'] == {'owner': 'org', 'name': 'repo', 'first': 100,
+                         'after': 'cursor'}
+
+
+def test_githubgraphql_error():
+    """ Test that a failed query raises """
+    requester = mock.MagicMock()
+    requester.requestJsonAndCheck.return_value = (
+        {}, {'data': None, 'errors': [{'message': 'syntax error'}]})
+    with pytest.raises(ValueError, match='syntax error'):
+        GitHubGraphQL(requester).get_latest_tags([('org', 'repo')])
+
+
+def test_githuborg_graphql(githuborg_fixture):
+    """ Test reading the expected latest tags together through GraphQL """
+    githuborg_mock, _, _ = githuborg_fixture
+    requester = githuborg_mock.return_value.requester
+    request = requester.requestJsonAndCheck
+    request.return_value = graphql_tags('v1', 'v2', None)
+    GitHubSession.set_api(GRAPHQL)
+    GitHubSession.expect_tags([('org', 'repo2'), ('org', 'repo3')])
+    githuborg = GitHubOrg('org')
+
+    assert githuborg.get_latest_tag('repo1') == 'v1'
+    assert githuborg.get_latest_tag('repo2') == 'v2'
+    with pytest.raises(ValueError):
+        githuborg.get_latest_tag('repo3')
+    assert request.call_count == 1
+    assert GitHubSession.current().requests['graphql'] == 1
+    assert not githuborg_mock.return_value.get_organization.return_value \
+        .get_repo.called
+
+
 def test_githuborg_getrepos(githuborg_fixture):
     """ Test getting GitHub repos """
     githuborg_mock, _, _ = githuborg_fixture
@@ -128,6 +331,24 @@ def test_githuborg_createrepo(githuborg_fixture):
     assert repo == githubrepo
 
 
+def test_githuborg_createexistingrepo(githuborg_fixture):
+    """ Test that a repo that exists already is taken as it is """
+    githuborg_mock, _, _ = githuborg_fixture
+    org = githuborg_mock.return_value.get_organization.return_value
+    org.get_repo.return_value = GitHubRepo('repo', 'clone_url', 'ssh_url')
+    org.create_repo.side_effect = github.GithubException(422, {
+        'message': 'Repository creation failed.',
+        'errors': [{'message': 'name already exists on this account'}]})
+    assert GitHubOrg('org').create_repo('repo') == org.get_repo.return_value
+    org.get_repo.assert_called_once_with('repo')
+
+    org.create_repo.side_effect = github.GithubException(422, {
+        'message': 'Repository creation failed.',
+        'errors': [{'message': 'name is too long'}]})
+    with pytest.raises(github.GithubException):
+        GitHubOrg('org').create_repo('repo')
+
+
 @pytest.fixture
 def gitmock(mocker):
     """ Setup mocked git.Repo """
@@ -268,6 +489,25 @@ def test_gitrepo_fetchresetlocal(gitrepo, gitmock):
     gitmock.return_value.git.clean.assert_called_once_with('-xffd')
 
 
+def test_gitrepo_fetchresetfetched(gitrepo, gitmock):
+    """ Test fetching ahead of resetting a repository """
+    gitmock.return_value.remotes.__contains__.return_value = True
+    gitmock.return_value.git.version_info = (2, 17, 0)
+    gitrepo.fetch()
+    gitmock.return_value.remotes.origin.fetch.assert_has_calls([
+        mock.call('master'),
+        mock.call(tags=True, prune=True, prune_tags=True)
+    ])
+    assert not gitmock.return_value.git.reset.called
+    gitmock.return_value.remotes.origin.fetch.reset_mock()
+    gitrepo.fetch_and_reset(fetch=False)
+    assert not gitmock.return_value.remotes.origin.fetch.called
+    gitmock.return_value.git.reset.assert_has_calls([
+        mock.call('--hard', 'origin/master'),
+        mock.call()
+    ])
+
+
 def test_gitrepo_fetchrebase(gitrepo, gitmock):
     """ Test fetching and rebasing a repo """
     gitmock.return_value.remotes.__contains__.return_value = True
@@ -404,6 +644,18 @@ def test_gitrepo_describenohead(gitrepo, gitmock):
     gitmock.return_value.git.describe.assert_not_called()
 
 
+def test_gitrepo_describepath(gitmock, mocker):
+    """ Test describing a repository without creating it """
+    mocker.patch('kodi_game_scripting.git_access.GitRepo.is_git_repo',
+                 side_effect=[False, True])
+    assert not GitRepo.describe_path('tmpdir/repo')
+    gitmock.assert_not_called()
+    gitmock.init.assert_not_called()
+    gitmock.return_value.head.is_valid.return_value = True
+    assert GitRepo.describe_path('tmpdir/repo')
+    gitmock.assert_called_once_with('tmpdir/repo')
+
+
 def test_gitrepo_push(gitrepo, gitmock):
     """ Test push change """
     gitmock.return_value.is_dirty.return_value = False
@@ -424,3 +676,40 @@ def test_gitrepo_pushtags(gitrepo, gitmock):
     gitmock.return_value.is_dirty.return_value = False
     gitrepo.push('branch', tags=True)
     gitmock.return_value.git.push.assert_called_once_with('--tags')
+
+
+def test_gitrepo_stagedpush(gitrepo, gitmock):
+    """ Test uploading ahead of a push, which removes the staging ref """
+    gitmock.return_value.is_dirty.return_value = False
+    gitrepo.stage_push()
+    gitrepo.push('master', staged=True)
+    assert gitmock.return_value.remotes.origin.push.call_args_list == [
+        mock.call('+HEAD:' + STAGING_REF),
+        mock.call(['HEAD:master', ':' + STAGING_REF], force=False)]
+
+
+def test_gitrepo_pushretry(mocker, gitrepo, gitmock):
+    """ Test retrying a push that failed because of the network """
+    sleep_mock = mocker.patch('kodi_game_scripting.retry.time.sleep')
+    gitmock.return_value.is_dirty.return_value = False
+    gitmock.return_value.remotes.origin.push.side_effect = [
+        git.exc.GitCommandError('git push', 128, stderr="fatal: unable to "
+                                "access: Could not resolve host: github.com"),
+        None]
+    gitrepo.push('branch')
+    assert gitmock.return_value.remotes.origin.push.call_count == 2
+    assert sleep_mock.called
+
+
+def test_gitrepo_fetchmain(mocker, gitrepo, gitmock):
+    """ Test that a missing master branch isn't retried, but main fetched """
+    sleep_mock = mocker.patch('kodi_game_scripting.retry.time.sleep')
+    gitmock.return_value.remotes.__contains__.return_value = True
+    gitmock.return_value.git.version_info = (2, 17, 0)
+    gitmock.return_value.remotes.origin.fetch.side_effect = [
+        git.exc.GitCommandError('git fetch', 128, stderr="fatal: couldn't "
+                                "find remote ref master"), None, None]
+    gitrepo.fetch()
+    assert gitmock.return_value.remotes.origin.fetch.call_args_list[:2] == [
+        mock.call('master'), mock.call('main')]
+    assert not sleep_mock.called
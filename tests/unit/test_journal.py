@@ -0,0 +1,69 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test Journal """
+
+import pytest
+
+from kodi_game_scripting.journal import Journal
+
+pytestmark = [pytest.mark.unit]
+
+
+def test_journal_resume(tmp_path):
+    """ Test resuming the journal of a previous run """
+    journal = Journal(str(tmp_path), {'compile': True})
+    assert not journal.start(resume=True)
+    journal.record('addon', 'fetch', {'error': OSError('bad')}, {'head': 'a'})
+    journal.record('addon', 'build', {}, {'head': 'a', 'library': None})
+
+    journal = Journal(str(tmp_path), {'compile': True})
+    assert journal.start(resume=True)
+    assert journal.completed('addon') == [
+        {'stage': 'fetch', 'info': {'error': 'bad'}, 'state': {'head': 'a'}},
+        {'stage': 'build', 'info': {},
+         'state': {'head': 'a', 'library': None}},
+    ]
+    assert not journal.completed('other')
+
+
+def test_journal_restart(tmp_path):
+    """ Test that a journal isn't resumed by a different or fresh run """
+    journal = Journal(str(tmp_path), {'compile': True})
+    journal.start()
+    journal.record('addon', 'fetch', {}, {})
+
+    journal = Journal(str(tmp_path), {'compile': False})
+    assert not journal.start(resume=True)
+    assert not journal.completed('addon')
+
+    journal = Journal(str(tmp_path), {'compile': False})
+    assert journal.start(resume=True)
+    journal = Journal(str(tmp_path), {'compile': False})
+    assert not journal.start()
+
+
+def test_journal_rerun(tmp_path):
+    """ Test that running a stage again drops what came after it """
+    journal = Journal(str(tmp_path), {})
+    journal.start()
+    for stage in ('fetch', 'build', 'metadata'):
+        journal.record('addon', stage, {}, {})
+    journal.record('addon', 'build', {'again': True}, {})
+    assert journal.completed('addon') == [
+        {'stage': 'fetch', 'info': {}, 'state': {}},
+        {'stage': 'build', 'info': {'again': True}, 'state': {}},
+    ]
@@ -16,17 +16,26 @@
 
 """ Test KodiGameAddon """
 
+# pylint: disable=too-many-lines
+
+import argparse
+import json
 import os
+import subprocess
+import threading
+import time
 
 from unittest import mock
 
 import pytest
 
-from kodi_game_scripting import config
+from kodi_game_scripting import config, tracing, utils
 from kodi_game_scripting.process_game_addons import \
-    KodiAddonDescriptions, KodiGameAddon
-from kodi_game_scripting.git_access import GitHubRepo
+    KodiAddonDescriptions, KodiGameAddon, KodiGameAddons
+from kodi_game_scripting.git_access import GitHubRepo, GitRepo
 from kodi_game_scripting.libretro_ctypes import LibretroWrapper
+from kodi_game_scripting.scheduler import TaskGraph
+from kodi_game_scripting.template_processor import Change, TemplateProcessor
 
 pytestmark = [pytest.mark.unit]
 
@@ -53,6 +62,14 @@ def githuborgmock(mocker):
                         autospec=True)
 
 
+@pytest.fixture(autouse=True)
+def githubsessionmock(mocker):
+    """ Setup mocked GitHubSession """
+    return mocker.patch(
+        'kodi_game_scripting.process_game_addons.GitHubSession',
+        autospec=True)
+
+
 @pytest.fixture(autouse=True)
 def gitrepomock(mocker):
     """ Setup mocked GitRepo """
@@ -60,6 +77,14 @@ def gitrepomock(mocker):
                         autospec=True)
 
 
+@pytest.fixture(autouse=True)
+def libretrosuperfetchmock(mocker):
+    """ Setup mocked fetching of libretro-super """
+    return mocker.patch(
+        'kodi_game_scripting.process_game_addons.LibretroSuper.'
+        'fetch_and_reset')
+
+
 @pytest.fixture(autouse=True)
 def libretrowrappermock(mocker):
     """ Setup mocked LibretroWrapper """
@@ -118,7 +143,10 @@ def test_kodigameaddon_init(kodigameaddon, gitrepomock):
     """ Test initializing KodiGameAddon """
     assert kodigameaddon.name == 'game.mygame'
     assert kodigameaddon.game_name == 'mygame'
-    gitrepomock.assert_called_once_with(GITHUBREPO, 'tmpdir')
+    gitrepomock.assert_not_called()
+    kodigameaddon.fetch()
+    kodigameaddon.fetch()
+    gitrepomock.assert_called_once_with(GITHUBREPO, 'tmpdir', None)
 
 
 def test_kodigameaddon_processdescription(kodigameaddon,
@@ -307,17 +335,15 @@ def test_kodigameaddon_loadassets(kodigameaddon, mocker):
 
 def test_kodigameaddon_gittag(kodigameaddon, githuborgmock):
     """ Test loaing git tag """
-    tagmock = mock.MagicMock()
-    tagnamemock = mock.PropertyMock(return_value='mytag')
-    type(tagmock).name = tagnamemock
-    githuborgmock.return_value.get_repo.return_value.get_tags.return_value \
-        .__getitem__.return_value = tagmock
+    githuborgmock.return_value.get_latest_tag.return_value = 'mytag'
     kodigameaddon.info['libretro_repo']['git_tag'] = False
     kodigameaddon.load_git_tag()
     assert kodigameaddon.info['libretro_repo']['branch'] == 'master'
     kodigameaddon.info['libretro_repo']['git_tag'] = True
     kodigameaddon.load_git_tag()
-    tagnamemock.assert_called_once_with()
+    githuborgmock.assert_called_once_with('libretro', auth=True)
+    githuborgmock.return_value.get_latest_tag.assert_called_once_with(
+        kodigameaddon.info['libretro_repo']['name'])
     assert kodigameaddon.info['libretro_repo']['branch'] == 'mytag'
 
 
@@ -396,7 +422,9 @@ def test_kodigameaddon_fetchreset(kodigameaddon, gitrepomock):
     """ Test fetching and resetting from Git """
     kodigameaddon.fetch_and_reset(reset=True)
     gitrepomock.return_value.fetch_and_reset.assert_called_once_with(
-        reset=True)
+        reset=True, fetch=True)
+    kodigameaddon.fetch()
+    gitrepomock.return_value.fetch.assert_called_once_with()
 
 
 def test_kodigameaddon_commit(kodigameaddon, gitrepomock):
@@ -417,7 +445,7 @@ def test_kodigameaddon_push(kodigameaddon, gitrepomock):
     """ Test pushing changes (master branch) """
     kodigameaddon.push()
     gitrepomock.return_value.push.assert_called_once_with(
-        'master', tags=True, sleep=mock.ANY)
+        'master', tags=True, staged=False)
 
 
 def test_kodigameaddon_pushbranch(kodigameaddon, gitrepomock):
@@ -425,4 +453,815 @@ def test_kodigameaddon_pushbranch(kodigameaddon, gitrepomock):
     kodigameaddon.info['game']['branch'] = 'testbranch'
     kodigameaddon.push()
     gitrepomock.return_value.push.assert_called_once_with(
-        'testbranch', tags=False, sleep=mock.ANY)
+        'testbranch', tags=False, staged=False)
+
+
+@pytest.mark.parametrize('depends,expected', [
+    ('mygame https://github.com/libretro/mygame-repo master\n',
+     'mygame {mirror} master\n'),
+    ('mygame https://github.com/libretro/mygame-repo/archive/0123abc.tar.gz'
+     '\n', 'mygame {mirror} 0123abc\n'),
+])
+def test_kodigameaddon_stage(tmp_path, depends, expected):
+    """ Test staging a copy of the addon that fetches from a mirror """
+    addon = KodiGameAddon('game.mygame', 'mygame', GITHUBREPO,
+                          str(tmp_path / 'addons'), 'master')
+    depends_dir = tmp_path / 'addons' / 'game.mygame' / 'depends' / \
+        'common' / 'mygame'
+    depends_dir.mkdir(parents=True)
+    (depends_dir / 'mygame.txt').write_text(depends)
+    (tmp_path / 'addons' / 'game.mygame' / '.git').mkdir()
+
+    staging = str(tmp_path / 'staging')
+    assert addon.stage(staging, '/mirror.git') == staging
+    staged = tmp_path / 'staging' / 'game.mygame'
+    assert (staged / 'depends' / 'common' / 'mygame' /
+            'mygame.txt').read_text() == expected.format(mirror='/mirror.git')
+    assert not (staged / '.git').exists()
+    assert depends_dir.joinpath('mygame.txt').read_text() == depends
+
+
+def make_args(**kwargs):
+    """ Command line arguments for KodiGameAddons """
+    args = {
+        'filter': '', 'git': False, 'git_noclean': False,
+        'working_directory': 'tmpdir', 'kodi_directory': 'kodidir',
+        'push_branch': None, 'push_limit': None, 'compile': False,
+        'buildtype': 'Release', 'jobs': 1, 'resume': False,
+        'skip_unchanged': False, 'profile_stage': None, 'plan': False,
+        'shard': None, 'shard_weights': None, 'results_jsonl': None,
+        'build_jobs': None, 'build_memory': None, 'incremental_build': False,
+        'artifact_cache': None, 'compiler_cache': None,
+        'compiler_cache_dir': None, 'compiler_cache_size': None,
+        'source_cache': None, 'fetch_jobs': 8, 'object_store': None,
+        'api_cache': None, 'api_cache_ttl': 300, 'github_api': 'rest',
+        'retries': 4, 'push_jobs': 1,
+    }
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def gameaddonsconfig(mocker, gitrepomock):
+    """ Configure three addons """
+    gitrepomock.return_value.get_hexsha.return_value = 'head'
+    return mocker.patch.dict('kodi_game_scripting.config.ADDONS', {
+        name: ('{}-repo'.format(name), 'Makefile', '.', 'jni', {})
+        for name in ('game1', 'game2', 'game3')}, clear=True)
+
+
+def mock_addons(mocker, calls):
+    """ Record the stages KodiGameAddon goes through """
+    def record(name):
+        def method(self, *args, **kwargs):  # pylint: disable=unused-argument
+            calls.append((self.game_name, name))
+        return method
+
+    for name in ('fetch', 'fetch_and_reset', 'load_git_tag', 'load_addon_xml',
+                 'load_strings', 'process_addon_files', 'load_info_file',
+                 'load_assets', 'load_library_file', 'load_git_revision',
+                 'load_game_version', 'load_exclude_platforms', 'commit',
+                 'stage_push', 'push', 'tag', 'process_description_files'):
+        mocker.patch.object(KodiGameAddon, name, record(name))
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_kodigameaddons_process(mocker, tmp_path, gameaddonsconfig, jobs):
+    """ Test that every addon goes through its stages in order """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    gameaddons = KodiGameAddons(make_args(
+        jobs=jobs, git=True, working_directory=str(tmp_path)))
+    assert gameaddons.process()
+
+    for game in ('game1', 'game2', 'game3'):
+        assert [name for addon, name in calls if addon == game] == [
+            'fetch', 'fetch_and_reset', 'load_git_tag', 'load_addon_xml',
+            'load_strings', 'process_addon_files',
+            'process_description_files', 'load_info_file', 'load_assets',
+            'load_library_file', 'load_git_revision', 'load_game_version',
+            'load_exclude_platforms', 'process_addon_files', 'commit']
+
+
+def test_kodigameaddons_fetchfailure(mocker, tmp_path, gameaddonsconfig,
+                                     libretrosuperfetchmock, capsys):
+    """ Test that all repositories are fetched before the stages run """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+
+    def fetch(self):
+        calls.append((self.game_name, 'fetch'))
+        if self.game_name == 'game2':
+            raise RuntimeError('unreachable')
+    mocker.patch.object(KodiGameAddon, 'fetch', fetch)
+    gameaddons = KodiGameAddons(make_args(
+        jobs=4, git=True, working_directory=str(tmp_path)))
+    assert not gameaddons.process()
+
+    libretrosuperfetchmock.assert_called_once_with()
+    assert [name for _, name in calls[:3]] == ['fetch'] * 3
+    assert ('game2', 'fetch_and_reset') not in calls
+    assert gameaddons.get_results()[
+        'game.libretro.game2']['status'] == 'failed'
+    output = capsys.readouterr().out
+    assert 'Fetched 4 repositories' in output
+    assert '1 failed: game.libretro.game2' in output
+
+    libretrosuperfetchmock.side_effect = RuntimeError('unreachable')
+    with pytest.raises(RuntimeError):
+        KodiGameAddons(make_args(
+            git=True, working_directory=str(tmp_path))).process()
+
+
+def test_kodigameaddons_objectstore(tmp_path, gameaddonsconfig,
+                                    gitrepomock):
+    """ Test that the addon repositories borrow from the object store """
+    # pylint: disable=unused-argument
+    store = str(tmp_path / 'store.git')
+    gameaddons = KodiGameAddons(make_args(object_store=store,
+                                          working_directory=str(tmp_path)))
+    assert os.path.isdir(store)
+    for addon in gameaddons._addons:  # pylint: disable=protected-access
+        addon.fetch()
+    assert gitrepomock.call_count == 3
+    for call in gitrepomock.call_args_list:
+        assert call[0][2] == os.path.join(store, 'objects')
+
+
+def test_kodigameaddons_githubapi(mocker, githubsessionmock):
+    """ Test that the latest tags to read are announced to the session """
+    mocker.patch.dict('kodi_game_scripting.config.ADDONS', {
+        'game1': ('org/game1-repo', 'Makefile', '.', 'jni', {'git_tag': True}),
+        'game2': ('game2-repo', 'Makefile', '.', 'jni', {}),
+        'game3': ('game3-repo', 'Makefile', '.', 'jni', {'git_tag': True}),
+    }, clear=True)
+    KodiGameAddons(make_args(github_api='graphql'))
+    githubsessionmock.set_api.assert_called_once_with('graphql')
+    assert list(githubsessionmock.expect_tags.call_args[0][0]) == [
+        ('org', 'game1-repo'), ('libretro', 'game3-repo')]
+
+
+def test_kodigameaddons_processpushorder(mocker, tmp_path, gameaddonsconfig):
+    """ Test that pushes happen in reversed order, up to the push limit,
+        and at least PUSH_GAP apart """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch('kodi_game_scripting.process_game_addons.PUSH_GAP', 0.2)
+    times = []
+
+    def push(self, staged=False):  # pylint: disable=unused-argument
+        times.append(time.monotonic())
+        calls.append((self.game_name, 'push'))
+    mocker.patch.object(KodiGameAddon, 'push', push)
+    mocker.patch.object(KodiGameAddon, 'needs_version_bump',
+                        return_value=False)
+    gameaddons = KodiGameAddons(make_args(
+        jobs=4, git=True, push_branch='master', push_limit=2,
+        working_directory=str(tmp_path)))
+    for addon in gameaddons._addons:  # pylint: disable=protected-access
+        addon.info['git']['diff'] = 'diff'
+    assert gameaddons.process()
+    assert [addon for addon, name in calls if name == 'push'] == [
+        'game3', 'game2']
+    assert times[1] - times[0] >= 0.2
+
+
+def test_kodigameaddons_processpushjobs(mocker, tmp_path, gameaddonsconfig,
+                                        capsys):
+    """ Test uploading at once, and updating the branches in order """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch('kodi_game_scripting.process_game_addons.PUSH_GAP', 0.2)
+    uploaded = threading.Event()
+    times = []
+
+    def stage_push(self):
+        # The first addon to publish is the last to be uploaded
+        if self.game_name == 'game3':
+            assert uploaded.wait(5)
+        calls.append((self.game_name, 'stage_push'))
+        if len([name for _, name in calls if name == 'stage_push']) == 2:
+            uploaded.set()
+
+    def push(self, staged=False):
+        times.append(time.monotonic())
+        calls.append((self.game_name, 'push', staged))
+    mocker.patch.object(KodiGameAddon, 'stage_push', stage_push)
+    mocker.patch.object(KodiGameAddon, 'push', push)
+    mocker.patch.object(KodiGameAddon, 'needs_version_bump',
+                        return_value=False)
+    gameaddons = KodiGameAddons(make_args(
+        git=True, push_branch='master', push_jobs=3,
+        working_directory=str(tmp_path)))
+    for addon in gameaddons._addons:  # pylint: disable=protected-access
+        addon.info['git']['diff'] = 'diff'
+    assert gameaddons.process()
+    pushes = [call[0] for call in calls if call[1:] == ('push', True)]
+    assert pushes == ['game3', 'game2', 'game1']
+    assert calls.index(('game3', 'stage_push')) < \
+        calls.index(('game3', 'push', True))
+    # The branch updates are quick, but still in separate seconds on GitHub
+    assert all(later - earlier >= 0.2
+               for earlier, later in zip(times, times[1:]))
+    assert "Pushed 3 repositories in" in capsys.readouterr().out
+
+
+def test_kodigameaddons_processbuildfailure(mocker, tmp_path,
+                                            gameaddonsconfig):
+    """ Test that a failed build only stops its own addon """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch('kodi_game_scripting.utils.run_measured', side_effect=[
+        None, subprocess.CalledProcessError(1, 'cmake'), None, None, None,
+        None])
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, working_directory=str(tmp_path)))
+    assert not gameaddons.process()
+    assert ('game1', 'load_info_file') not in calls
+    assert ('game2', 'load_info_file') in calls
+    assert ('game3', 'load_info_file') in calls
+
+    results = gameaddons.get_results()
+    assert results['game.libretro.game1']['status'] == 'failed'
+    assert results['game.libretro.game2']['status'] == 'done'
+    build = results['game.libretro.game1']['info']['build']
+    assert build['status'] == 'failed'
+    assert 'cmake' in build['error']
+    assert results['game.libretro.game2']['info']['build']['status'] == \
+        'done'
+
+
+def test_kodigameaddons_processfailure(mocker, tmp_path, gameaddonsconfig):
+    """ Test that a failure other than a build stops the run """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch.object(KodiGameAddon, 'load_addon_xml',
+                        side_effect=ValueError('addon.xml'))
+    mocker.patch('kodi_game_scripting.utils.run_measured',
+                 return_value=None)
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, working_directory=str(tmp_path)))
+    assert not gameaddons.process()
+    assert ('game2', 'load_git_tag') not in calls
+
+
+@pytest.mark.parametrize('jobs,build_jobs', [(1, 8), (3, 8), (4, 2)])
+def test_kodigameaddons_buildjobs(mocker, tmp_path, gameaddonsconfig, jobs,
+                                  build_jobs):
+    """ Test that concurrent builds share the build jobs """
+    # pylint: disable=unused-argument,too-many-arguments
+    mock_addons(mocker, [])
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=None)
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, jobs=jobs, build_jobs=build_jobs,
+        working_directory=str(tmp_path)))
+    assert gameaddons.process()
+    share = max(1, build_jobs // min(jobs, 3))
+    builds = [call for call in runmock.call_args_list
+              if '--build' in call[0][0]]
+    assert len(builds) == 3
+    for call in builds:
+        assert call[0][0][-1] == '-j{}'.format(share)
+        assert call[1]['env']['BUILDTHREADS'] == str(share)
+    assert {result['info']['build']['jobs'] for result
+            in gameaddons.get_results().values()} == {share}
+
+
+def test_kodigameaddons_compileshared(mocker, tmp_path, gameaddonsconfig):
+    """ Test that addons sharing an upstream are built from a mirror """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    gameaddonsconfig['game2'] = ('game1-repo', 'Makefile', '.', 'jni', {})
+    mirrormock = mocker.patch('kodi_game_scripting.upstream.GitRepo.mirror')
+    stagemock = mocker.patch.object(KodiGameAddon, 'stage',
+                                    side_effect=lambda staging, url: staging)
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=None)
+    assert KodiGameAddons(make_args(
+        compile=True, working_directory=str(tmp_path))).process()
+
+    mirror = os.path.join(str(tmp_path), 'sources', 'libretro',
+                          'game1-repo.git')
+    mirrormock.assert_called_once_with(
+        'https://github.com/libretro/game1-repo', mirror)
+    assert stagemock.call_count == 2
+    prefixes = [arg for call in runmock.call_args_list for arg in call[0][0]
+                if arg.startswith('-DADDON_SRC_PREFIX=')]
+    assert sorted(prefixes) == sorted([
+        '-DADDON_SRC_PREFIX={}'.format(os.path.join(str(tmp_path),
+                                                    'staging'))] * 2 + [
+        '-DADDON_SRC_PREFIX={}'.format(str(tmp_path))])
+
+
+def test_kodigameaddons_sourcecache(mocker, tmp_path, gameaddonsconfig):
+    """ Test that with a source cache every addon is built from a mirror """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    mirrormock = mocker.patch('kodi_game_scripting.upstream.GitRepo.mirror')
+    stagemock = mocker.patch.object(KodiGameAddon, 'stage',
+                                    side_effect=lambda staging, url: staging)
+    mocker.patch('kodi_game_scripting.utils.run_measured', return_value=None)
+    cache = str(tmp_path / 'cache')
+    assert KodiGameAddons(make_args(
+        compile=True, source_cache=cache,
+        working_directory=str(tmp_path / 'wd'))).process()
+
+    assert sorted(call[0] for call in mirrormock.call_args_list) == [
+        ('https://github.com/libretro/{}-repo'.format(name),
+         os.path.join(cache, 'libretro', '{}-repo.git'.format(name)))
+        for name in ('game1', 'game2', 'game3')]
+    assert sorted(call[0][1] for call in stagemock.call_args_list) == [
+        os.path.join(cache, 'libretro', '{}-repo.git'.format(name))
+        for name in ('game1', 'game2', 'game3')]
+
+
+def test_kodigameaddons_buildhistory(mocker, tmp_path, gameaddonsconfig,
+                                     capsys):
+    """ Test that the longest builds start first and are recorded """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch('kodi_game_scripting.utils.run_measured',
+                 return_value=None)
+    utils.write_json(str(tmp_path / 'build-history.json'), {
+        'game.libretro.game1': {'duration': 10.0},
+        'game.libretro.game3': {'duration': 500.0}})
+    assert KodiGameAddons(make_args(
+        compile=True, working_directory=str(tmp_path))).process()
+    assert [addon for addon, name in calls if name == 'load_git_tag'] == [
+        'game3', 'game2', 'game1']
+    assert 'Builds of 3 addons took' in capsys.readouterr().out
+
+    history = utils.read_json(str(tmp_path / 'build-history.json'))
+    assert sorted(history) == ['game.libretro.game1', 'game.libretro.game2',
+                               'game.libretro.game3']
+    assert history['game.libretro.game3']['duration'] < 500.0
+
+
+def test_kodigameaddons_buildmemory(mocker, tmp_path, gameaddonsconfig):
+    """ Test that builds take no more jobs than their memory allows """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    gameaddonsconfig['game3'] = ('game3-repo', 'Makefile', '.', 'jni',
+                                 {'build_jobs': 1})
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=100 * 1024 * 1024)
+    utils.write_json(str(tmp_path / 'build-history.json'), {
+        'game.libretro.game1': {'duration': 10.0,
+                                'memory': 300 * 1024 * 1024}})
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, build_jobs=8, build_memory=1024,
+        working_directory=str(tmp_path)))
+    assert gameaddons.process()
+    assert [call[0][0][-1] for call in runmock.call_args_list
+            if '--build' in call[0][0]] == ['-j3', '-j5', '-j1']
+
+    results = gameaddons.get_results()
+    assert results['game.libretro.game2']['info']['build']['memory'] == \
+        100 * 1024 * 1024
+    history = utils.read_json(str(tmp_path / 'build-history.json'))
+    assert history['game.libretro.game1']['memory'] == 200 * 1024 * 1024
+
+
+def test_kodigameaddons_incrementalbuild(mocker, tmp_path, gameaddonsconfig,
+                                         gitrepomock):
+    """ Test that only builds whose inputs changed run again """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'sha1'}
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=None)
+    args = make_args(compile=True, incremental_build=True,
+                     working_directory=str(tmp_path))
+
+    def run():
+        runmock.reset_mock()
+        gameaddons = KodiGameAddons(args)
+        assert gameaddons.process()
+        for addon in gameaddons._addons:  # pylint: disable=protected-access
+            library = tmp_path / addon.info['library']['file']
+            library.parent.mkdir(parents=True, exist_ok=True)
+            library.touch()
+        return [(os.path.basename(call[1]['cwd']),
+                 'build' if '--build' in call[0][0] else 'configure')
+                for call in runmock.call_args_list]
+
+    assert len(run()) == 6
+    assert not run()
+
+    depends = tmp_path / 'game.libretro.game1' / 'depends'
+    depends.mkdir(parents=True)
+    (depends / 'game1.txt').write_text('game1 url master')
+    marker = tmp_path / 'build' / 'game.libretro.game2' / 'marker'
+    marker.touch()
+    assert run() == [('game.libretro.game1', 'configure'),
+                     ('game.libretro.game1', 'build')]
+
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'sha2'}
+    assert sorted(run()) == [('game.libretro.{}'.format(game), 'build')
+                             for game in ('game1', 'game2', 'game3')]
+    assert marker.exists()
+
+
+def test_kodigameaddons_artifactcache(mocker, tmp_path, gameaddonsconfig,
+                                      gitrepomock):
+    """ Test that libraries built before are taken from the cache """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'sha1'}
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=None)
+    probes = {}
+
+    def load_library_file(self):
+        probes[self.name] = self.library_probe
+        library = os.path.join(self._working_directory,  # pylint: disable=protected-access
+                               self.info['library']['file'])
+        if not os.path.isfile(library):
+            utils.ensure_directory_exists(os.path.dirname(library))
+            with open(library, 'w', encoding='utf-8') as library_ctx:
+                library_ctx.write(self.name)
+        return mock.Mock(probe_data={'result': self.name})
+
+    mocker.patch.object(KodiGameAddon, 'load_library_file', load_library_file)
+    cache = str(tmp_path / 'cache')
+    assert KodiGameAddons(make_args(
+        compile=True, artifact_cache=cache,
+        working_directory=str(tmp_path / 'first'))).process()
+    assert len(runmock.call_args_list) == 6
+    assert set(probes.values()) == {None}
+
+    runmock.reset_mock()
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, artifact_cache=cache,
+        working_directory=str(tmp_path / 'second')))
+    assert gameaddons.process()
+    assert not runmock.called
+    assert probes == {'game.libretro.{}'.format(game): {
+        'result': 'game.libretro.{}'.format(game)}
+                      for game in ('game1', 'game2', 'game3')}
+    assert all(result['info']['build']['cached'] for result
+               in gameaddons.get_results().values())
+
+    runmock.reset_mock()
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'sha2'}
+    assert KodiGameAddons(make_args(
+        compile=True, artifact_cache=cache,
+        working_directory=str(tmp_path / 'second'))).process()
+    assert len(runmock.call_args_list) == 6
+
+
+def test_kodigameaddons_artifactcachesource(mocker, tmp_path, gitrepomock):
+    """ Test that a library from the cache renders the same files as its
+        build, without the checkout of the core """
+    mocker.patch.dict('kodi_game_scripting.config.ADDONS', {
+        'game1': ('game1-repo', 'Makefile', '.', 'jni', {})}, clear=True)
+    mocker.patch('kodi_game_scripting.process_game_addons.TemplateProcessor',
+                 TemplateProcessor)
+    real = ('process_addon_files', 'load_git_revision',
+            'load_exclude_platforms')
+    methods = {name: getattr(KodiGameAddon, name) for name in real}
+    mock_addons(mocker, [])
+    for name, method in methods.items():
+        mocker.patch.object(KodiGameAddon, name, method)
+
+    def load_library_file(self):
+        library = os.path.join(self._working_directory,  # pylint: disable=protected-access
+                               self.info['library']['file'])
+        if not os.path.isfile(library):
+            utils.ensure_directory_exists(os.path.dirname(library))
+            with open(library, 'w', encoding='utf-8') as library_ctx:
+                library_ctx.write(self.name)
+        return mock.Mock(probe_data={'result': self.name})
+    mocker.patch.object(KodiGameAddon, 'load_library_file', load_library_file)
+    gitrepomock.is_git_repo.return_value = True
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'sha1'}
+    gitrepomock.return_value.get_hexsha.return_value = 'sha1'
+
+    def run_measured(command, cwd, **kwargs):  # pylint: disable=unused-argument
+        if '--build' not in command:
+            return None
+        source = os.path.join(cwd, 'build', 'game1', 'src', 'game1', 'jni')
+        utils.ensure_directory_exists(source)
+        with open(os.path.join(source, 'Application.mk'), 'w',
+                  encoding='utf-8') as makefile_ctx:
+            makefile_ctx.write('APP_STL := gnustl_static\n')
+        return None
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           side_effect=run_measured)
+
+    def rendered(directory, *path):
+        with open(os.path.join(str(tmp_path), directory, 'game.libretro.game1',
+                               *path), encoding='utf-8') as file_ctx:
+            return file_ctx.read()
+
+    cache = str(tmp_path / 'cache')
+    for directory in ('first', 'second'):
+        assert KodiGameAddons(make_args(
+            compile=True, artifact_cache=cache,
+            working_directory=str(tmp_path / directory))).process()
+    assert len(runmock.call_args_list) == 2
+
+    depends = ('depends', 'common', 'game1', 'game1.txt')
+    assert rendered('second', *depends) == rendered('first', *depends)
+    assert 'archive/sha1.tar.gz' in rendered('second', *depends)
+    assert rendered('second', 'Jenkinsfile') == rendered('first', 'Jenkinsfile')
+    assert 'android' not in rendered('second', 'Jenkinsfile')
+
+
+def test_kodigameaddons_compilercache(mocker, tmp_path, gameaddonsconfig,
+                                      templateprocessormock):
+    """ Test building through a compiler cache and reporting its stats """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    runmock = mocker.patch('kodi_game_scripting.utils.run_measured',
+                           return_value=None)
+    cachemock = mocker.patch(
+        'kodi_game_scripting.process_game_addons.CompilerCache',
+        autospec=True)
+    cachemock.return_value.environment.return_value = {
+        'CMAKE_C_COMPILER_LAUNCHER': 'ccache'}
+    cachemock.return_value.get_stats.return_value = {
+        'tool': 'ccache', 'hits': 3, 'misses': 1}
+    gameaddons = KodiGameAddons(make_args(
+        compile=True, compiler_cache='ccache', compiler_cache_size='1G',
+        working_directory=str(tmp_path)))
+    assert gameaddons.process()
+
+    cachemock.assert_called_once_with('ccache', None, '1G')
+    cachemock.return_value.zero_stats.assert_called_once_with()
+    # Both configuring and building a core pick up the launcher
+    assert runmock.call_args_list
+    assert all(call[1]['env']['CMAKE_C_COMPILER_LAUNCHER'] == 'ccache'
+               for call in runmock.call_args_list)
+
+    gameaddons.summary()
+    assert templateprocessormock.process.call_args[0][2][
+        'compiler_cache'] == {'tool': 'ccache', 'hits': 3, 'misses': 1}
+
+
+def test_kodigameaddons_buildpriority(mocker, tmp_path, gameaddonsconfig):
+    """ Test that only the stages up to the build are prioritized """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    mocker.patch('kodi_game_scripting.utils.run_measured',
+                 return_value=None)
+    add = mocker.spy(TaskGraph, 'add')
+    utils.write_json(str(tmp_path / 'build-history.json'), {
+        'game.libretro.game1': {'duration': 10.0},
+        'game.libretro.game3': {'duration': 500.0}})
+    assert KodiGameAddons(make_args(
+        compile=True, git=True, working_directory=str(tmp_path))).process()
+    priorities = {call[0][1]: call[1].get('priority', 0)
+                  for call in add.call_args_list}
+    assert priorities[('game.libretro.game3', 'makefiles')] == 500.0
+    assert priorities[('game.libretro.game3', 'build')] == 500.0
+    for stage in ('metadata', 'commit', 'version'):
+        assert priorities[('game.libretro.game3', stage)] == 0
+
+
+def test_kodigameaddons_resume(mocker, tmp_path, gameaddonsconfig,
+                               gitrepomock):
+    """ Test resuming a run that failed part way """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch('kodi_game_scripting.utils.run_measured', side_effect=[
+        None, None, None, subprocess.CalledProcessError(1, 'cmake'), None,
+        None])
+    args = make_args(compile=True, git=True, working_directory=str(tmp_path))
+    assert not KodiGameAddons(args).process()
+    assert ('game1', 'commit') in calls
+    assert ('game2', 'commit') not in calls
+    assert ('game3', 'commit') in calls
+
+    # The first and last addon are done, the second needs building again
+    calls.clear()
+    mocker.patch('kodi_game_scripting.utils.run_measured',
+                 return_value=None)
+    args.resume = True
+    assert KodiGameAddons(args).process()
+    assert not [name for addon, name in calls if addon == 'game1']
+    assert [name for addon, name in calls if addon == 'game2'] == [
+        'load_info_file', 'load_assets', 'load_library_file',
+        'load_git_revision', 'load_game_version', 'load_exclude_platforms',
+        'process_addon_files', 'commit']
+    assert not [name for addon, name in calls if addon == 'game3']
+
+    # Nothing is skipped once the checkout moved on
+    calls.clear()
+    gitrepomock.return_value.get_hexsha.return_value = 'other'
+    assert KodiGameAddons(args).process()
+    assert ('game1', 'fetch_and_reset') in calls
+
+
+def test_kodigameaddons_noresume(mocker, tmp_path, gameaddonsconfig):
+    """ Test that a run doesn't resume a journal of different arguments """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    assert KodiGameAddons(make_args(
+        git=True, working_directory=str(tmp_path))).process()
+    calls.clear()
+    assert KodiGameAddons(make_args(
+        git=True, git_noclean=True, resume=True,
+        working_directory=str(tmp_path))).process()
+    assert ('game1', 'fetch_and_reset') in calls
+
+
+def test_kodigameaddons_skipunchanged(mocker, tmp_path, gameaddonsconfig,
+                                      gitrepomock):
+    """ Test that addons with unchanged inputs are skipped """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'upstream'}
+    args = make_args(git=True, skip_unchanged=True,
+                     working_directory=str(tmp_path))
+    assert KodiGameAddons(args).process()
+    assert ('game1', 'commit') in calls
+
+    # Only fetched to compare the checkout, and the description rewritten
+    calls.clear()
+    assert KodiGameAddons(args).process()
+    assert sorted(calls) == sorted(
+        (game, name) for game in ('game1', 'game2', 'game3')
+        for name in ('fetch', 'fetch_and_reset',
+                     'process_description_files'))
+
+    # A new upstream commit
+    calls.clear()
+    gitrepomock.list_remote.return_value = {'refs/heads/master': 'new'}
+    assert KodiGameAddons(args).process()
+    assert ('game1', 'commit') in calls
+
+    # No telling whether upstream changed
+    calls.clear()
+    gitrepomock.list_remote.return_value = None
+    assert KodiGameAddons(args).process()
+    assert ('game1', 'commit') in calls
+    calls.clear()
+    assert KodiGameAddons(args).process()
+    assert ('game1', 'commit') in calls
+
+
+def test_kodigameaddons_trace(mocker, tmp_path, gameaddonsconfig):
+    """ Test that the time of every stage of every addon is traced """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    tracer = tracing.Tracer()
+    mocker.patch.object(tracing, 'TRACER', tracer)
+    tracer.enable()
+    assert KodiGameAddons(make_args(
+        jobs=2, git=True, working_directory=str(tmp_path))).process()
+    assert {addon: sorted(stages) for addon, stages
+            in tracer.summary()['addons'].items()} == {
+                'game.libretro.{}'.format(game): [
+                    'commit', 'fetch', 'makefiles', 'metadata', 'version']
+                for game in ('game1', 'game2', 'game3')}
+
+
+def test_kodigameaddons_profilestage(mocker, tmp_path, gameaddonsconfig):
+    """ Test profiling a stage of every addon """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    assert KodiGameAddons(make_args(
+        jobs=2, profile_stage='makefiles',
+        working_directory=str(tmp_path))).process()
+    directory = os.path.join(str(tmp_path), 'profiles')
+    assert sorted(os.listdir(os.path.join(directory, 'makefiles'))) == [
+        'game.libretro.{}.pstats'.format(game)
+        for game in ('game1', 'game2', 'game3')]
+    assert os.path.isfile(os.path.join(directory, 'makefiles.pstats'))
+
+
+def test_kodigameaddons_plan(mocker, tmp_path, gameaddonsconfig,
+                             githuborgmock, capsys):
+    """ Test that planning only renders and reports the changes """
+    # pylint: disable=unused-argument,too-many-arguments
+    calls = []
+    mock_addons(mocker, calls)
+    mocker.patch.object(KodiGameAddon, 'planned_changes', side_effect=[
+        [Change('game.libretro.game1/addon.xml', 'changed', '-old\n+new\n'),
+         Change('game.libretro.game1/new', 'added', '+new\n')],
+        [], []])
+    gameaddons = KodiGameAddons(make_args(
+        plan=True, git=True, compile=True, push_branch='master',
+        working_directory=str(tmp_path)))
+    assert gameaddons.process()
+
+    assert not githuborgmock.return_value.create_repo.called
+    assert not os.listdir(str(tmp_path))
+    for name in ('fetch', 'fetch_and_reset', 'commit', 'push', 'tag'):
+        assert name not in [name for _, name in calls]
+    assert ('game3', 'load_library_file') in calls
+    output = capsys.readouterr().out
+    assert 'game.libretro.game1:\n' \
+        '  C game.libretro.game1/addon.xml\n' \
+        '  A game.libretro.game1/new\n' \
+        '-old\n+new\n+new\n' in output
+    assert 'game.libretro.game2: unchanged\n' in output
+    assert 'Plan: 1 of 3 addons change, 1 files added, 1 changed, ' \
+        '0 removed' in output
+
+
+def test_kodigameaddons_plannewaddon(mocker, tmp_path, gameaddonsconfig,
+                                     githuborgmock):
+    """ Test that planning new addons leaves the working directory alone """
+    # pylint: disable=unused-argument
+    load_game_version = KodiGameAddon.load_game_version
+    mock_addons(mocker, [])
+    mocker.patch.object(KodiGameAddon, 'load_game_version', load_game_version)
+    mocker.patch.object(KodiGameAddon, 'planned_changes', return_value=[])
+    mocker.patch('kodi_game_scripting.process_game_addons.GitRepo', GitRepo)
+    githuborgmock.return_value.get_repos.return_value = {}
+    gameaddons = KodiGameAddons(make_args(
+        plan=True, git=True, push_branch='master',
+        working_directory=str(tmp_path)))
+    assert gameaddons.process()
+
+    assert not os.listdir(str(tmp_path))
+    assert gameaddons.get_results()['game.libretro.game1']['info']['game'][
+        'version'].endswith('.0')
+
+
+def test_kodigameaddons_shard(mocker, tmp_path, gameaddonsconfig):
+    """ Test processing a shard and reporting its results """
+    # pylint: disable=unused-argument
+    calls = []
+    mock_addons(mocker, calls)
+    shards = []
+    for index in (1, 2):
+        gameaddons = KodiGameAddons(make_args(
+            shard=(index, 2), working_directory=str(tmp_path)))
+        assert gameaddons.process()
+        shards.append(gameaddons.get_results())
+
+    assert sorted(shards[0]) == ['game.libretro.game1', 'game.libretro.game3']
+    assert sorted(shards[1]) == ['game.libretro.game2']
+    assert shards[1]['game.libretro.game2']['status'] == 'done'
+    assert shards[1]['game.libretro.game2']['info']['game']['name'] == 'game2'
+    assert sorted({game for game, _ in calls}) == ['game1', 'game2', 'game3']
+
+
+def test_kodigameaddons_shardresults(mocker, tmp_path, gameaddonsconfig):
+    """ Test the status of addons that failed or didn't get to run """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    mocker.patch.object(KodiGameAddon, 'load_addon_xml',
+                        side_effect=[None, ValueError()])
+    gameaddons = KodiGameAddons(make_args(working_directory=str(tmp_path)))
+    assert not gameaddons.process()
+    assert {name: result['status'] for name, result
+            in gameaddons.get_results().items()} == {
+                'game.libretro.game1': 'done',
+                'game.libretro.game2': 'failed',
+                'game.libretro.game3': 'skipped'}
+
+
+def test_kodigameaddons_summaryrecords(mocker, tmp_path, gameaddonsconfig,
+                                       templateprocessormock):
+    """ Test that a filtered run's summary includes the other addons """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    assert KodiGameAddons(make_args(
+        working_directory=str(tmp_path))).process()
+    gameaddons = KodiGameAddons(make_args(
+        filter='game2', working_directory=str(tmp_path)))
+    gameaddons._addons[0].info['game']['version'] = '2.0.0.0'  # pylint: disable=protected-access
+    gameaddons.summary()
+
+    (_, _, template_vars), _ = templateprocessormock.process.call_args
+    assert [(addon['game']['name'], addon['game']['version'])
+            for addon in template_vars['addons']] == [
+                ('game1', '0.0.0'), ('game2', '2.0.0.0'), ('game3', '0.0.0')]
+
+
+def test_kodigameaddons_resultsjsonl(mocker, tmp_path, gameaddonsconfig):
+    """ Test streaming the result of every stage """
+    # pylint: disable=unused-argument
+    mock_addons(mocker, [])
+    mocker.patch.object(KodiGameAddon, 'load_info_file',
+                        side_effect=[None, None, ValueError('broken')])
+    path = str(tmp_path / 'results.jsonl')
+    assert not KodiGameAddons(make_args(
+        results_jsonl=path, working_directory=str(tmp_path))).process()
+
+    with open(path, encoding='utf-8') as results:
+        lines = [json.loads(line) for line in results]
+    assert [(line['addon'], line['stage'], line['status'])
+            for line in lines] == [
+                ('game.libretro.game1', 'makefiles', 'done'),
+                ('game.libretro.game1', 'metadata', 'done'),
+                ('game.libretro.game2', 'makefiles', 'done'),
+                ('game.libretro.game2', 'metadata', 'done'),
+                ('game.libretro.game3', 'makefiles', 'done'),
+                ('game.libretro.game3', 'metadata', 'failed')]
+    assert lines[-1]['error'] == 'broken'
@@ -0,0 +1,92 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test profiling stages """
+
+import os
+import pstats
+import subprocess
+import sys
+
+import pytest
+
+from kodi_game_scripting import profiling
+
+pytestmark = [pytest.mark.unit]
+
+HELPER = '''
+import os
+from kodi_game_scripting import profiling
+
+def helper_function():
+    return sum(range(100))
+
+with profiling.profile_to(os.environ.get(profiling.PROFILE_ENV)):
+    helper_function()
+'''
+
+
+def profiled_function():
+    """ Function to profile """
+    return sum(range(100))
+
+
+def function_names(path):
+    """ Names of the functions in a profile """
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+
+def test_stageprofiler(tmp_path):
+    """ Test writing a profile per addon and the aggregated profile """
+    profiler = profiling.StageProfiler(str(tmp_path), 'makefiles')
+    assert profiler.write_aggregate() is None
+    profiler.run('first', profiled_function)
+    with pytest.raises(ZeroDivisionError):
+        profiler.run('second', lambda: 1 / 0)
+
+    directory = os.path.join(str(tmp_path), 'profiles')
+    assert 'profiled_function' in function_names(
+        os.path.join(directory, 'makefiles', 'first.pstats'))
+    assert os.path.isfile(os.path.join(directory, 'makefiles',
+                                       'second.pstats'))
+    assert profiler.write_aggregate() == os.path.join(directory,
+                                                      'makefiles.pstats')
+    assert 'profiled_function' in function_names(
+        os.path.join(directory, 'makefiles.pstats'))
+
+
+def test_stageprofiler_child(tmp_path):
+    """ Test adding the profile of a helper process """
+    def stage():
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+            os.path.abspath(profiling.__file__)))
+        with profiling.child_profile(environment):
+            subprocess.run([sys.executable, '-c', HELPER], env=environment,
+                           check=True)
+
+    profiler = profiling.StageProfiler(str(tmp_path), 'metadata')
+    profiler.run('addon', stage)
+    assert 'helper_function' in function_names(os.path.join(
+        str(tmp_path), 'profiles', 'metadata', 'addon.pstats'))
+
+
+def test_childprofile_notprofiled():
+    """ Test that helpers aren't profiled outside of a profiled stage """
+    environment = {}
+    with profiling.child_profile(environment):
+        pass
+    assert not environment
@@ -0,0 +1,108 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test addon records and merging summaries """
+
+import os
+
+import pytest
+
+from kodi_game_scripting import records, utils
+from kodi_game_scripting.merge_summary import merge_summary
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture(autouse=True)
+def configmock(mocker):
+    """ Configure two addons """
+    return mocker.patch.dict('kodi_game_scripting.config.ADDONS', {
+        'game1': (), 'game2': ()}, clear=True)
+
+
+def info(name, version='1.0.0.0'):
+    """ Metadata of an addon """
+    return {'game': {'name': name, 'addon': 'game.libretro.{}'.format(name),
+                     'version': version},
+            'libretro_info': {'license': 'GPLv2'}, 'system_info': {},
+            'library': {}, 'assets': {}, 'git': {}}
+
+
+def test_recordstore(tmp_path):
+    """ Test saving and loading records """
+    store = records.RecordStore(str(tmp_path))
+    assert not store.load()
+    store.save('game.libretro.game1', info('game1'))
+    loaded = records.RecordStore(str(tmp_path)).load()
+    assert list(loaded) == ['game.libretro.game1']
+    assert loaded['game.libretro.game1']['info'] == info('game1')
+    assert loaded['game.libretro.game1']['updated'] > 0
+
+
+def test_readrecords_shard(tmp_path):
+    """ Test reading the records of a shard result """
+    path = os.path.join(str(tmp_path), 'shard-1-of-2.json')
+    utils.write_json(path, {'shard': [1, 2], 'succeeded': False, 'addons': {
+        'game.libretro.game1': {'status': 'done', 'updated': 1,
+                                'info': info('game1')},
+        'game.libretro.game2': {'status': 'failed', 'updated': 1,
+                                'info': info('game2')}}})
+    assert records.read_records(path) == {
+        'game.libretro.game1': {'updated': 1, 'info': info('game1')}}
+
+    with pytest.raises(ValueError):
+        records.read_records(os.path.join(str(tmp_path), 'missing.json'))
+
+
+def test_merge():
+    """ Test that the latest record of each addon wins """
+    assert records.merge(
+        {'a': {'updated': 2, 'info': 'a2'}, 'b': {'updated': 1, 'info': 'b1'}},
+        {'a': {'updated': 1, 'info': 'a1'}, 'c': {'updated': 1, 'info': 'c1'}},
+        {'b': {'updated': 3, 'info': 'b3'}}) == {
+            'a': {'updated': 2, 'info': 'a2'},
+            'b': {'updated': 3, 'info': 'b3'},
+            'c': {'updated': 1, 'info': 'c1'}}
+
+
+def test_summaryaddons():
+    """ Test ordering by game name and leaving out removed addons """
+    assert records.summary_addons({
+        'game.libretro.game2': {'info': info('game2')},
+        'game.libretro.gone': {'info': info('gone')},
+        'game.libretro.game1': {'info': info('game1')}}) == [
+            info('game1'), info('game2')]
+
+
+def test_mergesummary(tmp_path):
+    """ Test rendering the summary from a working directory and a shard """
+    working_directory = os.path.join(str(tmp_path), 'run')
+    records.RecordStore(working_directory).save(
+        'game.libretro.game1', info('game1', '1.0.0.1'))
+    shard = os.path.join(str(tmp_path), 'shard.json')
+    utils.write_json(shard, {'addons': {
+        'game.libretro.game2': {'status': 'done', 'updated': 1,
+                                'info': info('game2', '2.0.0.2')}}})
+
+    output = os.path.join(str(tmp_path), 'output')
+    addons = merge_summary([working_directory, shard], output)
+    assert [addon['game']['name'] for addon in addons] == ['game1', 'game2']
+    with open(os.path.join(output, 'wiki.txt'), encoding='utf-8') as wiki:
+        content = wiki.read()
+    assert '| Version= 1.0.0.1' in content
+    assert '| Version= 2.0.0.2' in content
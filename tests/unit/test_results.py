@@ -0,0 +1,64 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test streaming results """
+
+import json
+
+import pytest
+
+from kodi_game_scripting.results import ResultsLog
+
+pytestmark = [pytest.mark.unit]
+
+
+def read_lines(path):
+    """ Read a JSON lines file """
+    with open(path, encoding='utf-8') as lines_ctx:
+        return [json.loads(line) for line in lines_ctx]
+
+
+def test_resultslog(tmp_path):
+    """ Test that every result is on disk as soon as it's written """
+    path = str(tmp_path / 'results.jsonl')
+    info = {
+        'game': {'version': '1.2.3.4'},
+        'library': {'loaded': True},
+        'settings': [{}, {}],
+        'git': {'diff': 'diff'},
+    }
+    with ResultsLog(path) as results:
+        results.write('addon', 'metadata', info)
+        line, = read_lines(path)
+        assert line.pop('time')
+        assert line == {
+            'addon': 'addon', 'stage': 'metadata', 'status': 'done',
+            'version': '1.2.3.4', 'library_loaded': True, 'options': 2,
+            'error': None, 'diff': True,
+        }
+
+        results.write('addon', 'build', {}, ValueError('failed'))
+        line = read_lines(path)[1]
+        assert (line['status'], line['error'], line['diff']) == \
+            ('failed', 'failed', False)
+
+    # Appends to what's there, and a library error doesn't fail the stage
+    with ResultsLog(path) as results:
+        results.write('addon', 'metadata',
+                      {'library': {'error': OSError('missing')}})
+    line = read_lines(path)[2]
+    assert (line['status'], line['error'], line['library_loaded']) == \
+        ('done', 'missing', False)
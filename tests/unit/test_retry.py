@@ -0,0 +1,160 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test retrying and pacing """
+
+from unittest import mock
+
+import git
+import github
+import pytest
+import requests
+
+from kodi_game_scripting import retry
+from kodi_game_scripting.retry import RetryPolicy
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+NETWORK_ERROR = git.exc.GitCommandError(
+    'git fetch', 128, stderr="fatal: unable to access 'https://github.com/"
+    "org/repo/': Could not resolve host: github.com")
+
+
+@pytest.fixture
+def clock(mocker):
+    """ A clock that sleeping advances, returns the sleeps """
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    mocker.patch('kodi_game_scripting.retry.time.monotonic',
+                 side_effect=lambda: now[0])
+    mocker.patch('kodi_game_scripting.retry.time.sleep', side_effect=sleep)
+    mocker.patch('kodi_game_scripting.retry.random.uniform',
+                 side_effect=lambda low, high: high)
+    return sleeps
+
+
+@pytest.mark.parametrize('err,transient', [
+    (NETWORK_ERROR, True),
+    (git.exc.GitCommandError('git push', 1, stderr="error: failed to push "
+                             "some refs (non-fast-forward)"), False),
+    (git.exc.GitCommandError('git fetch', 128, stderr="fatal: couldn't "
+                             "find remote ref master"), False),
+    (github.GithubException(502, 'Bad Gateway'), True),
+    (github.GithubException(404, 'Not Found'), False),
+    (github.GithubException(
+        403, {'message': 'You have exceeded a secondary rate limit'}), True),
+    (github.RateLimitExceededException(403, 'API rate limit exceeded'),
+     True),
+    (github.BadCredentialsException(401, 'Bad credentials'), False),
+    (requests.ConnectionError('reset'), True),
+    (ValueError('dirty'), False),
+])
+def test_istransient(err, transient):
+    """ Test telling network failures from others """
+    assert retry.is_transient(err) == transient
+
+
+def test_getrequesteddelay():
+    """ Test reading how long GitHub asks to wait """
+    def err(headers):
+        return github.GithubException(403, 'limited', headers)
+    assert retry.get_requested_delay(err({'Retry-After': '30'})) == 30
+    assert retry.get_requested_delay(err({
+        'retry-after': 'Thu, 01 Jan 1970 00:01:40 GMT'}), now=70) == 30
+    assert retry.get_requested_delay(err({
+        'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '100'}),
+                                     now=70) == 30
+    assert retry.get_requested_delay(err({
+        'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '1000000'}),
+                                     now=0) == retry.MAX_RATE_LIMIT_WAIT
+    assert retry.get_requested_delay(err({
+        'x-ratelimit-remaining': '10', 'x-ratelimit-reset': '100'})) is None
+    assert retry.get_requested_delay(NETWORK_ERROR) is None
+
+
+def test_retrypolicy_call(clock, capsys):
+    """ Test backing off exponentially until the call succeeds """
+    func = mock.MagicMock(side_effect=[NETWORK_ERROR, NETWORK_ERROR, 'ok'])
+    assert RetryPolicy(attempts=3).call('Fetching', func, 'a', b=1) == 'ok'
+    assert func.call_args_list == [mock.call('a', b=1)] * 3
+    assert clock == [1.0, 2.0]
+    output = capsys.readouterr().out
+    assert "Fetching failed, retrying in 1.0s (1/2): stderr: " in output
+    assert "Could not resolve host: github.com'" in output
+
+
+def test_retrypolicy_giveup(clock):
+    """ Test that the last failure is raised once the attempts are used """
+    func = mock.MagicMock(side_effect=NETWORK_ERROR)
+    with pytest.raises(git.exc.GitCommandError):
+        RetryPolicy(attempts=3).call('Fetching', func)
+    assert func.call_count == 3
+    assert len(clock) == 2
+
+
+def test_retrypolicy_permanent(clock):
+    """ Test that failures that aren't transient aren't retried """
+    func = mock.MagicMock(side_effect=ValueError)
+    with pytest.raises(ValueError):
+        RetryPolicy().call('Pushing', func)
+    assert func.call_count == 1
+    assert not clock
+
+
+def test_retrypolicy_requesteddelay(clock):
+    """ Test waiting as long as GitHub asked for """
+    func = mock.MagicMock(side_effect=[github.GithubException(
+        429, 'Too many requests', {'Retry-After': '42'}), 'ok'])
+    assert RetryPolicy().call('Query', func) == 'ok'
+    assert clock == [42 + retry.BASE_DELAY]
+
+
+def test_retrypolicy_pacing(clock):
+    """ Test that paced calls spread out after failures, and close up again
+        while they succeed """
+    policy = RetryPolicy()
+    push = mock.MagicMock(return_value=None)
+    policy.call('Pushing', push, paced=True)
+    policy.call('Pushing', push, paced=True)
+    assert not clock
+
+    push.side_effect = [NETWORK_ERROR, NETWORK_ERROR, None]
+    policy.call('Pushing', push, paced=True)
+    # Backing off holds up the retry already
+    assert clock == [1.0, 2.0]
+
+    push.side_effect = None
+    del clock[:]
+    for _ in range(4):
+        policy.call('Pushing', push, paced=True)
+    # The gap widened to 2s, and halves with every success
+    assert clock == [2.0, 1.0, 0.5, 0.25]
+
+
+def test_retrypolicy_shared():
+    """ Test sharing and configuring the policy of the process """
+    assert RetryPolicy.shared() is RetryPolicy.shared()
+    RetryPolicy.configure(attempts=2)
+    assert RetryPolicy.shared().attempts == 2
+    RetryPolicy.configure()
+    assert RetryPolicy.shared().attempts == retry.DEFAULT_ATTEMPTS
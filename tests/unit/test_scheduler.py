@@ -0,0 +1,181 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test TaskGraph """
+
+import threading
+
+import pytest
+
+from kodi_game_scripting import scheduler
+from kodi_game_scripting.scheduler import JobBudget, TaskGraph
+
+pytestmark = [pytest.mark.unit]
+
+
+def fail():
+    """ A task that fails """
+    raise ValueError("failed")
+
+
+def test_taskgraph_order():
+    """ Test that a single job runs tasks in the order they were added """
+    calls = []
+    graph = TaskGraph()
+    graph.add('a1', lambda: calls.append('a1'))
+    graph.add('a2', lambda: calls.append('a2'), requires=['a1'])
+    graph.add('b1', lambda: calls.append('b1'))
+    graph.add('b2', lambda: calls.append('b2'), requires=['b1'])
+    assert graph.run()
+    assert calls == ['a1', 'a2', 'b1', 'b2']
+
+
+def test_taskgraph_priority():
+    """ Test that higher priorities start first """
+    calls = []
+    graph = TaskGraph()
+    graph.add('low', lambda: calls.append('low'))
+    graph.add('high', lambda: calls.append('high'), priority=1)
+    assert graph.run()
+    assert calls == ['high', 'low']
+
+
+def test_taskgraph_unknowndependency():
+    """ Test that dependencies must be added first """
+    graph = TaskGraph()
+    with pytest.raises(ValueError):
+        graph.add('a', lambda: None, requires=['b'])
+    graph.add('a', lambda: None)
+    with pytest.raises(ValueError):
+        graph.add('a', lambda: None)
+
+
+def test_taskgraph_nobarrier():
+    """ Test that a chain doesn't wait for a slow task of another chain """
+    slow_started = threading.Event()
+    fast_done = threading.Event()
+    graph = TaskGraph()
+    graph.add(('slow', 1), lambda: (slow_started.set(), fast_done.wait(5)))
+    graph.add(('slow', 2), lambda: None, requires=[('slow', 1)])
+    graph.add(('fast', 1), slow_started.wait)
+    graph.add(('fast', 2), fast_done.set, requires=[('fast', 1)])
+    assert graph.run(jobs=2)
+    assert fast_done.is_set()
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_taskgraph_failure(jobs):
+    """ Test that a failure only skips the tasks that require it """
+    calls = []
+    graph = TaskGraph()
+    graph.add('a1', fail)
+    graph.add('a2', lambda: calls.append('a2'), requires=['a1'])
+    graph.add('b1', lambda: calls.append('b1'))
+    graph.add('c1', lambda: calls.append('c1'), after=['a2'])
+    assert not graph.run(jobs)
+    assert sorted(calls) == ['b1', 'c1']
+    assert graph.status == {'a1': scheduler.FAILED, 'a2': scheduler.SKIPPED,
+                            'b1': scheduler.DONE, 'c1': scheduler.DONE}
+
+
+def test_taskgraph_failfast():
+    """ Test that nothing new starts after a failure with fail_fast """
+    calls = []
+    graph = TaskGraph()
+    graph.add('a1', fail)
+    graph.add('b1', lambda: calls.append('b1'))
+    assert not graph.run(fail_fast=True)
+    assert not calls
+    assert graph.status['b1'] == scheduler.SKIPPED
+
+
+def test_taskgraph_failfastisolated():
+    """ Test that an isolated failure doesn't end a fail_fast run """
+    calls = []
+    graph = TaskGraph()
+    graph.add('a1', fail, isolated=True)
+    graph.add('a2', lambda: calls.append('a2'), requires=['a1'])
+    graph.add('b1', lambda: calls.append('b1'))
+    graph.add('c1', fail)
+    graph.add('d1', lambda: calls.append('d1'))
+    assert not graph.run(fail_fast=True)
+    assert calls == ['b1']
+    assert graph.status == {'a1': scheduler.FAILED, 'a2': scheduler.SKIPPED,
+                            'b1': scheduler.DONE, 'c1': scheduler.FAILED,
+                            'd1': scheduler.SKIPPED}
+
+
+def test_jobbudget_share():
+    """ Test splitting a budget between tasks """
+    budget = JobBudget(8)
+    assert budget.share(3) == 2
+    assert budget.share(16) == 1
+    assert budget.share(0) == 8
+    assert JobBudget(0).total == 1
+
+
+def test_jobbudget_acquire():
+    """ Test that a task waits until enough jobs are left """
+    budget = JobBudget(4)
+    acquired = threading.Event()
+
+    def take():
+        with budget.acquire(2) as count:
+            assert count == 2
+            acquired.set()
+
+    with budget.acquire(3) as count:
+        assert count == 3
+        thread = threading.Thread(target=take)
+        thread.start()
+        assert not acquired.wait(0.1)
+    thread.join(5)
+    assert acquired.is_set()
+    with budget.acquire(10) as count:
+        assert count == 4
+
+
+def test_taskgraph_output(capsys):
+    """ Test that the output of a task is printed in one piece """
+    graph = TaskGraph()
+    graph.add('a', lambda: (print('a1'), print('a2')))
+    graph.add('b', fail)
+    graph.run(jobs=2)
+    output = capsys.readouterr().out
+    assert 'a1\na2\n' in output
+    assert 'ValueError: failed' in output
+    assert 'Failed b: failed' in output
+
+
+def test_jobbudget_memory():
+    """ Test that jobs only take the memory the budget has left """
+    budget = JobBudget(8, memory=1000)
+    acquired = threading.Event()
+
+    def take():
+        with budget.acquire(4, memory_per_job=100) as count:
+            assert count == 4
+            acquired.set()
+
+    with budget.acquire(8, memory_per_job=300) as count:
+        assert count == 3
+        thread = threading.Thread(target=take)
+        thread.start()
+        assert not acquired.wait(0.1)
+    thread.join(5)
+    assert acquired.is_set()
+    with budget.acquire(2, memory_per_job=5000) as count:
+        assert count == 1
@@ -0,0 +1,77 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test sharding """
+
+import argparse
+import os
+
+import pytest
+
+from kodi_game_scripting import sharding, utils
+
+pytestmark = [pytest.mark.unit]
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('1/1', (1, 1)), ('2/4', (2, 4)), ('4/4', (4, 4))])
+def test_parseshard(value, expected):
+    """ Test parsing I/N """
+    assert sharding.parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '1', '1/2/3', 'a/2', '0/2', '3/2'])
+def test_parseshard_invalid(value):
+    """ Test rejecting invalid shards """
+    with pytest.raises(argparse.ArgumentTypeError):
+        sharding.parse_shard(value)
+
+
+def test_partition():
+    """ Test that shards are disjoint, complete and take turns """
+    names = ['a', 'b', 'c', 'd', 'e']
+    assert sharding.partition(names, 2) == [['a', 'c', 'e'], ['b', 'd']]
+    assert sharding.partition(list(reversed(names)), 2) == \
+        sharding.partition(names, 2)
+    assert sharding.partition(names, 7)[5:] == [[], []]
+    assert sorted(name for shard in sharding.partition(names, 3)
+                  for name in shard) == names
+
+
+def test_partition_weights():
+    """ Test balancing shards by weight """
+    weights = {'a': 10, 'b': 6, 'c': 5, 'd': 1}
+    assert sharding.partition(list(weights), 2, weights) == [
+        ['a', 'd'], ['b', 'c']]
+    # Unknown names cost the average
+    assert sharding.partition(['a', 'b', 'e', 'f'], 2, {'a': 5, 'b': 1}) == [
+        ['a', 'b'], ['e', 'f']]
+    assert sharding.partition(['a', 'b', 'c', 'd', 'e'], 2, {
+        'a': 9, 'b': 1, 'c': 1, 'd': 1}) == [['a'], ['b', 'c', 'd', 'e']]
+
+
+def test_loadweights(tmp_path):
+    """ Test loading weights from a dict or a trace """
+    path = os.path.join(str(tmp_path), 'weights.json')
+    utils.write_json(path, {'a': 1, 'b': 2.5})
+    assert sharding.load_weights(path) == {'a': 1.0, 'b': 2.5}
+
+    utils.write_json(path, {'traceEvents': [], 'summary': {
+        'addons': {'a': {'build': 2, 'fetch': 1}}}})
+    assert sharding.load_weights(path) == {'a': 3}
+
+    with pytest.raises(ValueError):
+        sharding.load_weights(os.path.join(str(tmp_path), 'missing.json'))
@@ -18,7 +18,8 @@
 
 import pytest
 
-from kodi_game_scripting.template_processor import get_list, regex_replace
+from kodi_game_scripting.template_processor import (
+    ADDED, CHANGED, REMOVED, TemplateProcessor, get_list, regex_replace)
 
 pytestmark = [pytest.mark.unit]
 
@@ -43,3 +44,34 @@ def test_regexreplace_multiline():
     """ Test the regex_replace filter with a multiline string """
     assert regex_replace(
         'a\nbb\nc', r'(b+)\n', '', multiline=True) == 'a\nc'
+
+
+def test_compare(tmp_path):
+    """ Test comparing a rendered tree to the files on disk """
+    (tmp_path / 'same').write_text('same\n')
+    (tmp_path / 'changed').write_text('old\n')
+    (tmp_path / 'removed').write_text('removed\n')
+    changes = TemplateProcessor.compare(str(tmp_path), {
+        'same': 'same\n', 'changed': 'new\n', 'removed': None,
+        'dir/added': b'added', 'never': None}, prefix='addon')
+
+    assert [(change.path, change.action) for change in changes] == [
+        ('addon/changed', CHANGED), ('addon/dir/added', ADDED),
+        ('addon/removed', REMOVED)]
+    assert changes[0].diff == (
+        '--- a/addon/changed\n+++ b/addon/changed\n'
+        '@@ -1 +1 @@\n-old\n+new\n')
+    assert changes[1].diff.startswith('--- /dev/null\n+++ b/addon/dir/added')
+    assert changes[1].diff.endswith('+added\n\\ No newline at end of file\n')
+    assert changes[2].diff.startswith('--- a/addon/removed\n+++ /dev/null')
+
+
+def test_write(tmp_path):
+    """ Test writing a rendered tree """
+    (tmp_path / 'removed').write_text('removed')
+    TemplateProcessor.write(str(tmp_path), {
+        'text': 'text', 'dir/binary': b'\0', 'removed': None, 'never': None})
+    assert (tmp_path / 'text').read_text() == 'text'
+    assert (tmp_path / 'dir' / 'binary').read_bytes() == b'\0'
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'dir', 'text']
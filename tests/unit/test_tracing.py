@@ -0,0 +1,143 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test timing spans """
+
+import json
+import threading
+
+import pytest
+
+from kodi_game_scripting import tracing
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+@pytest.fixture
+def tracer():
+    """ An enabled tracer """
+    tracer = tracing.Tracer()
+    tracer.enable()
+    return tracer
+
+
+def test_tracer_disabled():
+    """ Test that nothing is recorded until the tracer is enabled """
+    tracer = tracing.Tracer()
+    with tracer.span('stage', tracing.STAGE, addon='addon'):
+        pass
+    assert not tracer.events
+
+
+def test_tracer_span(tracer):
+    """ Test that nested spans belong to the addon of the outer span """
+    with tracer.span('build', tracing.STAGE, addon='addon'):
+        assert tracer.current_addon() == 'addon'
+        with tracer.span('commit', tracing.GIT):
+            pass
+    assert tracer.current_addon() is None
+
+    inner, outer = tracer.events
+    assert (inner['name'], inner['category'], inner['addon']) == \
+        ('commit', tracing.GIT, 'addon')
+    assert (outer['name'], outer['category'], outer['addon']) == \
+        ('build', tracing.STAGE, 'addon')
+    assert outer['start'] <= inner['start']
+    assert outer['duration'] >= inner['duration']
+
+
+def test_tracer_spanerror(tracer):
+    """ Test that a span is recorded when its body raises """
+    with pytest.raises(ValueError):
+        with tracer.span('build', tracing.STAGE, addon='addon'):
+            raise ValueError()
+    assert len(tracer.events) == 1
+    assert tracer.current_addon() is None
+
+
+def test_tracer_threads(tracer):
+    """ Test that threads work on addons of their own """
+    def work(addon):
+        with tracer.span('build', tracing.STAGE, addon=addon):
+            with tracer.span('commit', tracing.GIT):
+                pass
+
+    threads = [threading.Thread(target=work, args=(addon,), name=addon)
+               for addon in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for event in tracer.events:
+        assert event['addon'] == event['thread']
+
+
+def test_tracer_summary(mocker):
+    """ Test adding up the time per addon, stage and category """
+    mocker.patch('time.perf_counter', side_effect=[0, 0, 1, 2, 3, 5, 5, 7])
+    tracer = tracing.Tracer()
+    tracer.enable()
+    with tracer.span('build', tracing.STAGE, addon='addon'):
+        with tracer.span('commit', tracing.GIT):
+            pass
+    with tracer.span('build', tracing.STAGE, addon='addon'):
+        pass
+    assert tracer.summary() == {
+        'addons': {'addon': {'build': 6}},
+        'categories': {tracing.STAGE: 6, tracing.GIT: 1},
+        'wall_time': 7,
+    }
+
+
+def test_tracer_write(tracer, tmp_path):
+    """ Test writing the summary and Chrome trace events """
+    with tracer.span('build', tracing.STAGE, addon='addon'):
+        pass
+    with tracer.span('summary', tracing.STAGE):
+        pass
+    tracer.write(str(tmp_path / 'trace.json'))
+
+    with open(str(tmp_path / 'trace.json'), encoding='utf-8') as trace_ctx:
+        trace = json.load(trace_ctx)
+    assert trace['summary']['addons'] == {
+        'addon': {'build': pytest.approx(trace['summary']['wall_time'],
+                                         abs=1)}}
+    metadata, build, summary = trace['traceEvents']
+    assert metadata['ph'] == 'M'
+    assert metadata['args'] == {'name': threading.current_thread().name}
+    assert (build['name'], build['cat'], build['ph'], build['args']) == \
+        ('build', tracing.STAGE, 'X', {'addon': 'addon'})
+    assert summary['args'] == {}
+    assert build['tid'] == summary['tid'] == metadata['tid']
+    assert build['ts'] <= summary['ts']
+
+
+def test_traced(mocker, tracer):
+    """ Test timing calls of a decorated function """
+    mocker.patch.object(tracing, 'TRACER', tracer)
+
+    @tracing.traced(tracing.GIT)
+    def function(value):
+        """ Function to trace """
+        return value
+
+    assert function(42) == 42
+    assert function.__doc__ == " Function to trace "
+    event, = tracer.events
+    assert event['category'] == tracing.GIT
+    assert event['name'].endswith('function')
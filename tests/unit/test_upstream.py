@@ -0,0 +1,75 @@
+# Copyright (C) 2016-2018 Christian Fetzer
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Test the mirrors of shared upstream repositories """
+
+import os
+
+import git
+import pytest
+
+from kodi_game_scripting.upstream import SharedSources
+
+pytestmark = [pytest.mark.unit]
+
+
+# pylint: disable=redefined-outer-name
+
+REPOS = [('libretro', 'vice'), ('libretro', 'vice'), ('libretro', 'mgba')]
+
+
+@pytest.fixture
+def mirrormock(mocker):
+    """ Setup mocked GitRepo.mirror """
+    return mocker.patch('kodi_game_scripting.upstream.GitRepo.mirror')
+
+
+def test_sharedsources_shared(tmp_path):
+    """ Test that only repositories used by several addons are shared """
+    sources = SharedSources(str(tmp_path), REPOS)
+    assert sources.shared == {('libretro', 'vice')}
+    assert sources.get_path(('libretro', 'vice')) == os.path.join(
+        str(tmp_path), 'libretro', 'vice.git')
+
+
+def test_sharedsources_mirrorall(tmp_path, mirrormock):
+    """ Test mirroring every repository from another remote """
+    sources = SharedSources(str(tmp_path), REPOS, mirror_all=True,
+                            remote='file:///srv/git/')
+    assert sources.shared == {('libretro', 'vice'), ('libretro', 'mgba')}
+    path = sources.get_path(('libretro', 'mgba'))
+    assert sources.get_url(('libretro', 'mgba')) == path
+    mirrormock.assert_called_once_with('file:///srv/git/libretro/mgba', path)
+
+
+def test_sharedsources_geturl(tmp_path, mirrormock):
+    """ Test that a shared repository is mirrored once """
+    sources = SharedSources(str(tmp_path), REPOS)
+    path = sources.get_path(('libretro', 'vice'))
+    assert sources.get_url(('libretro', 'vice')) == path
+    assert sources.get_url(('libretro', 'vice')) == path
+    assert sources.get_url(('libretro', 'mgba')) is None
+    mirrormock.assert_called_once_with('https://github.com/libretro/vice',
+                                       path)
+
+
+def test_sharedsources_geturlerror(tmp_path, mirrormock):
+    """ Test falling back to GitHub when mirroring fails """
+    mirrormock.side_effect = git.exc.GitCommandError('clone', 128)
+    sources = SharedSources(str(tmp_path), REPOS)
+    assert sources.get_url(('libretro', 'vice')) is None
+    assert sources.get_url(('libretro', 'vice')) is None
+    mirrormock.assert_called_once()
@@ -17,6 +17,9 @@
 """ Test common utility functions """
 
 import collections
+import subprocess
+import sys
+import threading
 
 from unittest import mock
 
@@ -96,3 +99,72 @@ def test_xstr():
     """Test xstr conversion"""
     assert utils.xstr(b'test') == 'test'
     assert utils.xstr(None) == ''
+
+
+def test_capturedoutput():
+    """Test that captured output stays with the thread that printed it"""
+    outputs = {}
+    barrier = threading.Barrier(2)
+
+    def work(name):
+        with utils.captured_output() as output:
+            barrier.wait()
+            print(name)
+            barrier.wait()
+        outputs[name] = output.getvalue()
+
+    stdout = sys.stdout
+    threads = [threading.Thread(target=work, args=(name,))
+               for name in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert outputs == {'first': 'first\n', 'second': 'second\n'}
+    assert sys.stdout is stdout
+
+
+def test_tojsondata():
+    """Test converting objects for json"""
+    class Info:  # pylint: disable=too-few-public-methods
+        """Object with attributes"""
+        def __init__(self):
+            self.name = 'name'
+            self.values = ('a', 'b')
+
+    assert utils.to_json_data({'info': Info(), 'error': OSError('failed'),
+                               1: None}) == {
+        'info': {'name': 'name', 'values': ['a', 'b']},
+        'error': 'failed', '1': None}
+
+
+def test_readwritejson(tmp_path):
+    """Test writing and reading back JSON files"""
+    path = str(tmp_path / 'dir' / 'file.json')
+    assert utils.read_json(path, 'default') == 'default'
+    utils.write_json(path, {'a': [1, 2]})
+    assert utils.read_json(path) == {'a': [1, 2]}
+    assert [p.name for p in (tmp_path / 'dir').iterdir()] == ['file.json']
+
+
+def test_filestate(tmp_path):
+    """Test file_state of existing and missing files"""
+    path = tmp_path / 'file'
+    assert utils.file_state(str(path)) is None
+    path.write_text('content')
+    assert utils.file_state(str(path))[0] == len('content')
+
+
+def test_runmeasured():
+    """ Test measuring the peak memory of a command """
+    peak = utils.run_measured([
+        sys.executable, '-c', 'data = bytearray(64 * 1024 * 1024)'])
+    assert peak is None or peak >= 64 * 1024 * 1024
+    with pytest.raises(subprocess.CalledProcessError):
+        utils.run_measured([sys.executable, '-c', 'raise SystemExit(3)'])
+
+
+def test_getphysicalmemory():
+    """ Test getting the size of the physical memory """
+    memory = utils.get_physical_memory()
+    assert memory is None or memory > 0